@@ -0,0 +1,24 @@
+"""
+Shared bootstrap for the benchmark scripts: import it before solar.
+
+solar.py reads its required settings at import time; placeholders are enough here. State,
+quote and telemetry files go to a scratch directory, and the profile artifact cache is off
+so benchmarks never touch the repo's cached profile.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+for _key in ("MY_BOT_TOKEN", "MY_CHAT_ID", "MY_WEATHER_API", "MY_APP_ID", "MY_APP_SECRET",
+             "MY_EMAIL", "MY_PASSWORD", "MY_DEVICE_SN", "WALLET_ADDRESS"):
+    os.environ.setdefault(_key, "bench")
+os.environ.setdefault("MY_LOCATION_LAT", "47.5")
+os.environ.setdefault("MY_LOCATION_LON", "19.04")
+SCRATCH = tempfile.mkdtemp(prefix="solar_bench_")
+for _key, _name in (("MY_QUOTE_FILE", "quote.json"), ("MY_STATE_FILE", "state.json"),
+                    ("MY_SOLARMAN_FILE", "solarman.json"), ("MY_TELEMETRY_FILE", "telemetry_history.json")):
+    os.environ.setdefault(_key, os.path.join(SCRATCH, _name))
+os.environ["MY_HISTORY_PROFILE_CACHE"] = "off"
+sys.path.insert(0, ROOT)
@@ -0,0 +1,70 @@
+"""
+Batch-evaluate evaluate_decision over synthetic snapshots and report the per-decision latency.
+
+    python benchmarks/bench_decision.py [--history-dir solarman_json] [--decisions 2000]
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+import _env
+import solar
+
+CONDITIONS = ["clear sky", "few clouds", "broken clouds", "overcast clouds", "light rain", "mist"]
+
+
+def synthetic_inputs(count: int, seed: int = 11):
+    """Snapshots spread over a year of daylight minutes; hist and the guard are built up front as the driver does."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(count):
+        day = datetime(2026, rng.randint(1, 12), rng.randint(1, 28), tzinfo=solar.budapest_tz)
+        sun_rise, sun_set = solar._sun_window(day)
+        now = day + timedelta(minutes=rng.randint(5 * 60, 19 * 60))
+        soc = rng.uniform(15.0, 100.0)
+        pv = rng.choice([0.0, 90.0, 450.0, 1200.0, 2400.0, 3600.0]) * rng.uniform(0.7, 1.1)
+        outlook = {"summary_5d": rng.choice(["solar_friendly", "mixed", "solar_weak"]),
+                   "confidence": 0.6, "clouds_today_pct": rng.choice([0, 40, 90])}
+        hist = solar._history_recommendation(now, soc, pv, sun_rise, sun_set, outlook)
+        guard = solar._compute_start_bridge_guard(now, soc, pv, sun_rise, sun_set, hist,
+                                                  solar.BATTERY_NOMINAL_V, solar.BATTERY_CAPACITY_AH)
+        last_change = now - timedelta(minutes=rng.randint(0, 120))
+        out.append(solar.DecisionInputs(
+            now, soc, pv, 0.0, rng.choice([600.0, 1500.0, 2700.0]), 0.0, 1600.0,
+            rng.choice(CONDITIONS), rng.choice(CONDITIONS), rng.choice(CONDITIONS),
+            sun_rise, sun_set, hist, guard,
+            rng.choice(["production", "stop", None]), None,
+            last_state_change_us=round(last_change.timestamp() * 1e6),
+        ))
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--history-dir", default=os.path.join(_env.ROOT, "solarman_json"))
+    parser.add_argument("--decisions", type=int, default=2000)
+    args = parser.parse_args()
+
+    solar._install_historical_profile(solar.build_historical_profile(args.history_dir))
+    inputs = synthetic_inputs(args.decisions)
+
+    for label in ("cold", "warm"):
+        timings = []
+        states = {}
+        for snap in inputs:
+            t0 = time.perf_counter()
+            decision = solar.evaluate_decision(snap)
+            timings.append((time.perf_counter() - t0) * 1e6)
+            states[decision.state] = states.get(decision.state, 0) + 1
+        timings.sort()
+        print(
+            f"{label}: {len(timings)} decisions  mean={sum(timings) / len(timings):.1f}us "
+            f"p50={timings[len(timings) // 2]:.1f}us p95={timings[int(len(timings) * 0.95)]:.1f}us "
+            f"max={timings[-1]:.1f}us  states={states}"
+        )
+
+
+if __name__ == "__main__":
+    main()
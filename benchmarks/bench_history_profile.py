@@ -0,0 +1,146 @@
+"""
+Benchmark the python and numpy build_historical_profile engines on a synthetic multi-year history.
+
+    python benchmarks/bench_history_profile.py [--years 3] [--interval 5]
+
+Writes Solarman-style exports (29-day windows overlapping by one day, like the real downloads)
+into a temporary directory and times a from-scratch build with each engine. Then reports the peak
+RSS of the cached python-engine build and of merging one re-downloaded export, each measured in a
+fresh interpreter (the deployment target is a 512 MB Raspberry Pi).
+"""
+import argparse
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import _env  # noqa: F401  (placeholder settings and sys.path for solar)
+import solar
+
+
+def write_history(history_dir: str, years: int, interval_min: int) -> int:
+    rng = random.Random(42)
+    start = datetime(2025 - years, 1, 1)
+    end = datetime(2025, 1, 1)
+    rows = 0
+    window_start = start
+    while window_start < end:
+        window_end = min(end, window_start + timedelta(days=29))
+        payload = []
+        ts = window_start
+        while ts < window_end:
+            sun = math.sin(math.pi * (ts.hour + ts.minute / 60.0 - 6.0) / 12.0)
+            season = 0.6 + 0.4 * math.sin(math.pi * (ts.timetuple().tm_yday - 80) / 183.0)
+            prod = max(0.0, 3500.0 * sun * season * rng.uniform(0.3, 1.0)) if sun > 0 else 0.0
+            payload.append({
+                "Updated Time": ts.strftime("%Y/%m/%d %H:%M"),
+                "Time Zone": "UTC+01:00",
+                "Production Power(W)": f"{prod:.2f}" if prod else "",
+                "SoC(%)": f"{rng.uniform(20.0, 100.0):.2f}",
+            })
+            ts += timedelta(minutes=interval_min)
+        name = f"{window_start:%Y-%m-%d}_{window_end:%Y-%m-%d}.json"
+        with open(os.path.join(history_dir, name), "w", encoding="utf-8") as fh:
+            json.dump(payload, fh)
+        rows += len(payload)
+        if window_end >= end:
+            break
+        window_start = window_end - timedelta(days=1)
+    return rows
+
+
+def max_relative_diff(a, b) -> float:
+    if isinstance(a, dict):
+        assert set(a) == set(b), set(a) ^ set(b)
+        return max([max_relative_diff(a[k], b[k]) for k in a] or [0.0])
+    assert type(a) is type(b), (a, b)
+    if isinstance(a, float):
+        return abs(a - b) / max(abs(a), 1e-12)
+    assert a == b, (a, b)
+    return 0.0
+
+
+def timed_build(engine: str, history_dir: str, repeat: int):
+    solar.HISTORY_ENGINE = engine
+    best, profile = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        profile = solar.build_historical_profile(history_dir, parallel=True)
+        best = min(best, time.perf_counter() - t0)
+    return best, profile
+
+
+def rss_step(step: str, history_dir: str, cache: str) -> None:
+    """Child side of peak_rss_mb: one cached python-engine build, then print the peak RSS in MB."""
+    if step != "import":
+        solar.HISTORY_ENGINE = "python"
+        solar.HISTORY_PROFILE_CACHE = cache
+        if step == "merge":
+            # Drop the last rows of a middle export, like a window that was downloaded again.
+            names = sorted(os.listdir(history_dir))
+            fp = os.path.join(history_dir, names[len(names) // 2])
+            with open(fp, encoding="utf-8") as fh:
+                rows = json.load(fh)
+            with open(fp, "w", encoding="utf-8") as fh:
+                json.dump(rows[:-12], fh)
+        solar.build_historical_profile(history_dir)
+    try:
+        # ru_maxrss of a forked child starts out at the parent's peak; VmHWM belongs to this process alone.
+        with open("/proc/self/status", encoding="ascii") as fh:
+            peak_kib = next(int(line.split()[1]) for line in fh if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == "darwin" else 1)
+    print(peak_kib / 1024.0)
+
+
+def peak_rss_mb(step: str, history_dir: str, cache: str) -> float:
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--rss-step", step, history_dir, cache],
+        check=True, capture_output=True, text=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--interval", type=int, default=5, help="minutes between rows")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--rss-step", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.rss_step:
+        rss_step(*args.rss_step)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="solarman_json_") as history_dir:
+        rows = write_history(history_dir, args.years, args.interval)
+        files = len(os.listdir(history_dir))
+        size_mb = sum(os.path.getsize(os.path.join(history_dir, name)) for name in os.listdir(history_dir)) / 1e6
+        print(f"history: {args.years} years, {files} files, {rows} rows, {size_mb:.0f} MB")
+        if solar.np is not None:
+            py_time, py_profile = timed_build("python", history_dir, args.repeat)
+            np_time, np_profile = timed_build("numpy", history_dir, args.repeat)
+            print(f"python engine: {py_time * 1000:8.1f} ms")
+            print(f"numpy engine:  {np_time * 1000:8.1f} ms  ({py_time / np_time:.1f}x)")
+            print(f"max relative difference: {max_relative_diff(py_profile, np_profile):.2e}")
+        else:
+            print("NumPy is not installed; skipping the engine comparison.")
+
+        with tempfile.TemporaryDirectory(prefix="solar_profile_") as cache_dir:
+            cache = os.path.join(cache_dir, "profile.json")
+            rss = {step: peak_rss_mb(step, history_dir, cache) for step in ("import", "build", "merge")}
+            aggregate_mb = os.path.getsize(os.path.join(cache_dir, "profile.aggregate.bin")) / 1e6
+        print(
+            f"peak RSS, cached python engine: import {rss['import']:.0f} MB, build {rss['build']:.0f} MB, "
+            f"one-export merge {rss['merge']:.0f} MB (aggregate {aggregate_mb:.1f} MB)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Micro-benchmark the fast timestamp decoders against the strptime / fromisoformat paths they replace.
+
+    python benchmarks/bench_timestamps.py [--rows 100000]
+"""
+import argparse
+import timeit
+from datetime import datetime, timedelta
+
+import _env  # noqa: F401  (placeholder settings and sys.path for solar)
+import solar
+
+
+def strptime_key(value: str):
+    ts = solar._parse_history_ts(value)
+    return ((ts.year * 100 + ts.month) * 100 + ts.day) * 10000 + ts.hour * 100 + ts.minute
+
+
+def fromisoformat_epoch_us(value: str):
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=solar.budapest_tz)
+    return (dt - solar._EPOCH_EPOCH) // timedelta(microseconds=1), dt.utcoffset()
+
+
+def bench(label: str, fn, values, baseline=None) -> float:
+    elapsed = min(timeit.repeat(lambda: [fn(v) for v in values], number=1, repeat=5))
+    per_row = elapsed / len(values) * 1e9
+    speedup = f"  ({baseline / elapsed:.1f}x)" if baseline else ""
+    print(f"{label:<34} {per_row:8.0f} ns/row{speedup}")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    start = datetime(2025, 1, 1, tzinfo=solar.budapest_tz)
+    stamps = [start + timedelta(minutes=5 * i, microseconds=137 * i % 1_000_000) for i in range(args.rows)]
+    history = [ts.strftime("%Y/%m/%d %H:%M") for ts in stamps]
+    aware = [ts.isoformat() for ts in stamps]
+    naive = [ts.replace(tzinfo=None).isoformat() for ts in stamps]
+
+    print(f"{args.rows} rows, 5-minute spacing")
+    base = bench("history strptime", strptime_key, history)
+    bench("history _history_minute_key", solar._history_minute_key, history, base)
+    base = bench("iso aware fromisoformat", fromisoformat_epoch_us, aware)
+    bench("iso aware _fast_iso_epoch_us", solar._fast_iso_epoch_us, aware, base)
+    base = bench("iso naive fromisoformat", fromisoformat_epoch_us, naive)
+    bench("iso naive _fast_iso_epoch_us", solar._fast_iso_epoch_us, naive, base)
+
+
+if __name__ == "__main__":
+    main()
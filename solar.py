@@ -3,6 +3,7 @@ import hashlib
 import json
 import time
 from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
 from datetime import date as date_cls
 import os
 import psutil
@@ -12,21 +13,35 @@ import platform
 import sys
 import re
 import math
+import mmap
 from zoneinfo import ZoneInfo
 from collections import deque
+from collections import OrderedDict
 from collections import defaultdict
+from collections.abc import Mapping
+from fractions import Fraction
+from array import array
+from itertools import accumulate
 import statistics
+import bisect
 from pytz import timezone
 from pathlib import Path
-from typing import Any, Dict, Tuple, Optional, List
+from typing import Any, Dict, Tuple, Optional, List, Union
 import traceback
 import signal
 import shutil
+import sqlite3
 from urllib.parse import urlparse, parse_qs
+try:
+    import numpy as np
+except ImportError:  # optional: only needed for MY_HISTORY_ENGINE=numpy
+    np = None
 
 # NEW: threading / futures
 import threading
-from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 
 # =========================
@@ -48,6 +63,17 @@ STATE_FILE = os.environ['MY_STATE_FILE']
 SOLARMAN_FILE = os.environ['MY_SOLARMAN_FILE']
 WALLET_ADDRESS = os.environ['WALLET_ADDRESS']
 HISTORY_DIR = os.getenv('MY_HISTORY_DIR', 'solarman_json')
+# Compiled history profile artifact; empty = "<history dir>.profile.json" next to it, "off" disables.
+HISTORY_PROFILE_CACHE = os.getenv('MY_HISTORY_PROFILE_CACHE', '').strip()
+HISTORY_PROFILE_CACHE_VERSION = 3
+# "python" merges exports incrementally into the persisted aggregate; "numpy" rebuilds vectorized.
+HISTORY_ENGINE = os.getenv('MY_HISTORY_ENGINE', 'python').strip().lower()
+if HISTORY_ENGINE == "numpy" and np is None:
+    print("[History] MY_HISTORY_ENGINE=numpy but NumPy is not installed; using the python engine.")
+# Processes parsing exports in parallel at startup (0 = one per CPU core, 1 = parse sequentially in-process).
+HISTORY_WORKERS = max(0, int(os.getenv('MY_HISTORY_WORKERS', '0')))
+# Poll interval for new/changed exports in HISTORY_DIR (0 disables the watcher).
+HISTORY_WATCH_SECONDS = max(0, int(os.getenv('MY_HISTORY_WATCH_SECONDS', '300')))
 BATTERY_CAPACITY_AH = float(os.getenv("MY_BATTERY_CAPACITY_AH", "200"))
 BATTERY_NOMINAL_V = float(os.getenv("MY_BATTERY_NOMINAL_V", "55.2"))
 MINER_POWER_W = float(os.getenv("MY_MINER_POWER_W", "1050"))
@@ -59,6 +85,14 @@ HARD_AFTERNOON_STOP_SOC = float(os.getenv("MY_HARD_AFTERNOON_STOP_SOC", "90"))
 HARD_AFTERNOON_STOP_HOUR = int(os.getenv("MY_HARD_AFTERNOON_STOP_HOUR", "14"))
 PV_COVERAGE_RATIO_STOP = float(os.getenv("MY_PV_COVERAGE_RATIO_STOP", "0.9"))
 PV_COVERAGE_RATIO_START = float(os.getenv("MY_PV_COVERAGE_RATIO_START", "0.75"))
+# Hourly PV curve used by the start bridge guard: "mean", or the conservative/typical/optimistic
+# historical production band "p10" / "p50" / "p90".
+BRIDGE_PV_BAND = os.getenv("MY_BRIDGE_PV_BAND", "mean").strip().lower()
+if BRIDGE_PV_BAND not in ("mean", "p10", "p50", "p90"):
+    print(f"[Config] Unknown MY_BRIDGE_PV_BAND={BRIDGE_PV_BAND!r}; using mean.")
+    BRIDGE_PV_BAND = "mean"
+# Share of the minute-level PV expectation taken from the cloud-scaled clear-sky model (0 = history only).
+PV_CLEARSKY_WEIGHT = max(0.0, min(1.0, float(os.getenv("MY_PV_CLEARSKY_WEIGHT", "0.5"))))
 MIN_RUN_MINUTES = int(os.getenv("MY_MIN_RUN_MINUTES", "18"))
 MIN_RESTART_DELAY_MINUTES = int(os.getenv("MY_MIN_RESTART_DELAY_MINUTES", "10"))
 MINER_STOP_FORCE_CONSECUTIVE = max(1, int(os.getenv("MY_MINER_STOP_FORCE_CONSECUTIVE", "2")))
@@ -69,6 +103,15 @@ HASHRATE_LOW_STREAK_LIMIT = max(1, int(os.getenv("MY_HASHRATE_LOW_STREAK_LIMIT",
 HASHRATE_RESTART_COOLDOWN_MINUTES = max(5, int(os.getenv("MY_HASHRATE_RESTART_COOLDOWN_MINUTES", "30")))
 POWER_BUTTON_SHORT_PRESS_SECONDS = float(os.getenv("MY_POWER_BUTTON_SHORT_PRESS_SECONDS", "0.55"))
 POWER_BUTTON_LONG_PRESS_SECONDS = float(os.getenv("MY_POWER_BUTTON_LONG_PRESS_SECONDS", "10"))
+TELEMETRY_COMPACT_EVERY = max(1, int(os.getenv("MY_TELEMETRY_COMPACT_EVERY", "288")))
+# Retention: raw rows for TELEMETRY_RAW_DAYS (0 keeps raw rows forever), hourly rollups up to
+# TELEMETRY_HOURLY_DAYS, daily rollups beyond that.
+TELEMETRY_RAW_DAYS = max(0, int(os.getenv("MY_TELEMETRY_RAW_DAYS", "0")))
+TELEMETRY_HOURLY_DAYS = max(TELEMETRY_RAW_DAYS, int(os.getenv("MY_TELEMETRY_HOURLY_DAYS", "120")))
+PERSIST_FSYNC_SECONDS = max(0.0, float(os.getenv("MY_PERSIST_FSYNC_SECONDS", "30")))
+PERSIST_QUEUE_MAX = max(8, int(os.getenv("MY_PERSIST_QUEUE_MAX", "512")))
+TELEMETRY_BACKEND = os.getenv("MY_TELEMETRY_BACKEND", "jsonl").strip().lower()
+TELEMETRY_MEMORY_DAYS = max(11, int(os.getenv("MY_TELEMETRY_MEMORY_DAYS", os.getenv("MY_TELEMETRY_SQLITE_MEMORY_DAYS", "35"))))
 
 print(platform.machine())
 print(platform.system())
@@ -215,6 +258,22 @@ def _summarize_free_weather_outlook(forecast_payload: Dict[str, Any], now: Optio
         - ratios.get("snow", 0.0) * 1.0
     )
 
+    # Mean forecast cloud cover for the rest of today (or the next 6 h once today's entries are gone).
+    cloud_values = []
+    for ent in entries:
+        try:
+            ent_day = datetime.fromtimestamp(int(ent["dt"]), tz=budapest_tz).date()
+            clouds = float(ent["clouds"]["all"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if ent_day == now.date():
+            cloud_values.append(clouds)
+    if not cloud_values:
+        cloud_values = [
+            float(ent["clouds"]["all"]) for ent in entries[:2]
+            if isinstance(ent.get("clouds"), dict) and isinstance(ent["clouds"].get("all"), (int, float))
+        ]
+
     month_season_boost = 0.08 if now.month in (5, 6, 7, 8) else (-0.08 if now.month in (11, 12, 1, 2) else 0.0)
     score_5d = score_5d + month_season_boost
 
@@ -233,10 +292,395 @@ def _summarize_free_weather_outlook(forecast_payload: Dict[str, Any], now: Optio
         "bad_ratio_5d": round(bad_ratio, 3),
         "score_5d": round(score_5d, 3),
         "samples_5d": int(total),
+        "clouds_today_pct": round(statistics.mean(cloud_values), 1) if cloud_values else None,
     }
 
-# Unbounded in-memory telemetry history (no MAX_HISTORY_POINTS cap).
-telemetry_history: deque = deque()
+# Columnar layout of a telemetry record (see _record_telemetry); key order is preserved on read.
+TELEMETRY_FLOAT_FIELDS = (
+    "battery", "power", "clouds", "garage_temp", "garage_hum",
+    "inv_l1", "inv_l2", "inv_l3", "inv_lt", "internal_power",
+    "early_start_soc", "min_stop_soc", "late_day_reserve_soc",
+    "weather_sunny_ratio_5d", "weather_bad_ratio_5d",
+)
+TELEMETRY_BOOL_FIELDS = ("should_preserve_battery", "headroom_good")
+TELEMETRY_CATEGORY_FIELDS = ("state", "condition", "month_quality", "weather_risk_5d")
+TELEMETRY_FIELD_ORDER = (
+    "ts", "battery", "power", "state", "condition", "clouds", "garage_temp", "garage_hum",
+    "inv_l1", "inv_l2", "inv_l3", "inv_lt", "internal_power", "month_quality",
+    "early_start_soc", "min_stop_soc", "late_day_reserve_soc", "should_preserve_battery",
+    "headroom_good", "weather_risk_5d", "weather_sunny_ratio_5d", "weather_bad_ratio_5d",
+)
+_EPOCH_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_TS_MISSING = -(2 ** 63)
+_OFFSET_NAIVE = -32768
+
+
+def _epoch_bound_us(epoch: float) -> int:
+    """Epoch seconds (possibly +/-inf) as a microsecond bound usable against the epoch column."""
+    if epoch == float("-inf"):
+        return _TS_MISSING + 1
+    if epoch == float("inf"):
+        return 2 ** 63 - 1
+    return math.ceil(epoch * 1e6)
+
+
+class _TelemetryColumns:
+    """One generation of column arrays. Appends mutate it; evictions build a new generation."""
+
+    __slots__ = ("epoch_us", "utc_offset_min", "floats", "bools", "codes", "extras")
+
+    def __init__(self):
+        self.epoch_us = array("q")
+        self.utc_offset_min = array("h")
+        self.floats = {k: array("d") for k in TELEMETRY_FLOAT_FIELDS}
+        self.bools = {k: array("b") for k in TELEMETRY_BOOL_FIELDS}
+        self.codes = {k: array("H") for k in TELEMETRY_CATEGORY_FIELDS}
+        # Sparse per-row storage for keys/values that do not fit the columns (kept lossless).
+        self.extras: Dict[int, Dict[str, Any]] = {}
+
+    def sliced(self, start: int) -> "_TelemetryColumns":
+        out = _TelemetryColumns()
+        out.epoch_us = self.epoch_us[start:]
+        out.utc_offset_min = self.utc_offset_min[start:]
+        out.floats = {k: v[start:] for k, v in self.floats.items()}
+        out.bools = {k: v[start:] for k, v in self.bools.items()}
+        out.codes = {k: v[start:] for k, v in self.codes.items()}
+        out.extras = {i - start: v for i, v in self.extras.items() if i >= start}
+        return out
+
+
+class TelemetryRow(Mapping):
+    """Read-only dict-like view of one buffered telemetry record."""
+
+    __slots__ = ("_buf", "_cols", "_i")
+
+    def __init__(self, buf: "TelemetryBuffer", cols: _TelemetryColumns, i: int):
+        self._buf = buf
+        self._cols = cols
+        self._i = i
+
+    @property
+    def epoch(self) -> Optional[float]:
+        """Epoch seconds of the record timestamp (None when the ts was unparseable)."""
+        us = self._cols.epoch_us[self._i]
+        return None if us == _TS_MISSING else us / 1e6
+
+    @property
+    def epoch_us(self) -> Optional[int]:
+        """Exact integer epoch microseconds; differences match timedelta arithmetic bit for bit."""
+        us = self._cols.epoch_us[self._i]
+        return None if us == _TS_MISSING else us
+
+    @property
+    def local_dt(self) -> Optional[datetime]:
+        """Record timestamp as an aware datetime in its original offset (Budapest when it was naive)."""
+        cols, i = self._cols, self._i
+        us = cols.epoch_us[i]
+        if us == _TS_MISSING:
+            return None
+        off = cols.utc_offset_min[i]
+        utc = _EPOCH_EPOCH + timedelta(microseconds=us)
+        if off == _OFFSET_NAIVE:
+            return utc.astimezone(budapest_tz)
+        return utc.astimezone(dt_timezone(timedelta(minutes=off)))
+
+    def _ts_iso(self) -> str:
+        dt = self.local_dt
+        if self._cols.utc_offset_min[self._i] == _OFFSET_NAIVE:
+            dt = dt.replace(tzinfo=None)
+        return dt.isoformat()
+
+    def __getitem__(self, key: str) -> Any:
+        cols, i = self._cols, self._i
+        extra = cols.extras.get(i)
+        if extra is not None and key in extra:
+            return extra[key]
+        if key == "ts":
+            if cols.epoch_us[i] == _TS_MISSING:
+                raise KeyError(key)
+            return self._ts_iso()
+        col = cols.floats.get(key)
+        if col is not None:
+            v = col[i]
+            if v != v:
+                raise KeyError(key)
+            return v
+        col = cols.bools.get(key)
+        if col is not None:
+            v = col[i]
+            if v < 0:
+                raise KeyError(key)
+            return bool(v)
+        col = cols.codes.get(key)
+        if col is not None:
+            code = col[i]
+            if code == 0:
+                raise KeyError(key)
+            return self._buf._categories[key][code]
+        raise KeyError(key)
+
+    def __iter__(self):
+        extra = self._cols.extras.get(self._i) or {}
+        for key in TELEMETRY_FIELD_ORDER:
+            if key in extra or key in self:
+                yield key
+        for key in extra:
+            if key not in TELEMETRY_FIELD_ORDER:
+                yield key
+
+    def __contains__(self, key: object) -> bool:
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"TelemetryRow({dict(self)!r})"
+
+
+class TelemetryBuffer:
+    """
+    Columnar, array-backed telemetry history: numeric fields in array('d'), flags in
+    array('b'), repeated strings dictionary-encoded in array('H'), and an int64 epoch
+    column. Iteration and indexing yield read-only TelemetryRow views, so consumers that
+    use the deque of dicts (len, iteration, rec.get(...)) keep working unchanged.
+    """
+
+    def __init__(self):
+        self._cols = _TelemetryColumns()
+        self._categories: Dict[str, List[Optional[str]]] = {k: [None] for k in TELEMETRY_CATEGORY_FIELDS}
+        self._category_codes: Dict[str, Dict[str, int]] = {k: {} for k in TELEMETRY_CATEGORY_FIELDS}
+        # True while the epoch column is non-decreasing, so range lookups can bisect it.
+        self._epoch_sorted = True
+        # Writers (control loop appends, persister-side retention evictions) are serialized;
+        # readers never lock because evictions swap in a new column generation.
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._cols.epoch_us)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __iter__(self):
+        cols = self._cols
+        for i in range(len(cols.epoch_us)):
+            yield TelemetryRow(self, cols, i)
+
+    def __reversed__(self):
+        cols = self._cols
+        for i in range(len(cols.epoch_us) - 1, -1, -1):
+            yield TelemetryRow(self, cols, i)
+
+    def __getitem__(self, idx):
+        cols = self._cols
+        n = len(cols.epoch_us)
+        if isinstance(idx, slice):
+            return [TelemetryRow(self, cols, i) for i in range(*idx.indices(n))]
+        if idx < 0:
+            idx += n
+        if not 0 <= idx < n:
+            raise IndexError("telemetry index out of range")
+        return TelemetryRow(self, cols, idx)
+
+    def _encode(self, field: str, value: str) -> int:
+        codes = self._category_codes[field]
+        code = codes.get(value)
+        if code is None:
+            values = self._categories[field]
+            if len(values) >= 65535:
+                return -1
+            code = len(values)
+            values.append(value)
+            codes[value] = code
+        return code
+
+    def append(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._append_locked(record)
+
+    def _append_locked(self, record: Dict[str, Any]) -> None:
+        cols = self._cols
+        i = len(cols.epoch_us)
+        extra: Dict[str, Any] = {}
+
+        raw_ts = record.get("ts")
+        epoch_us, offset_min = _TS_MISSING, _OFFSET_NAIVE
+        fast = _fast_iso_epoch_us(raw_ts) if isinstance(raw_ts, str) else None
+        if fast is not None:
+            epoch_us, offset_min = fast
+        else:
+            try:
+                dt = datetime.fromisoformat(str(raw_ts))
+                if dt.tzinfo is not None:
+                    offset = dt.utcoffset()
+                    if offset.seconds % 60 == 0 and offset.microseconds == 0:
+                        offset_min = int(offset.total_seconds() // 60)
+                    else:
+                        extra["ts"] = raw_ts
+                else:
+                    dt = dt.replace(tzinfo=budapest_tz)
+                epoch_us = (dt - _EPOCH_EPOCH) // timedelta(microseconds=1)
+            except (TypeError, ValueError):
+                if raw_ts is not None:
+                    extra["ts"] = raw_ts
+        if epoch_us == _TS_MISSING or (cols.epoch_us and epoch_us < cols.epoch_us[-1]):
+            self._epoch_sorted = False
+        cols.epoch_us.append(epoch_us)
+        cols.utc_offset_min.append(offset_min)
+
+        for key, col in cols.floats.items():
+            v = record.get(key)
+            if key not in record:
+                col.append(math.nan)
+            elif type(v) is float and v == v:
+                col.append(v)
+            else:
+                # ints, NaN (the column's "missing" marker) and non-numbers stay exact in extras.
+                col.append(math.nan)
+                extra[key] = v
+        for key, col in cols.bools.items():
+            if key not in record:
+                col.append(-1)
+            elif isinstance(record[key], bool):
+                col.append(1 if record[key] else 0)
+            else:
+                col.append(-1)
+                extra[key] = record[key]
+        for key, col in cols.codes.items():
+            v = record.get(key)
+            code = self._encode(key, v) if isinstance(v, str) else -1
+            if code > 0:
+                col.append(code)
+            else:
+                col.append(0)
+                if key in record:
+                    extra[key] = v
+        for key, v in record.items():
+            if key not in TELEMETRY_FIELD_ORDER:
+                extra[key] = v
+        if extra:
+            cols.extras[i] = extra
+
+    def extend(self, records) -> None:
+        with self._lock:
+            for rec in records:
+                self._append_locked(rec)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cols = _TelemetryColumns()
+            self._epoch_sorted = True
+
+    def rows_between(self, start_epoch: float, end_epoch: float) -> List[TelemetryRow]:
+        """Rows with start_epoch <= ts < end_epoch, oldest first; bisects the epoch column when sorted."""
+        cols = self._cols
+        epochs = cols.epoch_us
+        lo_us, hi_us = _epoch_bound_us(start_epoch), _epoch_bound_us(end_epoch)
+        if self._epoch_sorted:
+            lo = bisect.bisect_left(epochs, lo_us)
+            hi = bisect.bisect_left(epochs, hi_us, lo)
+            return [TelemetryRow(self, cols, i) for i in range(lo, hi)]
+        idx = [i for i in range(len(epochs)) if lo_us <= epochs[i] < hi_us]
+        idx.sort(key=lambda i: epochs[i])
+        return [TelemetryRow(self, cols, i) for i in idx]
+
+    def epoch_bounds(self) -> Tuple[Optional[float], Optional[float]]:
+        epochs = self._cols.epoch_us
+        if self._epoch_sorted:
+            return (epochs[0] / 1e6, epochs[-1] / 1e6) if epochs else (None, None)
+        known = [e for e in epochs if e != _TS_MISSING]
+        return (min(known) / 1e6, max(known) / 1e6) if known else (None, None)
+
+    def drop_first(self, count: int) -> None:
+        """Evict the oldest rows. Views handed out earlier stay valid (copy-on-evict)."""
+        if count > 0:
+            with self._lock:
+                self._cols = self._cols.sliced(min(count, len(self)))
+
+    def drop_before(self, epoch: float) -> int:
+        """Evict leading rows older than epoch (or without a timestamp); returns how many."""
+        bound = _epoch_bound_us(epoch)
+        with self._lock:
+            epochs = self._cols.epoch_us
+            if self._epoch_sorted:
+                count = bisect.bisect_left(epochs, bound)
+            else:
+                count = 0
+                while count < len(epochs) and epochs[count] < bound:
+                    count += 1
+            if count:
+                self._cols = self._cols.sliced(count)
+        return count
+
+    def popleft(self) -> TelemetryRow:
+        row = self[0]
+        self.drop_first(1)
+        return row
+
+    def memory_bytes(self) -> int:
+        cols = self._cols
+        arrays = [cols.epoch_us, cols.utc_offset_min, *cols.floats.values(), *cols.bools.values(), *cols.codes.values()]
+        return sum(a.buffer_info()[1] * a.itemsize for a in arrays)
+
+
+class StateTransitionIndex:
+    """
+    State-change events over the telemetry stream, maintained on append and rebuilt at load.
+    An event is recorded where two consecutive rows carry different non-empty states; it is
+    stamped with the timestamp of the newer row (exact integer epoch microseconds).
+    seed_us is the last change older than the indexed rows, looked up once in the on-disk store.
+    """
+
+    def __init__(self):
+        self.events: List[Tuple[int, str, str]] = []
+        self.first_us: Optional[int] = None
+        self.first_state: str = ""
+        self.last_us: Optional[int] = None
+        self.seed_us: Optional[int] = None
+        self._last_state: str = ""
+
+    def observe(self, epoch_us: Optional[int], state_val: Any) -> None:
+        state_norm = str(state_val or "").strip().lower()
+        if epoch_us is not None:
+            if self.first_us is None:
+                self.first_us, self.first_state = epoch_us, state_norm
+            self.last_us = epoch_us
+            if self._last_state and state_norm and state_norm != self._last_state:
+                self.events.append((epoch_us, self._last_state, state_norm))
+        self._last_state = state_norm
+
+    def rebuild(self, rows) -> None:
+        self.__init__()
+        for row in rows:
+            self.observe(row.epoch_us, row.get("state"))
+
+    def last_change_us(self) -> Optional[int]:
+        return self.events[-1][0] if self.events else self.seed_us
+
+    def runs(self, start_us: int, end_us: int) -> List[Dict[str, Any]]:
+        """Run windows overlapping [start_us, end_us): state, start/end (epoch us) and whether it is still open."""
+        if self.first_us is None:
+            return []
+        events = list(self.events)
+        bounds = [(self.first_us, self.first_state)] + [(us, to_state) for us, _, to_state in events]
+        runs = []
+        for i, (run_start, run_state) in enumerate(bounds):
+            ongoing = i + 1 == len(bounds)
+            run_end = self.last_us if ongoing else bounds[i + 1][0]
+            if run_end < start_us or run_start >= end_us:
+                continue
+            runs.append({"state": run_state, "start_us": run_start, "end_us": run_end, "ongoing": ongoing})
+        return runs
+
+
+# In-memory telemetry history; unbounded unless MY_TELEMETRY_RAW_DAYS retention is enabled.
+telemetry_history = TelemetryBuffer()
+telemetry_transitions = StateTransitionIndex()
 _pending_transition_state: Optional[str] = None
 _pending_transition_since: Optional[datetime] = None
 _pending_transition_hits: int = 0
@@ -251,6 +695,86 @@ _restart_triggered_this_cycle: bool = False
 web_notifications: deque = deque(maxlen=160)
 
 
+# Per-calendar-day caches for the fast timestamp decoders. The Europe/Budapest UTC offset is stored
+# in seconds when it is constant all day, or None on DST switch days (left to zoneinfo, row by row).
+_TS_OFFSET_CACHE: Dict[int, Optional[int]] = {}
+_TS_DAY_CACHE: Dict[str, Optional[Tuple[int, Optional[int]]]] = {}
+_TS_DAY_CACHE_MAX = 4096
+_EPOCH_ORDINAL = date_cls(1970, 1, 1).toordinal()
+
+
+def _ts_day_offset(ordinal: int) -> Optional[int]:
+    offset = _TS_OFFSET_CACHE.get(ordinal, False)
+    if offset is not False:
+        return offset
+    d = date_cls.fromordinal(ordinal)
+    # DST switches happen at night, so comparing the first and last minute catches them.
+    first = datetime(d.year, d.month, d.day, tzinfo=budapest_tz).utcoffset()
+    last = datetime(d.year, d.month, d.day, 23, 59, tzinfo=budapest_tz).utcoffset()
+    offset = int(first.total_seconds()) if first == last else None
+    if len(_TS_OFFSET_CACHE) >= _TS_DAY_CACHE_MAX:
+        _TS_OFFSET_CACHE.clear()
+    _TS_OFFSET_CACHE[ordinal] = offset
+    return offset
+
+
+def _ts_day(day: str) -> Optional[Tuple[int, Optional[int]]]:
+    """(days since 1970-01-01, constant Budapest offset seconds or None) for "YYYY?MM?DD", None if invalid."""
+    info = _TS_DAY_CACHE.get(day, False)
+    if info is not False:
+        return info
+    info = None
+    if day.isascii() and day[0:4].isdigit() and day[5:7].isdigit() and day[8:10].isdigit():
+        try:
+            ordinal = date_cls(int(day[0:4]), int(day[5:7]), int(day[8:10])).toordinal()
+        except ValueError:
+            pass
+        else:
+            info = (ordinal - _EPOCH_ORDINAL, _ts_day_offset(ordinal))
+    if len(_TS_DAY_CACHE) >= _TS_DAY_CACHE_MAX:
+        _TS_DAY_CACHE.clear()
+    _TS_DAY_CACHE[day] = info
+    return info
+
+
+def _fast_iso_epoch_us(value: str) -> Optional[Tuple[int, int]]:
+    """
+    (epoch_us, UTC offset minutes or _OFFSET_NAIVE) for an ISO timestamp; naive values are
+    Europe/Budapest local time. fromisoformat (C) already beats any pure-Python field splitting, so
+    the win here is skipping the zoneinfo lookups and datetime arithmetic. Returns None for
+    unparseable values, odd offsets and naive times on DST switch days.
+    """
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    ordinal = dt.toordinal()
+    tz = dt.tzinfo
+    if tz is None:
+        offset_s = _ts_day_offset(ordinal)
+        if offset_s is None:
+            return None
+        stored_offset = _OFFSET_NAIVE
+    else:
+        offset = dt.utcoffset()
+        if offset is None or offset.microseconds or offset.seconds % 60:
+            return None
+        offset_s = offset.days * 86400 + offset.seconds
+        stored_offset = offset_s // 60
+    seconds = (ordinal - _EPOCH_ORDINAL) * 86400 + dt.hour * 3600 + dt.minute * 60 + dt.second - offset_s
+    return seconds * 1_000_000 + dt.microsecond, stored_offset
+
+
+def _iso_epoch(value: Any) -> Optional[float]:
+    """Epoch seconds of an ISO timestamp (naive = Europe/Budapest), like _parse_timestamp(value).timestamp()."""
+    if isinstance(value, str):
+        fast = _fast_iso_epoch_us(value)
+        if fast is not None:
+            return fast[0] / 1_000_000
+    ts = _parse_timestamp(value)
+    return ts.timestamp() if ts is not None else None
+
+
 def _parse_timestamp(value: Any) -> Optional[datetime]:
     if not value:
         return None
@@ -447,31 +971,38 @@ def _wallet_hashrate_hs_cached(wallet: str, now: Optional[datetime] = None, max_
 
 
 def _last_state_change_ts() -> Optional[datetime]:
-    """Find the last timestamp where persisted telemetry state changed."""
-    items = list(telemetry_history)
-    if len(items) < 2:
+    """Find the last timestamp where persisted telemetry state changed (O(1) index lookup)."""
+    return _epoch_us_to_dt(telemetry_transitions.last_change_us())
+
+
+def _epoch_us_to_dt(epoch_us: Optional[int]) -> Optional[datetime]:
+    if epoch_us is None:
         return None
-    for i in range(len(items) - 1, 0, -1):
-        cur = items[i]
-        prev = items[i - 1]
-        s1 = str(cur.get("state", "")).strip().lower()
-        s0 = str(prev.get("state", "")).strip().lower()
-        if not s1 or not s0 or s1 == s0:
-            continue
-        try:
-            ts = datetime.fromisoformat(str(cur.get("ts", "")))
-            if ts.tzinfo is None:
-                ts = ts.replace(tzinfo=budapest_tz)
-            return ts
-        except Exception:
-            continue
-    return None
+    return (_EPOCH_EPOCH + timedelta(microseconds=epoch_us)).astimezone(budapest_tz)
+
+
+def _seed_state_transitions_from_store() -> None:
+    """
+    No state change inside the in-memory hot window: ask the on-disk telemetry store once at load,
+    so _last_state_change_ts never has to scan it per call. Later changes are indexed on append.
+    """
+    if telemetry_store is None or telemetry_transitions.events:
+        return
+    try:
+        epoch = telemetry_store.last_state_change_epoch()
+    except Exception as err:
+        print(f"[Telemetry] State-change lookup failed: {err}")
+        return
+    if epoch is not None:
+        telemetry_transitions.seed_us = round(epoch * 1e6)
 
 
 def _apply_transition_guard(prev_state_val: str, desired_state: str, now: datetime,
+                            last_change_us: Optional[int],
                             confirmed: bool = True) -> Tuple[str, bool, str]:
     """
     Time-based transition guard to avoid fast ON/OFF thrashing from short PV/weather noise.
+    last_change_us is the last persisted state change (telemetry_transitions.last_change_us()).
     Returns (effective_state, blocked, reason).
     """
     if desired_state == prev_state_val:
@@ -480,7 +1011,7 @@ def _apply_transition_guard(prev_state_val: str, desired_state: str, now: dateti
     if not confirmed:
         return prev_state_val, True, "confirmation_pending"
 
-    last_change_ts = _last_state_change_ts()
+    last_change_ts = _epoch_us_to_dt(last_change_us)
     if last_change_ts is None:
         return desired_state, False, "no_recent_change"
 
@@ -514,14 +1045,358 @@ def _resolve_telemetry_file() -> Path:
     return (Path(__file__).resolve().parent / p).resolve()
 
 
+def _telemetry_journal_path(store_file: Path) -> Path:
+    """Append-only JSONL journal (one record per line) backing a telemetry store path."""
+    return store_file if store_file.suffix == ".jsonl" else store_file.with_suffix(".jsonl")
+
+
 TELEMETRY_FILE = _resolve_telemetry_file()
 TELEMETRY_BACKUP_FILE = (Path(STATE_FILE).resolve().parent / "telemetry_history_backup.json").resolve()
-print(f"[Telemetry] Using telemetry store: {TELEMETRY_FILE}")
-print(f"[Telemetry] Using telemetry backup store: {TELEMETRY_BACKUP_FILE}")
+TELEMETRY_JOURNAL_FILE = _telemetry_journal_path(TELEMETRY_FILE)
+TELEMETRY_BACKUP_JOURNAL_FILE = _telemetry_journal_path(TELEMETRY_BACKUP_FILE)
+TELEMETRY_ROLLUP_FILES = {
+    res: TELEMETRY_FILE.with_name(f"{TELEMETRY_FILE.stem}_rollup_{res}.jsonl") for res in ("1h", "1d")
+}
+print(f"[Telemetry] Using telemetry journal: {TELEMETRY_JOURNAL_FILE}")
+print(f"[Telemetry] Using telemetry backup journal: {TELEMETRY_BACKUP_JOURNAL_FILE}")
+
+# Line count per journal file; a journal whose count drifts from the in-memory history
+# (failed append, duplicates, corrupt lines) is rewritten by the next compaction.
+_telemetry_journal_lines: Dict[Path, int] = {}
+_telemetry_appends_since_compaction: int = 0
+
+
+class TelemetrySqliteStore:
+    """
+    Optional embedded SQLite (WAL) telemetry store, indexed on epoch timestamp and state.
+    Rows keep the original record as JSON next to a few typed columns used for seeks.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS telemetry (
+                    ts TEXT PRIMARY KEY,
+                    ts_epoch REAL NOT NULL,
+                    state TEXT,
+                    payload TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_telemetry_epoch ON telemetry(ts_epoch);
+                CREATE INDEX IF NOT EXISTS idx_telemetry_state_epoch ON telemetry(state, ts_epoch);
+                """
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def _row(record: Dict[str, Any]) -> Optional[Tuple[str, float, str, str]]:
+        epoch = _iso_epoch(record.get("ts"))
+        if epoch is None:
+            return None
+        state_val = str(record.get("state", "")).strip().lower()
+        return str(record.get("ts")), epoch, state_val, json.dumps(record, ensure_ascii=False)
+
+    def extend(self, records: List[Dict[str, Any]]) -> int:
+        rows = [r for r in (self._row(rec) for rec in records if isinstance(rec, dict)) if r is not None]
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO telemetry VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+        return len(rows)
+
+    def append(self, record: Dict[str, Any]) -> None:
+        self.extend([record])
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM telemetry").fetchone()[0])
+
+    def epoch_bounds(self) -> Tuple[Optional[float], Optional[float]]:
+        with self._lock:
+            lo, hi = self._conn.execute("SELECT MIN(ts_epoch), MAX(ts_epoch) FROM telemetry").fetchone()
+        return lo, hi
+
+    def rows_between(self, start_epoch: float, end_epoch: float) -> List["TelemetryRow"]:
+        """Rows with start_epoch <= ts < end_epoch, oldest first (index range seek)."""
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT payload FROM telemetry WHERE ts_epoch >= ? AND ts_epoch < ? ORDER BY ts_epoch",
+                (float(start_epoch), float(end_epoch)),
+            )
+            payloads = [p for (p,) in cur]
+        buf = TelemetryBuffer()
+        buf.extend(json.loads(p) for p in payloads)
+        return list(buf)
+
+    def delete_before(self, epoch: float) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM telemetry WHERE ts_epoch < ?", (float(epoch),))
+            self._conn.commit()
+        return cur.rowcount
+
+    def sync(self) -> None:
+        """Checkpoint the WAL so committed rows are fsynced into the main database file."""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def last_state_change_epoch(self) -> Optional[float]:
+        """Epoch of the first row of the current state run, or None if the state never changed."""
+        with self._lock:
+            last = self._conn.execute(
+                "SELECT state FROM telemetry ORDER BY ts_epoch DESC LIMIT 1"
+            ).fetchone()
+            if not last:
+                return None
+            other = self._conn.execute(
+                "SELECT ts_epoch FROM telemetry WHERE state != ? AND state != '' ORDER BY ts_epoch DESC LIMIT 1",
+                (last[0],),
+            ).fetchone()
+            if not other:
+                return None
+            change = self._conn.execute(
+                "SELECT ts_epoch FROM telemetry WHERE ts_epoch > ? ORDER BY ts_epoch LIMIT 1",
+                (other[0],),
+            ).fetchone()
+        return change[0] if change else None
+
+
+def _resolve_telemetry_db_file() -> Path:
+    raw = os.getenv("MY_TELEMETRY_DB", "").strip()
+    if not raw:
+        return TELEMETRY_FILE.with_suffix(".sqlite3")
+    p = Path(raw)
+    return p if p.is_absolute() else (Path(__file__).resolve().parent / p).resolve()
+
+
+class TelemetrySegmentStore:
+    """
+    Time-partitioned telemetry: one JSONL segment per local day plus a small manifest of
+    per-segment epoch ranges and row counts. Queries only open the segments they overlap;
+    a few recently read segments are kept decoded.
+    """
+
+    MANIFEST_NAME = "manifest.json"
+    CACHED_SEGMENTS = 8
 
+    def __init__(self, root: Path):
+        self.path = root
+        self._lock = threading.Lock()
+        self._manifest: Optional[Dict[str, Dict[str, Any]]] = None
+        self._cache: "OrderedDict[str, TelemetryBuffer]" = OrderedDict()
+        self._dirty: set = set()
+        root.mkdir(parents=True, exist_ok=True)
 
-# Historical profile cache (derived from solarman_json/*.json)
+    @staticmethod
+    def _day_key(epoch: float) -> str:
+        return datetime.fromtimestamp(epoch, tz=budapest_tz).strftime("%Y-%m-%d")
+
+    def _segment_file(self, day: str) -> Path:
+        return self.path / f"{day}.jsonl"
+
+    def _entries(self) -> Dict[str, Dict[str, Any]]:
+        """Manifest entries keyed by day, loaded (and reconciled with the directory) on first use."""
+        if self._manifest is not None:
+            return self._manifest
+
+        manifest: Dict[str, Dict[str, Any]] = {}
+        manifest_file = self.path / self.MANIFEST_NAME
+        try:
+            if manifest_file.exists():
+                with manifest_file.open("r", encoding="utf-8") as fh:
+                    payload = json.load(fh)
+                if isinstance(payload, dict) and isinstance(payload.get("segments"), dict):
+                    manifest = payload["segments"]
+        except Exception as err:
+            print(f"[Telemetry] Segment manifest unreadable ({err}); rebuilding from segments.")
+
+        # A crash between a segment append and the manifest write leaves the byte size out of
+        # step; only those segments (and unknown ones) are rescanned.
+        changed = False
+        on_disk = {fp.stem: fp for fp in self.path.glob("*.jsonl")}
+        for day in [d for d in manifest if d not in on_disk]:
+            del manifest[day]
+            changed = True
+        for day, fp in on_disk.items():
+            entry = manifest.get(day)
+            if entry is None or entry.get("bytes") != fp.stat().st_size:
+                manifest[day] = self._scan_segment(fp)
+                changed = True
+        self._manifest = manifest
+        if changed:
+            self._save_manifest()
+        return manifest
+
+    def _scan_segment(self, fp: Path) -> Dict[str, Any]:
+        records, bad_lines = _read_telemetry_journal(fp)
+        if bad_lines:
+            print(f"[Telemetry] Skipped {bad_lines} corrupt line(s) in {fp}.")
+        epochs = [epoch for epoch in (_iso_epoch(r.get("ts")) for r in records) if epoch is not None]
+        return {
+            "rows": len(records),
+            "first_epoch": min(epochs) if epochs else None,
+            "last_epoch": max(epochs) if epochs else None,
+            "bytes": fp.stat().st_size,
+        }
+
+    def _save_manifest(self) -> None:
+        manifest_file = self.path / self.MANIFEST_NAME
+        tmp_file = manifest_file.with_suffix(".json.tmp")
+        with tmp_file.open("w", encoding="utf-8") as fh:
+            json.dump({"version": 1, "segments": self._manifest}, fh, sort_keys=True)
+        tmp_file.replace(manifest_file)
+
+    def _segment(self, day: str) -> "TelemetryBuffer":
+        buf = self._cache.get(day)
+        if buf is not None:
+            self._cache.move_to_end(day)
+            return buf
+        buf = TelemetryBuffer()
+        fp = self._segment_file(day)
+        if fp.exists():
+            records, _ = _read_telemetry_journal(fp)
+            buf.extend(records)
+        self._cache[day] = buf
+        while len(self._cache) > self.CACHED_SEGMENTS:
+            self._cache.popitem(last=False)
+        return buf
+
+    def extend(self, records: List[Dict[str, Any]]) -> int:
+        by_day: Dict[str, List[Tuple[float, str]]] = defaultdict(list)
+        for rec in records:
+            if not isinstance(rec, dict):
+                continue
+            epoch = _iso_epoch(rec.get("ts"))
+            if epoch is None:
+                continue
+            by_day[self._day_key(epoch)].append((epoch, json.dumps(rec, ensure_ascii=False) + "\n"))
+
+        with self._lock:
+            entries = self._entries()
+            for day, items in by_day.items():
+                fp = self._segment_file(day)
+                with fp.open("a", encoding="utf-8") as fh:
+                    fh.writelines(line for _, line in items)
+                entry = entries.get(day) or {"rows": 0, "first_epoch": None, "last_epoch": None}
+                epochs = [e for e, _ in items]
+                if entry["first_epoch"] is not None:
+                    epochs += [entry["first_epoch"], entry["last_epoch"]]
+                entries[day] = {
+                    "rows": entry["rows"] + len(items),
+                    "first_epoch": min(epochs),
+                    "last_epoch": max(epochs),
+                    "bytes": fp.stat().st_size,
+                }
+                self._cache.pop(day, None)
+                self._dirty.add(fp)
+            if by_day:
+                self._save_manifest()
+                self._dirty.add(self.path / self.MANIFEST_NAME)
+        return sum(len(items) for items in by_day.values())
+
+    def append(self, record: Dict[str, Any]) -> None:
+        self.extend([record])
+
+    def delete_before(self, epoch: float) -> int:
+        """Drop whole segments that end before epoch (retention cutoffs fall on local midnight)."""
+        removed = 0
+        with self._lock:
+            entries = self._entries()
+            for day in sorted(entries):
+                entry = entries[day]
+                if entry.get("last_epoch") is None or entry["last_epoch"] >= epoch:
+                    continue
+                self._segment_file(day).unlink(missing_ok=True)
+                removed += int(entry.get("rows") or 0)
+                del entries[day]
+                self._cache.pop(day, None)
+            if removed:
+                self._save_manifest()
+        return removed
+
+    def sync(self) -> None:
+        """fsync segments and manifest written since the last sync."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        for fp in dirty:
+            _fsync_path(fp)
+
+    def count(self) -> int:
+        with self._lock:
+            return sum(int(e.get("rows") or 0) for e in self._entries().values())
+
+    def epoch_bounds(self) -> Tuple[Optional[float], Optional[float]]:
+        with self._lock:
+            entries = [e for e in self._entries().values() if e.get("first_epoch") is not None]
+        if not entries:
+            return None, None
+        return min(e["first_epoch"] for e in entries), max(e["last_epoch"] for e in entries)
+
+    def rows_between(self, start_epoch: float, end_epoch: float) -> List["TelemetryRow"]:
+        """Rows with start_epoch <= ts < end_epoch, oldest first; opens overlapping segments only."""
+        out: List[TelemetryRow] = []
+        with self._lock:
+            entries = self._entries()
+            for day in sorted(entries):
+                entry = entries[day]
+                if entry.get("first_epoch") is None:
+                    continue
+                if entry["last_epoch"] < start_epoch or entry["first_epoch"] >= end_epoch:
+                    continue
+                out.extend(self._segment(day).rows_between(start_epoch, end_epoch))
+        return out
+
+    def last_state_change_epoch(self) -> Optional[float]:
+        """Epoch of the first row of the current state run, or None if the state never changed."""
+        current: Optional[str] = None
+        later_epoch: Optional[float] = None
+        with self._lock:
+            for day in sorted(self._entries(), reverse=True):
+                for rec in reversed(self._segment(day)):
+                    epoch = rec.epoch
+                    if epoch is None:
+                        continue
+                    state_val = str(rec.get("state", "")).strip().lower()
+                    if current is None:
+                        current = state_val
+                    elif state_val and state_val != current:
+                        return later_epoch
+                    later_epoch = epoch
+        return None
+
+
+def _resolve_telemetry_segment_dir() -> Path:
+    raw = os.getenv("MY_TELEMETRY_SEGMENT_DIR", "").strip()
+    if not raw:
+        return TELEMETRY_FILE.with_name(TELEMETRY_FILE.stem + "_segments")
+    p = Path(raw)
+    return p if p.is_absolute() else (Path(__file__).resolve().parent / p).resolve()
+
+
+telemetry_store: Optional[Union[TelemetrySqliteStore, TelemetrySegmentStore]] = None
+if TELEMETRY_BACKEND == "sqlite":
+    try:
+        telemetry_store = TelemetrySqliteStore(_resolve_telemetry_db_file())
+        print(f"[Telemetry] Using SQLite telemetry backend: {telemetry_store.path}")
+    except Exception as err:
+        print(f"[Telemetry] SQLite backend unavailable ({err}); falling back to JSONL journal.")
+        telemetry_store = None
+elif TELEMETRY_BACKEND == "segments":
+    try:
+        telemetry_store = TelemetrySegmentStore(_resolve_telemetry_segment_dir())
+        print(f"[Telemetry] Using daily segment telemetry backend: {telemetry_store.path}")
+    except Exception as err:
+        print(f"[Telemetry] Segment backend unavailable ({err}); falling back to JSONL journal.")
+        telemetry_store = None
+
+
+# Historical profile cache (derived from solarman_json/*.json); swapped whole by _install_historical_profile
 historical_profile: Optional[Dict[str, Any]] = None
+historical_profile_version = 0
 
 # Detect Raspberry Pi
 if platform.system() == "Linux" and any(arch in platform.machine() for arch in ['arm', 'aarch64', 'armv7l']):
@@ -639,6 +1514,25 @@ def _parse_history_ts(value: str) -> Optional[datetime]:
         return None
 
 
+def _history_minute_key(value: str) -> Optional[int]:
+    """
+    Wall-clock YYYYMMDDHHMM of a Solarman "YYYY/MM/DD HH:MM" stamp. The profile groups by local
+    month/hour/day, so no UTC conversion is needed. Other layouts go through _parse_history_ts.
+    """
+    value = value.strip()
+    if len(value) == 16 and value[4] == "/" and value[7] == "/" and value[10] == " " and value[13] == ":":
+        day = _ts_day(value[0:10])
+        clock = value[11:13] + value[14:16]
+        if day is not None and clock.isascii() and clock.isdigit():
+            hour, minute = int(clock[0:2]), int(clock[2:4])
+            if hour <= 23 and minute <= 59:
+                return int(value[0:4] + value[5:7] + value[8:10] + clock)
+    ts = _parse_history_ts(value)
+    if ts is None:
+        return None
+    return ((ts.year * 100 + ts.month) * 100 + ts.day) * 10000 + ts.hour * 100 + ts.minute
+
+
 def _history_float(value: Any, default: float = 0.0) -> float:
     if value in (None, ""):
         return default
@@ -648,151 +1542,947 @@ def _history_float(value: Any, default: float = 0.0) -> float:
         return default
 
 
-def build_historical_profile(history_dir: str = "solarman_json") -> Dict[str, Any]:
-    """
-    Build month-level and hour-level production profile from downloaded Solarman JSON exports.
-    Robust behaviors:
-    - tolerates malformed files/rows,
-    - deduplicates overlaps on exact timestamp (same minute),
-    - avoids overweighting duplicate download windows,
-    - clamps obviously broken values.
-    """
-    files = sorted(glob.glob(os.path.join(history_dir, "*.json")))
-    if not files:
-        print(f"[History] No history files found in {history_dir}. Using static defaults.")
-        return {}
+def _history_profile_cache_paths(history_dir: str) -> Optional[Tuple[Path, Path]]:
+    """Compiled profile artifact and its persisted aggregate for a history dir (None = disabled)."""
+    if HISTORY_PROFILE_CACHE.lower() in ("off", "none", "0"):
+        return None
+    artifact = Path(HISTORY_PROFILE_CACHE) if HISTORY_PROFILE_CACHE else Path(os.path.normpath(history_dir) + ".profile.json")
+    return artifact, artifact.with_suffix(".aggregate.bin")
+
+
+def _history_file_sha256(fp: str) -> str:
+    digest = hashlib.sha256()
+    with open(fp, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-    # timestamp -> list of observed values coming from possibly overlapping files
-    sample_by_ts: Dict[datetime, Dict[str, List[float]]] = defaultdict(lambda: {"prod": [], "soc": []})
-    invalid_rows = 0
-    parsed_rows = 0
 
-    for fp in files:
+def _history_file_stats(history_dir: str) -> Dict[str, Optional[Dict[str, int]]]:
+    """name -> {size, mtime_ns} for every export in history_dir (None if it vanished mid-scan)."""
+    out: Dict[str, Optional[Dict[str, int]]] = {}
+    for fp in sorted(glob.glob(os.path.join(history_dir, "*.json"))):
         try:
-            with open(fp, "r", encoding="utf-8") as fh:
-                payload = json.load(fh)
-        except Exception as err:
-            print(f"[History] Failed loading {fp}: {err}")
+            st = os.stat(fp)
+        except OSError:
+            out[os.path.basename(fp)] = None
             continue
+        out[os.path.basename(fp)] = {"size": int(st.st_size), "mtime_ns": int(st.st_mtime_ns)}
+    return out
+
+
+def _history_same_file(known: Optional[Dict[str, Any]], stat: Optional[Dict[str, int]]) -> bool:
+    return (
+        known is not None and stat is not None
+        and known.get("size") == stat["size"] and known.get("mtime_ns") == stat["mtime_ns"]
+    )
+
+
+def _history_cache_read(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with path.open("r", encoding="utf-8") as fh:
+            payload = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(payload, dict) or payload.get("version") != HISTORY_PROFILE_CACHE_VERSION:
+        return None
+    return payload
 
-        if not isinstance(payload, list):
-            print(f"[History] Ignoring non-list JSON payload in {fp}")
-            continue
 
-        for row in payload:
-            if not isinstance(row, dict):
+def _history_cache_write(path: Path, payload: Dict[str, Any]) -> None:
+    try:
+        _write_file_atomic(path, json.dumps(payload, separators=(",", ":")))
+    except OSError as err:
+        print(f"[History] Could not write profile cache {path}: {err}")
+
+
+HISTORY_READ_CHUNK = 1 << 16
+_JSON_WS = re.compile(r"[ \t\n\r]*")
+
+
+def _iter_history_records(fp: str) -> Any:
+    """
+    Stream a Solarman export (a JSON array of row objects) element by element.
+    Yields (Updated Time, Production Power(W), SoC(%)) per object row and None for any other element,
+    holding only one read chunk plus the current element in memory.
+    Raises TypeError if the payload is not an array and ValueError on malformed JSON.
+    """
+    scan_once = json.JSONDecoder().scan_once
+    skip_ws = _JSON_WS.match
+    with open(fp, "r", encoding="utf-8") as fh:
+        buf, pos, eof = "", 0, False
+
+        def more() -> bool:
+            nonlocal buf, pos, eof
+            if eof:
+                return False
+            chunk = fh.read(HISTORY_READ_CHUNK)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+            return not eof
+
+        def peek() -> str:
+            """Next non-whitespace character ("" at end of file)."""
+            nonlocal pos
+            while True:
+                pos = skip_ws(buf, pos).end()
+                if pos < len(buf):
+                    return buf[pos]
+                if not more():
+                    return ""
+
+        head = peek()
+        if head != "[":
+            raise TypeError("JSON payload is not a list") if head else ValueError("Expecting value: empty file")
+        pos += 1
+        if peek() == "]":
+            pos += 1
+        else:
+            while True:
+                if pos == len(buf) or buf[pos] in " \t\r\n":
+                    if not peek():
+                        raise ValueError("Unterminated JSON array")
+                try:
+                    element, end = scan_once(buf, pos)
+                except (StopIteration, json.JSONDecodeError):
+                    # Most likely the element straddles the chunk boundary; only fail once the file is exhausted.
+                    if not more():
+                        raise ValueError(f"Malformed JSON array element near offset {fh.tell()}")
+                    continue
+                if isinstance(element, (int, float)) and not eof:
+                    # A number cut by the chunk boundary still decodes ("-25" of "-2500.5"), so only
+                    # trust it once a delimiter is visible after it.
+                    after = skip_ws(buf, end).end()
+                    if after == len(buf) or buf[after] not in ",]":
+                        more()
+                        continue
+                if isinstance(element, dict):
+                    yield element.get("Updated Time", ""), element.get("Production Power(W)"), element.get("SoC(%)")
+                else:
+                    yield None
+                pos = end
+                delimiter = buf[pos:pos + 1]
+                if delimiter != "," and delimiter != "]":
+                    delimiter = peek()
+                pos += 1
+                if delimiter == "]":
+                    break
+                if delimiter != ",":
+                    raise ValueError("Expecting ',' delimiter")
+                if pos > HISTORY_READ_CHUNK:
+                    buf, pos = buf[pos:], 0
+        # Like json.load, refuse trailing garbage after the array.
+        if peek():
+            raise ValueError("Extra data after JSON array")
+
+
+def _parse_history_file(fp: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse one Solarman export into a flat [minute_key, prod, soc, ...] array.
+    minute_key is the wall-clock YYYYMMDDHHMM, so it sorts chronologically.
+    Returns None when the file cannot be used at all.
+    """
+    rows = array("d")
+    invalid_rows = 0
+    try:
+        for record in _iter_history_records(fp):
+            if record is None:
                 invalid_rows += 1
                 continue
 
-            ts = _parse_history_ts(str(row.get("Updated Time", "")).strip())
-            if ts is None:
+            stamp, prod_raw, soc_raw = record
+            key = _history_minute_key(str(stamp))
+            if key is None:
                 invalid_rows += 1
                 continue
 
-            prod = max(0.0, min(_history_float(row.get("Production Power(W)"), 0.0), 25000.0))
-            soc = max(0.0, min(_history_float(row.get("SoC(%)"), 0.0), 100.0))
+            prod = max(0.0, min(_history_float(prod_raw, 0.0), 25000.0))
+            soc = max(0.0, min(_history_float(soc_raw, 0.0), 100.0))
+            rows.extend((key, prod, soc))
+    except TypeError:
+        print(f"[History] Ignoring non-list JSON payload in {fp}")
+        return None
+    except Exception as err:
+        print(f"[History] Failed loading {fp}: {err}")
+        return None
 
-            sample_by_ts[ts]["prod"].append(prod)
-            sample_by_ts[ts]["soc"].append(soc)
-            parsed_rows += 1
+    return {"rows": rows, "parsed": len(rows) // 3, "invalid": invalid_rows}
 
-    if not sample_by_ts:
-        print("[History] All rows were invalid or empty. Using static defaults.")
-        return {}
 
-    # Canonicalize each timestamp to a single robust sample to prevent overlap bias.
-    canonical: List[Dict[str, Any]] = []
-    duplicate_timestamps = 0
-    for ts in sorted(sample_by_ts.keys()):
-        prod_values = sample_by_ts[ts]["prod"]
-        soc_values = sample_by_ts[ts]["soc"]
-        if len(prod_values) > 1:
-            duplicate_timestamps += 1
+# Production bands per (month, hour) are DDSketch-style log-bucket histograms: mergeable, bounded
+# (~500 buckets up to 25 kW), exact under removal, and within HISTORY_SKETCH_ALPHA relative error.
+HISTORY_SKETCH_ALPHA = 0.01
+HISTORY_SKETCH_GAMMA = (1.0 + HISTORY_SKETCH_ALPHA) / (1.0 - HISTORY_SKETCH_ALPHA)
+HISTORY_SKETCH_LOG_GAMMA = math.log(HISTORY_SKETCH_GAMMA)
+HISTORY_SKETCH_ZERO = -1  # bucket for readings below 1 W (night)
+HISTORY_PROD_BANDS = (("p10", 0.1), ("p50", 0.5), ("p90", 0.9))
 
-        # median is robust to occasional outliers in duplicate windows
-        prod = statistics.median(prod_values) if prod_values else 0.0
-        soc = statistics.median(soc_values) if soc_values else 0.0
 
-        canonical.append({"ts": ts, "prod": prod, "soc": soc})
+def _sketch_bucket(value: float) -> int:
+    return HISTORY_SKETCH_ZERO if value < 1.0 else math.ceil(math.log(value) / HISTORY_SKETCH_LOG_GAMMA)
 
-    month_hour_prod: Dict[int, Dict[int, List[float]]] = defaultdict(lambda: defaultdict(list))
-    month_hour_soc: Dict[int, Dict[int, List[float]]] = defaultdict(lambda: defaultdict(list))
-    month_daily_peaks: Dict[int, Dict[str, float]] = defaultdict(dict)
 
-    for item in canonical:
-        ts = item["ts"]
-        month = ts.month
-        hour = ts.hour
-        day_key = ts.strftime("%Y-%m-%d")
-        prod = item["prod"]
-        soc = item["soc"]
+def _sketch_quantile(buckets: Dict[int, int], q: float) -> float:
+    rank = q * (sum(buckets.values()) - 1)
+    seen = 0
+    for index in sorted(buckets):
+        seen += buckets[index]
+        if seen > rank:
+            break
+    if index == HISTORY_SKETCH_ZERO:
+        return 0.0
+    return 2.0 * math.exp(index * HISTORY_SKETCH_LOG_GAMMA) / (HISTORY_SKETCH_GAMMA + 1.0)
+
+
+def _hourly_prod_bands(sketches: Dict[int, Dict[int, int]]) -> Dict[str, Dict[str, float]]:
+    """hourly_prod_p10/p50/p90 month fields from per-hour production sketches."""
+    return {
+        f"hourly_prod_{band}": {str(h): _sketch_quantile(sketch, q) for h, sketch in sketches.items()}
+        for band, q in HISTORY_PROD_BANDS
+    }
+
+
+def _counter_quantile(counts: Dict[float, int], n: int, i: int) -> float:
+    """statistics.quantiles(expanded counts, n=n)[i - 1] (exclusive method) without expanding."""
+    ld = sum(counts.values())
+    m = ld + 1
+    j = i * m // n
+    j = 1 if j < 1 else ld - 1 if j > ld - 1 else j
+    delta = i * m - j * n
+    lo = hi = None
+    seen = 0
+    for value in sorted(counts):
+        seen += counts[value]
+        if lo is None and seen >= j:
+            lo = value
+        if seen >= j + 1:
+            hi = value
+            break
+    return (lo * (n - delta) + hi * delta) / n
+
+
+def _counter_mean(counts: Dict[float, int]) -> float:
+    """Exact mean of a value histogram (same rounding as statistics.mean)."""
+    total = sum(counts.values())
+    return float(sum(Fraction(value) * count for value, count in counts.items()) / total)
+
+
+_HISTORY_AGGREGATE_MAGIC = b"SOLAR_HISTAGG1\n\x00"
+# Minute columns (minute key, canonical prod, canonical soc, owning source id or -1 when the minute has
+# several observations), then one row per observation of those duplicate minutes (key, source id, prod, soc).
+_HISTORY_AGGREGATE_COLUMNS = "qddi"
+_HISTORY_AGGREGATE_DUP_COLUMNS = "qidd"
+
+
+def _histogram_bump(counts: Dict[Any, int], value: Any, delta: int) -> None:
+    n = counts.get(value, 0) + delta
+    if n:
+        counts[value] = n
+    else:
+        del counts[value]
+
+
+class _HistoryAggregateSpan:
+    """Whole days [lo, hi] of the aggregate's minute columns copied out for editing; replaces base[start:stop]."""
+
+    __slots__ = ("lo", "hi", "start", "stop", "columns")
+
+    def __init__(self, lo: int, hi: int, start: int, stop: int, columns: List[array]) -> None:
+        self.lo = lo
+        self.hi = hi
+        self.start = start
+        self.stop = stop
+        self.columns = columns
+
+
+class HistoryProfileAggregate:
+    """
+    Persisted intermediate state behind the historical profile, so exports can be merged one at a time.
+    Every minute of history is one row of sorted binary columns (minute key, canonical prod/soc, owning
+    export); only the minutes seen in more than one export keep their per-export observations. On top sit
+    the per-(month, hour) production sums/counts/sketches, evening SoC histograms and per-day peaks.
+    The saved file is memory-mapped and a merge copies out only the days its exports cover (load_days).
+    """
+
+    def __init__(self) -> None:
+        self.sources: Dict[str, Dict[str, Any]] = {}
+        self.dups: Dict[int, List[Tuple[int, float, float]]] = {}
+        self.rows = 0
+        self.next_id = 0
+        self.prod_sum: Dict[Tuple[int, int], Fraction] = {}
+        self.prod_count: Dict[Tuple[int, int], int] = {}
+        self.soc_hist: Dict[Tuple[int, int], Dict[float, int]] = {}  # hours 16-23 only, for evening_soc_p40
+        self.prod_sketch: Dict[Tuple[int, int], Dict[int, int]] = {}
+        self.daily_peak: Dict[int, float] = {}
+        self._base: List[Any] = [array(t) for t in _HISTORY_AGGREGATE_COLUMNS]
+        self._backing: Optional[mmap.mmap] = None
+        self._spans: List[_HistoryAggregateSpan] = []
+
+    @staticmethod
+    def parsed_range(parsed: Optional[Dict[str, Any]]) -> Optional[Tuple[int, int]]:
+        """(first, last) minute key of a _parse_history_file result, None if it has no rows."""
+        keys = parsed["rows"][0::3] if parsed else None
+        return (int(min(keys)), int(max(keys))) if keys else None
+
+    def source_range(self, name: str) -> Optional[Tuple[int, int]]:
+        source = self.sources.get(name)
+        if source is None or source.get("first") is None:
+            return None
+        return source["first"], source["last"]
+
+    def load_days(self, ranges: List[Tuple[int, int]]) -> None:
+        """Copy out the whole days covering each (first, last) minute-key range; call once, before editing."""
+        if self._spans:
+            raise ValueError("aggregate days already loaded")
+        keys = self._base[0]
+        for lo, hi in sorted((lo // 10000 * 10000, hi // 10000 * 10000 + 9999) for lo, hi in ranges):
+            if self._spans and lo <= self._spans[-1].hi + 1:
+                span = self._spans.pop()
+                lo, hi = span.lo, max(hi, span.hi)
+            start, stop = bisect.bisect_left(keys, lo), bisect.bisect_right(keys, hi)
+            columns = []
+            for typecode, column in zip(_HISTORY_AGGREGATE_COLUMNS, self._base):
+                copy = array(typecode)
+                copy.frombytes(memoryview(column)[start:stop].cast("B"))
+                columns.append(copy)
+            self._spans.append(_HistoryAggregateSpan(lo, hi, start, stop, columns))
+
+    def _span(self, first: int, last: int) -> _HistoryAggregateSpan:
+        for span in self._spans:
+            if span.lo <= first and last <= span.hi:
+                return span
+        raise ValueError(f"minutes {first}..{last} are not loaded")
+
+    def _tally(self, key: int, prod: float, soc: float, delta: int) -> None:
+        """Add (delta=1) or retract (delta=-1) one canonical minute in its (month, hour) cell."""
+        cell = (key // 1000000 % 100, key // 100 % 100)
+        count = self.prod_count.get(cell, 0) + delta
+        if not count:
+            del self.prod_sum[cell], self.prod_count[cell], self.prod_sketch[cell]
+            self.soc_hist.pop(cell, None)
+            return
+        self.prod_count[cell] = count
+        self.prod_sum[cell] = self.prod_sum.get(cell, Fraction(0)) + delta * Fraction(prod)
+        _histogram_bump(self.prod_sketch.setdefault(cell, {}), _sketch_bucket(prod), delta)
+        if cell[1] >= 16:
+            _histogram_bump(self.soc_hist.setdefault(cell, {}), soc, delta)
+
+    def _put(self, out: List[array], key: int, observations: List[Tuple[int, float, float]]) -> None:
+        """Append one minute to the out columns, canonicalized from its observations."""
+        if len(observations) == 1:
+            owner, prod, soc = observations[0]
+        else:
+            owner = -1
+            # median is robust to occasional outliers in duplicate windows
+            prod = statistics.median([o[1] for o in observations])
+            soc = statistics.median([o[2] for o in observations])
+            self.dups[key] = observations
+        self._tally(key, prod, soc, 1)
+        for column, value in zip(out, (key, prod, soc, owner)):
+            column.append(value)
+
+    def _replace(self, span: _HistoryAggregateSpan, a: int, b: int, out: List[array], days: set) -> None:
+        """Swap span rows [a, b) for out and recompute the peaks of the touched days."""
+        for column, rows in zip(span.columns, out):
+            column[a:b] = rows
+        self.rows += len(out[0]) - (b - a)
+        keys, prod = span.columns[0], span.columns[1]
+        for day in days:
+            i = bisect.bisect_left(keys, day * 10000)
+            j = bisect.bisect_left(keys, (day + 1) * 10000)
+            if i < j:
+                self.daily_peak[day] = max(prod[i:j])
+            else:
+                self.daily_peak.pop(day, None)
+
+    def remove_source(self, name: str) -> None:
+        source = self.sources.pop(name, None)
+        if source is None or source.get("first") is None:
+            return
+        sid, first, last = source["id"], source["first"], source["last"]
+        span = self._span(first, last)
+        keys, prod, soc, owner = span.columns
+        a, b = bisect.bisect_left(keys, first), bisect.bisect_right(keys, last)
+        out = [array(t) for t in _HISTORY_AGGREGATE_COLUMNS]
+        days = set()
+        for i in range(a, b):
+            key = keys[i]
+            if owner[i] == sid or (owner[i] == -1 and any(o[0] == sid for o in self.dups[key])):
+                self._tally(key, prod[i], soc[i], -1)
+                days.add(key // 10000)
+                kept = [o for o in self.dups.pop(key, ()) if o[0] != sid]
+                if kept:
+                    self._put(out, key, kept)
+                continue
+            for column, values in zip(out, span.columns):
+                column.append(values[i])
+        self._replace(span, a, b, out, days)
+
+    def add_source(self, name: str, fingerprint: Dict[str, Any], parsed: Optional[Dict[str, Any]]) -> None:
+        """Merge one parsed export; parsed=None records an unusable file so it is not retried until it changes."""
+        self.remove_source(name)
+        source = dict(fingerprint)
+        source["parsed"] = int(parsed["parsed"]) if parsed else 0
+        source["invalid"] = int(parsed["invalid"]) if parsed else 0
+        source["failed"] = parsed is None
+        source["id"] = sid = self.next_id
+        self.next_id += 1
+        self.sources[name] = source
+        rows = parsed["rows"] if parsed else ()
+        if not rows:
+            return
+        incoming = sorted((int(rows[i]), rows[i + 1], rows[i + 2]) for i in range(0, len(rows), 3))
+        first, last = source["first"], source["last"] = incoming[0][0], incoming[-1][0]
+        span = self._span(first, last)
+        keys, prod, soc, owner = span.columns
+        a, b = bisect.bisect_left(keys, first), bisect.bisect_right(keys, last)
+        out = [array(t) for t in _HISTORY_AGGREGATE_COLUMNS]
+        days = set()
+        i, j = a, 0
+        while j < len(incoming):
+            key = incoming[j][0]
+            while i < b and keys[i] < key:
+                for column, values in zip(out, span.columns):
+                    column.append(values[i])
+                i += 1
+            observations: List[Tuple[int, float, float]] = []
+            if i < b and keys[i] == key:
+                self._tally(key, prod[i], soc[i], -1)
+                observations = self.dups.pop(key, None) or [(owner[i], prod[i], soc[i])]
+                i += 1
+            while j < len(incoming) and incoming[j][0] == key:
+                observations.append((sid, incoming[j][1], incoming[j][2]))
+                j += 1
+            self._put(out, key, observations)
+            days.add(key // 10000)
+        while i < b:
+            for column, values in zip(out, span.columns):
+                column.append(values[i])
+            i += 1
+        self._replace(span, a, b, out, days)
+
+    def profile(self, file_count: int) -> Dict[str, Any]:
+        if not self.rows:
+            return {}
+
+        profile: Dict[str, Any] = {
+            "months": {},
+            "files": file_count,
+            "parsed_rows": sum(s["parsed"] for s in self.sources.values()),
+            "invalid_rows": sum(s["invalid"] for s in self.sources.values()),
+            "unique_timestamps": self.rows,
+            "duplicate_timestamps": len(self.dups),
+        }
+        month_daily_peaks: Dict[int, List[float]] = defaultdict(list)
+        for day, peak in self.daily_peak.items():
+            month_daily_peaks[day // 100 % 100].append(peak)
+
+        for month in range(1, 13):
+            hourly_mean = {
+                hour: float(self.prod_sum[(month, hour)] / self.prod_count[(month, hour)])
+                for hour in range(24) if self.prod_count.get((month, hour))
+            }
+            if not hourly_mean:
+                continue
+
+            daily_peaks = month_daily_peaks.get(month, [])
+            monthly_peak_p75 = (
+                statistics.quantiles(daily_peaks, n=4)[2]
+                if len(daily_peaks) >= 4
+                else (max(daily_peaks) if daily_peaks else 0.0)
+            )
+
+            daylight_hours = [h for h, mean in hourly_mean.items() if mean >= 350]
+            solar_start_hour = min(daylight_hours) if daylight_hours else 8
+            solar_end_hour = max(daylight_hours) if daylight_hours else 15
+
+            midday_hours = [h for h in range(10, 15) if h in hourly_mean]
+            if midday_hours:
+                midday_avg = statistics.mean([hourly_mean[h] for h in midday_hours])
+            else:
+                midday_avg = statistics.mean(hourly_mean.values())
+
+            evening_soc: Dict[float, int] = defaultdict(int)
+            for h in range(16, 24):
+                for soc, count in self.soc_hist.get((month, h), {}).items():
+                    evening_soc[soc] += count
+            evening_count = sum(evening_soc.values())
+            evening_soc_p40 = (
+                _counter_quantile(evening_soc, 5, 2)
+                if evening_count >= 5
+                else (_counter_mean(evening_soc) if evening_count else 45.0)
+            )
+
+            profile["months"][month] = {
+                "solar_start_hour": int(solar_start_hour),
+                "solar_end_hour": int(solar_end_hour),
+                "daylight_span": int(max(0, solar_end_hour - solar_start_hour + 1)),
+                "midday_avg": float(midday_avg),
+                "daily_peak_p75": float(monthly_peak_p75),
+                "evening_soc_p40": float(evening_soc_p40),
+                "hourly_prod_mean": {str(h): mean for h, mean in hourly_mean.items()},
+            }
+            profile["months"][month].update(
+                _hourly_prod_bands({h: self.prod_sketch[(month, h)] for h in hourly_mean})
+            )
+
+        return profile
+
+    def save(self, path: Path) -> None:
+        """Write the aggregate: a JSON header, then the minute columns (untouched ranges copied as-is)."""
+        header = json.dumps({
+            "version": HISTORY_PROFILE_CACHE_VERSION,
+            "byteorder": sys.byteorder,
+            "rows": self.rows,
+            "observations": sum(len(observations) for observations in self.dups.values()),
+            "next_id": self.next_id,
+            "sources": sorted(self.sources.items()),
+            "cells": [
+                [month, hour, self.prod_count[(month, hour)], str(self.prod_sum[(month, hour)]),
+                 sorted(self.soc_hist.get((month, hour), {}).items()), sorted(self.prod_sketch[(month, hour)].items())]
+                for month, hour in sorted(self.prod_count)
+            ],
+            "daily_peak": sorted(self.daily_peak.items()),
+        }, separators=(",", ":")).encode("utf-8")
+        # Pad so the columns start 8-byte aligned.
+        header += b" " * (-(len(_HISTORY_AGGREGATE_MAGIC) + 8 + len(header)) % 8)
+        dups = [array(t) for t in _HISTORY_AGGREGATE_DUP_COLUMNS]
+        for key in sorted(self.dups):
+            for sid, prod, soc in self.dups[key]:
+                for column, value in zip(dups, (key, sid, prod, soc)):
+                    column.append(value)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = path.with_name(path.name + ".tmp")
+        with tmp_file.open("wb") as fh:
+            fh.write(_HISTORY_AGGREGATE_MAGIC + len(header).to_bytes(8, "little") + header)
+            for c, base in enumerate(self._base):
+                pos = 0
+                for span in self._spans:
+                    fh.write(memoryview(base)[pos:span.start].cast("B"))
+                    fh.write(memoryview(span.columns[c]).cast("B"))
+                    pos = span.stop
+                fh.write(memoryview(base)[pos:].cast("B"))
+            for column in dups:
+                fh.write(memoryview(column).cast("B"))
+        tmp_file.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["HistoryProfileAggregate"]:
+        """Map a saved aggregate; None if there is none for this version. Raises ValueError if it is damaged."""
+        try:
+            with path.open("rb") as fh:
+                if fh.read(len(_HISTORY_AGGREGATE_MAGIC)) != _HISTORY_AGGREGATE_MAGIC:
+                    return None
+                header_size = int.from_bytes(fh.read(8), "little")
+                header = json.loads(fh.read(header_size))
+                backing = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+        if header.get("version") != HISTORY_PROFILE_CACHE_VERSION or header.get("byteorder") != sys.byteorder:
+            backing.close()
+            return None
+
+        agg = cls()
+        offset = len(_HISTORY_AGGREGATE_MAGIC) + 8 + header_size
+        views = []
+        for typecodes, count in ((_HISTORY_AGGREGATE_COLUMNS, header["rows"]),
+                                 (_HISTORY_AGGREGATE_DUP_COLUMNS, header["observations"])):
+            for typecode in typecodes:
+                size = count * array(typecode).itemsize
+                views.append(memoryview(backing)[offset:offset + size].cast(typecode))
+                offset += size
+        if offset != len(backing):
+            for view in views:
+                view.release()
+            backing.close()
+            raise ValueError(f"size {len(backing)} does not match its header ({offset})")
+
+        agg._base, agg._backing = views[:4], backing
+        for key, sid, prod, soc in zip(*views[4:]):
+            agg.dups.setdefault(key, []).append((sid, prod, soc))
+        for view in views[4:]:
+            view.release()
+        agg.rows = int(header["rows"])
+        agg.next_id = int(header["next_id"])
+        agg.sources = {name: dict(source) for name, source in header["sources"]}
+        for month, hour, count, total, hist, sketch in header["cells"]:
+            agg.prod_count[(month, hour)] = int(count)
+            agg.prod_sum[(month, hour)] = Fraction(total)
+            if hist:
+                agg.soc_hist[(month, hour)] = {float(soc): int(n) for soc, n in hist}
+            agg.prod_sketch[(month, hour)] = {int(bucket): int(n) for bucket, n in sketch}
+        agg.daily_peak = {int(day): float(peak) for day, peak in header["daily_peak"]}
+        return agg
+
+    def close(self) -> None:
+        """Unmap the saved file; the aggregate must not be edited or saved afterwards."""
+        if self._backing is not None:
+            for view in self._base:
+                view.release()
+            self._backing.close()
+            self._backing = None
+            self._base = [array(t) for t in _HISTORY_AGGREGATE_COLUMNS]
+
+
+def _parse_history_files(parse: Any, paths: List[str], parallel: bool = False) -> List[Any]:
+    """
+    parse(fp) for every path, in order. Files are independent until the dedup step, so with parallel,
+    more than one file and HISTORY_WORKERS != 1 they are spread over a forked process pool; each worker
+    sends back its compact per-timestamp arrays and the caller does the single cross-file reduce.
+    Only the startup build may ask for parallel: forking while other threads run can leave a child
+    blocked forever on a lock one of them held (stdout, logging), so the pool is refused then.
+    """
+    workers = min(HISTORY_WORKERS or os.cpu_count() or 1, len(paths)) if parallel else 1
+    if workers > 1 and threading.active_count() > 1:
+        print("[History] Other threads are running; parsing sequentially instead of forking workers.")
+        workers = 1
+    if workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+        try:
+            # fork: workers inherit the loaded module instead of re-importing solar.py (and its hardware setup).
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork")) as pool:
+                return list(pool.map(parse, paths))
+        except (OSError, BrokenProcessPool) as err:
+            print(f"[History] Parallel parse failed ({err}); parsing sequentially.")
+    return [parse(fp) for fp in paths]
+
+
+def _merge_history_aggregate(history_dir: str, stats: Dict[str, Optional[Dict[str, int]]],
+                             aggregate_path: Optional[Path],
+                             parallel: bool = False) -> Tuple[Dict[str, Any], Dict[str, Any], int]:
+    """Fold new/changed/removed exports into the persisted aggregate; returns (profile, sources, files merged)."""
+    aggregate = HistoryProfileAggregate()
+    if aggregate_path is not None:
+        try:
+            aggregate = HistoryProfileAggregate.load(aggregate_path) or aggregate
+        except (OSError, KeyError, TypeError, ValueError, IndexError) as err:
+            print(f"[History] Ignoring unreadable profile aggregate {aggregate_path}: {err}")
+    try:
+        return _merge_history_sources(history_dir, stats, aggregate, aggregate_path, parallel)
+    finally:
+        aggregate.close()
+
+
+def _merge_history_sources(history_dir: str, stats: Dict[str, Optional[Dict[str, int]]],
+                           aggregate: HistoryProfileAggregate,
+                           aggregate_path: Optional[Path],
+                           parallel: bool) -> Tuple[Dict[str, Any], Dict[str, Any], int]:
+    removed = [name for name in aggregate.sources if stats.get(name) is None]
+    pending: List[Tuple[str, Dict[str, Any]]] = []
+    for name, stat in stats.items():
+        known = aggregate.sources.get(name)
+        if stat is None or _history_same_file(known, stat):
+            continue
+        fp = os.path.join(history_dir, name)
+        fingerprint: Dict[str, Any] = dict(stat)
+        try:
+            fingerprint["sha256"] = _history_file_sha256(fp)
+        except OSError as err:
+            print(f"[History] Failed loading {fp}: {err}")
+            continue
+        if known is not None and known.get("sha256") == fingerprint["sha256"]:
+            # Touched but not modified: keep the merged rows, refresh the recorded fingerprint.
+            known.update(fingerprint)
+            continue
+        pending.append((name, fingerprint))
+
+    parsed = _parse_history_files(_parse_history_file, [os.path.join(history_dir, name) for name, _ in pending], parallel)
+    # Only the days the removed, replaced and new exports cover are read back from the saved aggregate.
+    ranges = [aggregate.source_range(name) for name in removed + [name for name, _ in pending]]
+    ranges += [HistoryProfileAggregate.parsed_range(rows) for rows in parsed]
+    aggregate.load_days([r for r in ranges if r is not None])
 
-        month_hour_prod[month][hour].append(prod)
-        month_hour_soc[month][hour].append(soc)
+    for name in removed:
+        aggregate.remove_source(name)
+    for (name, fingerprint), rows in zip(pending, parsed):
+        aggregate.add_source(name, fingerprint, rows)
 
-        if day_key not in month_daily_peaks[month] or prod > month_daily_peaks[month][day_key]:
-            month_daily_peaks[month][day_key] = prod
+    if aggregate_path is not None:
+        try:
+            aggregate.save(aggregate_path)
+            # Superseded by the binary file: the JSON aggregate written by earlier versions.
+            aggregate_path.with_suffix(".json").unlink(missing_ok=True)
+        except OSError as err:
+            print(f"[History] Could not write profile aggregate {aggregate_path}: {err}")
+    return aggregate.profile(len(stats)), aggregate.sources, len(removed) + len(pending)
+
+
+def _history_columns_numpy(fp: str) -> Optional[Tuple[Any, Any, Any, int]]:
+    """(minute_keys, prod, soc, invalid_rows) for one export, converted column-wise with NumPy."""
+    stamp_col: List[str] = []
+    prod_col: List[Any] = []
+    soc_col: List[Any] = []
+    invalid_rows = 0
+    try:
+        for record in _iter_history_records(fp):
+            if record is None:
+                invalid_rows += 1
+                continue
+            stamp_col.append(str(record[0]).strip())
+            prod_col.append(record[1])
+            soc_col.append(record[2])
+    except TypeError:
+        print(f"[History] Ignoring non-list JSON payload in {fp}")
+        return None
+    except Exception as err:
+        print(f"[History] Failed loading {fp}: {err}")
+        return None
+
+    count = len(stamp_col)
+    stamps = np.array(stamp_col or [""])[:count]
+    keys = np.zeros(count, dtype=np.int64)
+    valid = np.zeros(count, dtype=bool)
+
+    # Fixed-width "YYYY/MM/DD HH:MM" stamps are decoded from their code points in bulk;
+    # anything else goes through the same _history_minute_key as the python engine.
+    width = stamps.dtype.itemsize // 4
+    fast = np.char.str_len(stamps) == 16 if width >= 16 else np.zeros(count, dtype=bool)
+    if fast.any():
+        chars = stamps[fast].view(np.uint32).reshape(-1, width)[:, :16].astype(np.int64) - ord("0")
+        digits = chars[:, [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15]]
+        ok = (
+            ((digits >= 0) & (digits <= 9)).all(axis=1)
+            & (chars[:, 4] == ord("/") - ord("0")) & (chars[:, 7] == ord("/") - ord("0"))
+            & (chars[:, 10] == ord(" ") - ord("0")) & (chars[:, 13] == ord(":") - ord("0"))
+        )
+        year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+        month = digits[:, 4] * 10 + digits[:, 5]
+        day = digits[:, 6] * 10 + digits[:, 7]
+        hour = digits[:, 8] * 10 + digits[:, 9]
+        minute = digits[:, 10] * 10 + digits[:, 11]
+        leap = ((year % 4 == 0) & (year % 100 != 0)) | (year % 400 == 0)
+        month_days = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[np.clip(month, 0, 12)]
+        month_days = month_days + ((month == 2) & leap)
+        ok &= (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days) & (hour <= 23) & (minute <= 59)
+        idx = np.flatnonzero(fast)
+        keys[idx] = ((year * 100 + month) * 100 + day) * 10000 + hour * 100 + minute
+        valid[idx] = ok
+        fast[idx[~ok]] = False
+    for i in np.flatnonzero(~fast):
+        key = _history_minute_key(str(stamps[i]))
+        if key is not None:
+            keys[i] = key
+            valid[i] = True
+
+    def column(raw: List[Any], upper: float) -> Any:
+        try:
+            values = np.array(["0" if v in (None, "") else str(v) for v in raw] or ["0"])[:count].astype(np.float64)
+        except ValueError:
+            values = np.array([_history_float(v, 0.0) for v in raw], dtype=np.float64)
+        values = np.clip(values, 0.0, upper)
+        values[np.isnan(values)] = 0.0
+        return values
+
+    prod = column(prod_col, 25000.0)
+    soc = column(soc_col, 100.0)
+    invalid_rows += int((~valid).sum())
+    return keys[valid], prod[valid], soc[valid], invalid_rows
+
+
+def _group_medians_numpy(sorted_keys: Any, values: Any, starts: Any, counts: Any) -> Any:
+    """Per-key median of values (statistics.median semantics) for key-sorted groups."""
+    ordered = values[np.lexsort((values, sorted_keys))]
+    upper = ordered[starts + counts // 2]
+    lower = ordered[starts + np.maximum(counts - 1, 0) // 2]
+    return np.where(counts % 2 == 1, upper, (lower + upper) / 2)
+
+
+def _build_historical_profile_numpy(history_dir: str, stats: Dict[str, Optional[Dict[str, int]]],
+                                    parallel: bool = False) -> Dict[str, Any]:
+    """Vectorized from-scratch build: same profile as the python engine, up to float summation order."""
+    key_cols, prod_cols, soc_cols = [], [], []
+    invalid_rows = 0
+    paths = [os.path.join(history_dir, name) for name, stat in stats.items() if stat is not None]
+    for columns in _parse_history_files(_history_columns_numpy, paths, parallel):
+        if columns is None:
+            continue
+        key_cols.append(columns[0])
+        prod_cols.append(columns[1])
+        soc_cols.append(columns[2])
+        invalid_rows += columns[3]
+
+    keys = np.concatenate(key_cols) if key_cols else np.zeros(0, dtype=np.int64)
+    if not len(keys):
+        return {}
+    prod = np.concatenate(prod_cols)
+    soc = np.concatenate(soc_cols)
+
+    # Canonicalize each timestamp to its median across overlapping download windows.
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    minute_keys, starts, counts = np.unique(sorted_keys, return_index=True, return_counts=True)
+    prod_med = _group_medians_numpy(sorted_keys, prod[order], starts, counts)
+    soc_med = _group_medians_numpy(sorted_keys, soc[order], starts, counts)
+
+    month = minute_keys // 1000000 % 100
+    hour = minute_keys // 100 % 100
+    cell = (month - 1) * 24 + hour
+    cell_count = np.bincount(cell, minlength=288)
+    cell_mean = np.bincount(cell, weights=prod_med, minlength=288) / np.maximum(cell_count, 1)
+
+    buckets = np.full(len(prod_med), HISTORY_SKETCH_ZERO, dtype=np.int64)
+    lit = prod_med >= 1.0
+    buckets[lit] = np.ceil(np.log(prod_med[lit]) / HISTORY_SKETCH_LOG_GAMMA).astype(np.int64)
+    cell_buckets, bucket_counts = np.unique(cell * 4096 + (buckets - HISTORY_SKETCH_ZERO), return_counts=True)
+    sketches: Dict[int, Dict[int, int]] = defaultdict(dict)
+    for packed, n in zip(cell_buckets.tolist(), bucket_counts.tolist()):
+        sketches[packed // 4096][packed % 4096 + HISTORY_SKETCH_ZERO] = n
+
+    days, day_starts = np.unique(minute_keys // 10000, return_index=True)
+    day_peaks = np.maximum.reduceat(prod_med, day_starts)
+    day_month = days // 100 % 100
+    evening = hour >= 16
 
     profile: Dict[str, Any] = {
         "months": {},
-        "files": len(files),
-        "parsed_rows": parsed_rows,
-        "invalid_rows": invalid_rows,
-        "unique_timestamps": len(canonical),
-        "duplicate_timestamps": duplicate_timestamps,
+        "files": len(stats),
+        "parsed_rows": int(len(keys)),
+        "invalid_rows": int(invalid_rows),
+        "unique_timestamps": int(len(minute_keys)),
+        "duplicate_timestamps": int((counts > 1).sum()),
     }
 
-    for month in range(1, 13):
-        hourly_prod = month_hour_prod.get(month, {})
-        if not hourly_prod:
+    for m in range(1, 13):
+        hourly_mean = {h: float(cell_mean[(m - 1) * 24 + h]) for h in range(24) if cell_count[(m - 1) * 24 + h]}
+        if not hourly_mean:
             continue
 
-        daily_peaks = list(month_daily_peaks.get(month, {}).values())
+        daily_peaks = day_peaks[day_month == m].tolist()
         monthly_peak_p75 = (
             statistics.quantiles(daily_peaks, n=4)[2]
             if len(daily_peaks) >= 4
             else (max(daily_peaks) if daily_peaks else 0.0)
         )
 
-        daylight_hours = [h for h, vals in hourly_prod.items() if vals and statistics.mean(vals) >= 350]
+        daylight_hours = [h for h, mean in hourly_mean.items() if mean >= 350]
         solar_start_hour = min(daylight_hours) if daylight_hours else 8
         solar_end_hour = max(daylight_hours) if daylight_hours else 15
 
-        midday_hours = [h for h in range(10, 15) if h in hourly_prod and hourly_prod[h]]
+        midday_hours = [h for h in range(10, 15) if h in hourly_mean]
         if midday_hours:
-            midday_avg = statistics.mean([statistics.mean(hourly_prod[h]) for h in midday_hours])
+            midday_avg = statistics.mean([hourly_mean[h] for h in midday_hours])
         else:
-            midday_avg = statistics.mean([statistics.mean(v) for v in hourly_prod.values() if v])
-
-        evening_hours = [h for h in range(16, 24) if h in month_hour_soc.get(month, {})]
-        evening_soc_values: List[float] = []
-        for h in evening_hours:
-            evening_soc_values.extend(month_hour_soc[month][h])
+            midday_avg = statistics.mean(hourly_mean.values())
 
+        evening_soc = np.sort(soc_med[evening & (month == m)]).tolist()
         evening_soc_p40 = (
-            statistics.quantiles(evening_soc_values, n=5)[1]
-            if len(evening_soc_values) >= 5
-            else (statistics.mean(evening_soc_values) if evening_soc_values else 45.0)
+            _sorted_quantile(evening_soc, 5, 2)
+            if len(evening_soc) >= 5
+            else (statistics.mean(evening_soc) if evening_soc else 45.0)
         )
 
-        profile["months"][month] = {
+        profile["months"][m] = {
             "solar_start_hour": int(solar_start_hour),
             "solar_end_hour": int(solar_end_hour),
             "daylight_span": int(max(0, solar_end_hour - solar_start_hour + 1)),
             "midday_avg": float(midday_avg),
             "daily_peak_p75": float(monthly_peak_p75),
             "evening_soc_p40": float(evening_soc_p40),
-            "hourly_prod_mean": {str(h): float(statistics.mean(vals)) for h, vals in hourly_prod.items() if vals},
+            "hourly_prod_mean": {str(h): mean for h, mean in hourly_mean.items()},
         }
+        profile["months"][m].update(_hourly_prod_bands({h: sketches[(m - 1) * 24 + h] for h in hourly_mean}))
+
+    return profile
+
+
+def _history_profile_from_artifact(artifact: Optional[Dict[str, Any]],
+                                   stats: Dict[str, Optional[Dict[str, int]]]) -> Optional[Dict[str, Any]]:
+    """The cached profile if the artifact was compiled from exactly these files (by size and mtime)."""
+    if artifact is None or not isinstance(artifact.get("profile"), dict):
+        return None
+    sources = artifact.get("sources", {})
+    if len(sources) != len(stats) or not all(_history_same_file(sources.get(name), stat) for name, stat in stats.items()):
+        return None
+    profile = dict(artifact["profile"])
+    # JSON object keys are strings; the rest of the code indexes months by int.
+    profile["months"] = {int(m): cfg for m, cfg in profile.get("months", {}).items()}
+    return profile
+
+
+def build_historical_profile(history_dir: str = "solarman_json", parallel: bool = False) -> Dict[str, Any]:
+    """
+    Build month-level and hour-level production profile from downloaded Solarman JSON exports.
+    Robust behaviors:
+    - tolerates malformed files/rows,
+    - deduplicates overlaps on exact timestamp (same minute),
+    - avoids overweighting duplicate download windows,
+    - clamps obviously broken values.
+    The compiled profile is cached next to history_dir keyed by each file's size, mtime and sha256.
+    New, changed or removed files are merged into the persisted aggregate; other files are not re-read.
+    parallel lets the parse fork worker processes; only pass it while no other thread is running.
+    """
+    stats = _history_file_stats(history_dir)
+    if not stats:
+        print(f"[History] No history files found in {history_dir}. Using static defaults.")
+        return {}
+
+    cache_paths = _history_profile_cache_paths(history_dir)
+    if cache_paths is not None:
+        profile = _history_profile_from_artifact(_history_cache_read(cache_paths[0]), stats)
+        if profile is not None:
+            print(
+                f"[History] Profile loaded from {cache_paths[0]} | files={profile.get('files')} "
+                f"unique_ts={profile.get('unique_timestamps')} months={sorted(profile['months'].keys())}"
+            )
+            return profile
+
+    if HISTORY_ENGINE == "numpy" and np is not None:
+        profile = _build_historical_profile_numpy(history_dir, stats, parallel)
+        sources: Dict[str, Any] = {name: stat for name, stat in stats.items() if stat is not None}
+        merged = len(sources)
+    else:
+        profile, sources, merged = _merge_history_aggregate(
+            history_dir, stats, cache_paths[1] if cache_paths else None, parallel
+        )
+    if cache_paths is not None:
+        _history_cache_write(cache_paths[0], {
+            "version": HISTORY_PROFILE_CACHE_VERSION,
+            "sources": sources,
+            "profile": profile,
+        })
+    if not profile:
+        print("[History] All rows were invalid or empty. Using static defaults.")
+        return {}
 
     print(
         f"[History] Profile ready from {profile['files']} files | parsed={profile['parsed_rows']} "
         f"invalid={profile['invalid_rows']} unique_ts={profile['unique_timestamps']} "
-        f"dup_ts={profile['duplicate_timestamps']} months={sorted(profile['months'].keys())}"
+        f"dup_ts={profile['duplicate_timestamps']} months={sorted(profile['months'].keys())} "
+        f"merged={merged}/{len(stats)}"
     )
     return profile
 
 
+def _install_historical_profile(profile: Dict[str, Any]) -> None:
+    """Swap in a freshly built profile; readers take the global once per decision, never a half-built one."""
+    global historical_profile, historical_profile_version
+    historical_profile = profile
+    historical_profile_version += 1
+    bridge_day_memo.invalidate("profile")
+
+
+def _history_watch_loop(history_dir: str) -> None:
+    """Merge new or changed exports into the running profile without a restart."""
+    seen = _history_file_stats(history_dir)
+    pending = False
+    while True:
+        time.sleep(HISTORY_WATCH_SECONDS)
+        try:
+            stats = _history_file_stats(history_dir)
+            if stats != seen:
+                # Wait for one quiet interval so a download still being written is not parsed half-way.
+                seen = stats
+                pending = True
+                continue
+            if not pending:
+                continue
+            pending = False
+            _install_historical_profile(build_historical_profile(history_dir))
+            print(f"[History] Installed updated profile (version {historical_profile_version}).")
+        except Exception as err:
+            print(f"[History] Watcher error: {err}")
+
+
 def _interpolate_month_config(target_month: int, months_cfg: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
     """Interpolate missing month values from nearest available months (circular calendar distance)."""
     if target_month in months_cfg:
@@ -825,218 +2515,685 @@ def _interpolate_month_config(target_month: int, months_cfg: Dict[int, Dict[str,
     return out
 
 
-def _interpolate_hourly_profile_for_month(target_month: int, months_cfg: Dict[int, Dict[str, Any]]) -> Dict[str, float]:
-    """Builds an interpolated hourly PV profile for a month (0..23) from nearby months."""
-    if target_month in months_cfg:
-        direct = months_cfg[target_month].get("hourly_prod_mean", {})
-        if isinstance(direct, dict) and direct:
-            return {str(int(k)): float(v) for k, v in direct.items()}
+class HourlyProfile:
+    """
+    Month x hour production profile (W) as one flat 12x24 float array, NaN where a month has no
+    value for an hour. Parsed once from the JSON months config; month_json() adapts a month back to
+    the {"hour": watts} shape hist and the dashboard use.
+    """
+
+    def __init__(self, values: Optional[array] = None) -> None:
+        self.values = values if values is not None else array("d", [math.nan]) * (12 * 24)
+
+    @classmethod
+    def from_months(cls, months_cfg: Dict[int, Dict[str, Any]], field: str = "hourly_prod_mean") -> "HourlyProfile":
+        profile = cls()
+        for m, cfg in months_cfg.items():
+            hourly = cfg.get(field, {}) if isinstance(cfg, dict) else {}
+            if not isinstance(hourly, dict):
+                continue
+            for h_raw, p_raw in hourly.items():
+                try:
+                    m_i, h = int(m), int(h_raw)
+                    p = float(p_raw)
+                except (TypeError, ValueError):
+                    continue
+                if 1 <= m_i <= 12 and 0 <= h <= 23:
+                    profile.values[(m_i - 1) * 24 + h] = p
+        return profile
+
+    def month(self, month: int) -> List[float]:
+        return self.values[(month - 1) * 24:month * 24].tolist()
+
+    def has_month(self, month: int) -> bool:
+        return any(not math.isnan(p) for p in self.values[(month - 1) * 24:month * 24])
+
+    def interpolated(self, target_month: int) -> List[float]:
+        """24 hourly values for a month; months without data blend the others by circular month distance."""
+        if self.has_month(target_month):
+            return self.month(target_month)
+
+        weighted = [0.0] * 24
+        weights = [0.0] * 24
+        for m in range(1, 13):
+            if m == target_month or not self.has_month(m):
+                continue
+            w = 1.0 / min((target_month - m) % 12, (m - target_month) % 12)
+            for h, p in enumerate(self.values[(m - 1) * 24:m * 24]):
+                if not math.isnan(p):
+                    weighted[h] += w * max(0.0, p)
+                    weights[h] += w
+        return [weighted[h] / weights[h] if weights[h] > 0 else math.nan for h in range(24)]
+
+    @staticmethod
+    def to_json(hourly: List[float]) -> Dict[str, float]:
+        return {str(h): p for h, p in enumerate(hourly) if not math.isnan(p)}
+
+    def month_json(self, month: int) -> Dict[str, float]:
+        return self.to_json(self.interpolated(month))
+
+
+PV_TABLE_DAYS = 366
+PV_TABLE_MINUTES = 1440
+_PV_TABLE_MAGIC = b"PVT1"
+# Rows follow a leap-year calendar so Feb 29 has its own row; index = month, 1-based.
+_PV_TABLE_MONTH_ROW = [0, 0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335]
+_PV_TABLE_MONTH_DAYS = [0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+
+def _hourly_minute_curve(hourly: List[float]) -> List[float]:
+    """Expected PV for each minute of the day: linear between hourly means, flat through hour 23."""
+    curve: List[float] = []
+    for h0 in range(24):
+        p0 = hourly[h0]
+        p0 = 0.0 if math.isnan(p0) else max(0.0, p0)
+        p1 = hourly[min(23, h0 + 1)]
+        p1 = p0 if math.isnan(p1) else max(0.0, p1)
+        curve.extend(p0 + (p1 - p0) * (minute / 60.0) for minute in range(60))
+    return curve
+
+
+def _deficit_prefix(day_values: Any, load_w: float) -> Tuple[array, array]:
+    deficits = [max(0.0, load_w - pv) for pv in day_values]
+    cum = array("d", accumulate((d / 60.0 for d in deficits), initial=0.0))
+    next_full = array("i", [PV_TABLE_MINUTES]) * (PV_TABLE_MINUTES + 1)
+    full = PV_TABLE_MINUTES
+    for i in range(PV_TABLE_MINUTES - 1, -1, -1):
+        if deficits[i] <= 1e-6:
+            full = i
+        next_full[i] = full
+    return cum, next_full
+
+
+class PvExpectationTable:
+    """
+    Expected PV watts for every (day of year, minute of day): 366x1440 float32, row-major.
+    Each day row blends the two nearest month profiles linearly between mid-month points, so the
+    expectation drifts smoothly across month boundaries. A lookup is one index into values.
+    """
+
+    def __init__(self, values: Any, digest: bytes, backing: Optional[mmap.mmap] = None) -> None:
+        self.values = values  # array("f"), or a float32 memoryview over the mapped file
+        self.digest = digest
+        self._backing = backing
+        self._prefix: Dict[Tuple[int, float], Tuple[array, array]] = {}
+
+    def at(self, dt: datetime) -> float:
+        return self.values[(_PV_TABLE_MONTH_ROW[dt.month] + dt.day - 1) * PV_TABLE_MINUTES + dt.hour * 60 + dt.minute]
+
+    def deficit_prefix(self, dt: datetime, load_w: float) -> Tuple[array, array]:
+        """
+        For dt's day at load_w: cum[i] = deficit energy (Wh) over minutes [0, i), and next_full[i] = the
+        first minute >= i where PV covers the load (PV_TABLE_MINUTES if none). Cached per (day, load).
+        """
+        row = _PV_TABLE_MONTH_ROW[dt.month] + dt.day - 1
+        cached = self._prefix.get((row, load_w))
+        if cached is None:
+            base = row * PV_TABLE_MINUTES
+            if len(self._prefix) >= 64:
+                self._prefix.clear()
+            cached = self._prefix[(row, load_w)] = _deficit_prefix(self.values[base:base + PV_TABLE_MINUTES], load_w)
+        return cached
+
+    def row(self, dt: datetime) -> Any:
+        base = (_PV_TABLE_MONTH_ROW[dt.month] + dt.day - 1) * PV_TABLE_MINUTES
+        return self.values[base:base + PV_TABLE_MINUTES]
+
+    @staticmethod
+    def month_curves(profile: HourlyProfile) -> Optional[List[List[float]]]:
+        """Per-minute curves for months 1..12 (missing months interpolated), None without any data."""
+        if not any(profile.has_month(m) for m in range(1, 13)):
+            return None
+        return [_hourly_minute_curve(profile.interpolated(m)) for m in range(1, 13)]
+
+    @staticmethod
+    def curves_digest(curves: List[List[float]]) -> bytes:
+        digest = hashlib.sha256()
+        for curve in curves:
+            digest.update(array("d", curve).tobytes())
+        return digest.digest()
+
+    @classmethod
+    def build(cls, curves: List[List[float]]) -> "PvExpectationTable":
+        centres = [_PV_TABLE_MONTH_ROW[m] + _PV_TABLE_MONTH_DAYS[m] / 2.0 for m in range(1, 13)]
+        values = array("f")
+        for row in range(PV_TABLE_DAYS):
+            pos = row + 0.5
+            a = bisect.bisect_right(centres, pos) - 1  # -1: before mid-January, blend from December
+            b = (a + 1) % 12
+            start = centres[a] if a >= 0 else centres[11] - PV_TABLE_DAYS
+            end = centres[b] if b > a else centres[b] + PV_TABLE_DAYS
+            w = (pos - start) / (end - start)
+            values.extend([x + (y - x) * w for x, y in zip(curves[a], curves[b])])
+        return cls(values, cls.curves_digest(curves))
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = path.with_name(path.name + ".tmp")
+        with tmp_file.open("wb") as fh:
+            fh.write(_PV_TABLE_MAGIC + self.digest)
+            fh.write(memoryview(self.values).cast("B"))
+        tmp_file.replace(path)
+
+    @classmethod
+    def load(cls, path: Path, digest: bytes) -> Optional["PvExpectationTable"]:
+        """Memory-map a saved table if it was built from the same month curves."""
+        header = len(_PV_TABLE_MAGIC) + len(digest)
+        try:
+            with path.open("rb") as fh:
+                if fh.read(header) != _PV_TABLE_MAGIC + digest:
+                    return None
+                backing = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        view = memoryview(backing)[header:]
+        if len(view) != PV_TABLE_DAYS * PV_TABLE_MINUTES * 4:
+            view.release()
+            backing.close()
+            return None
+        return cls(view.cast("f"), digest, backing)
+
+
+# Views derived from the installed historical profile, keyed by (kind, key); all are dropped as soon as
+# historical_profile_version moves (_install_historical_profile), so a reload needs no explicit flush.
+_profile_views: Dict[Tuple[str, Any], Any] = {}
+_profile_views_version = -1
+_profile_views_lock = threading.RLock()
+_profile_views_stats = {"hits": 0, "misses": 0}
+
+
+def _profile_view(kind: str, key: Any, build: Any) -> Any:
+    global _profile_views_version
+    with _profile_views_lock:
+        if _profile_views_version != historical_profile_version:
+            _profile_views.clear()
+            _profile_views_version = historical_profile_version
+        if (kind, key) in _profile_views:
+            _profile_views_stats["hits"] += 1
+        else:
+            _profile_views_stats["misses"] += 1
+            _profile_views[(kind, key)] = build()
+        return _profile_views[(kind, key)]
+
+
+def _month_config(month: int) -> Dict[str, Any]:
+    """_interpolate_month_config of the installed profile, computed once per (profile version, month)."""
+    cfg = _profile_view(
+        "month_config", month, lambda: _interpolate_month_config(month, (historical_profile or {}).get("months", {}))
+    )
+    return dict(cfg)
+
+
+def _month_hourly_prod(month: int, field: str = "hourly_prod_mean") -> Dict[str, float]:
+    """JSON hourly profile of a month (interpolated if missing), computed once per (profile version, month)."""
+    return dict(_profile_view("month_hourly", (field, month), lambda: _hourly_profile(field).month_json(month)))
+
+
+def _hourly_profile(field: str = "hourly_prod_mean") -> HourlyProfile:
+    """HourlyProfile of a months field of the installed historical profile, parsed once per version."""
+    return _profile_view(
+        "hourly", field, lambda: HourlyProfile.from_months((historical_profile or {}).get("months", {}), field)
+    )
+
+
+def _pv_table_path(field: str) -> Optional[Path]:
+    cache_paths = _history_profile_cache_paths(HISTORY_DIR)
+    if cache_paths is None:
+        return None
+    artifact = cache_paths[0]
+    return artifact.with_name(f"{artifact.stem}.pv_{field.replace('hourly_prod_', '')}.f32")
+
+
+def _pv_expectation_table(field: str = "hourly_prod_mean") -> Optional[PvExpectationTable]:
+    """PV table for the installed historical profile, mapped from disk or built once per profile version."""
+    return _profile_view("pv_table", field, lambda: _load_or_build_pv_table(field))
+
+
+def _load_or_build_pv_table(field: str) -> Optional[PvExpectationTable]:
+    curves = PvExpectationTable.month_curves(_hourly_profile(field))
+    if curves is None:
+        return None
+    path = _pv_table_path(field)
+    digest = PvExpectationTable.curves_digest(curves)
+    table = PvExpectationTable.load(path, digest) if path is not None else None
+    if table is None:
+        table = PvExpectationTable.build(curves)
+        if path is not None:
+            try:
+                table.save(path)
+            except OSError as err:
+                print(f"[History] Could not save PV table {path}: {err}")
+    return table
+
+
+# Haurwitz clear-sky GHI (W/m^2) = 1098 * cos(z) * exp(-0.057 / cos(z)); scaled to the array by the
+# month's p75 daily production peak, and dimmed by Kasten-Czeplak: 1 - 0.75 * (cloud fraction)^3.4.
+_pv_day_curves: "OrderedDict[Tuple[Any, ...], PvDayCurve]" = OrderedDict()
+_pv_day_curves_lock = threading.Lock()
+
+
+class PvDayCurve(PvExpectationTable):
+    """
+    One day's minute-level PV expectation: the historical table row blended with a cloud-scaled
+    clear-sky curve for that date. Other dates fall through to the historical table, so the
+    estimators can use it wherever they take a PvExpectationTable.
+    """
+
+    def __init__(self, day: date_cls, values: array, base: PvExpectationTable) -> None:
+        super().__init__(values, hashlib.sha256(base.digest + values.tobytes()).digest())
+        self.day = day
+        self.base = base
+
+    def _own(self, dt: datetime) -> bool:
+        return dt.day == self.day.day and dt.month == self.day.month and dt.year == self.day.year
+
+    def at(self, dt: datetime) -> float:
+        if self._own(dt):
+            return self.values[dt.hour * 60 + dt.minute]
+        return self.base.at(dt)
+
+    def deficit_prefix(self, dt: datetime, load_w: float) -> Tuple[array, array]:
+        if not self._own(dt):
+            return self.base.deficit_prefix(dt, load_w)
+        cached = self._prefix.get((0, load_w))
+        if cached is None:
+            cached = self._prefix[(0, load_w)] = _deficit_prefix(self.values, load_w)
+        return cached
+
+    def row(self, dt: datetime) -> Any:
+        return self.values if self._own(dt) else self.base.row(dt)
+
+    @classmethod
+    def build(cls, day: date_cls, base: PvExpectationTable, peak_w: float,
+              clouds_pct: float) -> Optional["PvDayCurve"]:
+        sun = solar_day(day)
+        if sun is None:
+            return None
+        ghi = []
+        for elevation in sun.elevation:
+            cos_z = math.sin(math.radians(elevation))
+            ghi.append(1098.0 * cos_z * math.exp(-0.057 / cos_z) if cos_z > 0.01 else 0.0)
+        clear_peak = max(ghi)
+        if clear_peak <= 0.0 or peak_w <= 0.0:
+            return None
+        cloud_factor = 1.0 - 0.75 * (max(0.0, min(100.0, clouds_pct)) / 100.0) ** 3.4
+        scale = PV_CLEARSKY_WEIGHT * cloud_factor * peak_w / clear_peak
+        keep = 1.0 - PV_CLEARSKY_WEIGHT
+        history = base.row(datetime(day.year, day.month, day.day))
+        return cls(day, array("f", [keep * h + scale * g for h, g in zip(history, ghi)]), base)
 
-    blended: Dict[int, float] = defaultdict(float)
-    weights: Dict[int, float] = defaultdict(float)
-    for m, cfg in months_cfg.items():
-        hourly = cfg.get("hourly_prod_mean", {}) if isinstance(cfg, dict) else {}
-        if not isinstance(hourly, dict) or not hourly:
-            continue
-        dist = min((target_month - m) % 12, (m - target_month) % 12)
-        if dist == 0:
-            dist = 0.5
-        w = 1.0 / dist
-        for h_raw, p_raw in hourly.items():
-            try:
-                h = max(0, min(23, int(h_raw)))
-                p = max(0.0, float(p_raw))
-            except (TypeError, ValueError):
-                continue
-            blended[h] += w * p
-            weights[h] += w
 
-    return {str(h): (blended[h] / weights[h]) for h in sorted(weights.keys()) if weights[h] > 0}
+def _cloud_bucket(clouds_pct: Optional[float]) -> Optional[float]:
+    """Cloud forecast rounded to 10%, or None when the clear-sky blend is not used."""
+    if clouds_pct is None or PV_CLEARSKY_WEIGHT <= 0.0:
+        return None
+    return float(round(_safe_float(clouds_pct, 0.0) / 10.0) * 10)
 
 
-def _pv_estimate_at(dt: datetime, hourly_profile: Dict[str, Any]) -> float:
-    """Linear interpolation between hourly means for smoother bridge estimation."""
-    if not hourly_profile:
-        return 0.0
-    h0 = dt.hour
-    h1 = min(23, h0 + 1)
-    p0 = max(0.0, _safe_float(hourly_profile.get(str(h0), 0.0), 0.0))
-    p1 = max(0.0, _safe_float(hourly_profile.get(str(h1), p0), p0))
-    frac = dt.minute / 60.0
-    return p0 + (p1 - p0) * frac
+def _pv_expectation(now: datetime, field: str = "hourly_prod_mean",
+                    clouds_pct: Optional[float] = None) -> Optional[PvExpectationTable]:
+    """
+    PV expectation shared by the estimators: today's blended clear-sky/history curve when a cloud
+    forecast is known (and MY_PV_CLEARSKY_WEIGHT > 0), otherwise the historical table. The day curve
+    is built once per (profile version, date, band, 10% cloud bucket).
+    """
+    table = _pv_expectation_table(field)
+    clouds = _cloud_bucket(clouds_pct)
+    if table is None or clouds is None:
+        return table
+    day = now.date()
+    key = (historical_profile_version, table.digest, day, clouds)
+    with _pv_day_curves_lock:
+        curve = _pv_day_curves.get(key)
+    if curve is None:
+        peak_w = _safe_float(_month_config(day.month).get("daily_peak_p75"), 0.0)
+        curve = PvDayCurve.build(day, table, peak_w, clouds)
+        if curve is None:
+            return table
+        with _pv_day_curves_lock:
+            _pv_day_curves[key] = curve
+            while len(_pv_day_curves) > 8:
+                _pv_day_curves.popitem(last=False)
+    return curve
+
+
+def _bridge_window(sunrise_dt: datetime) -> Tuple[datetime, int, int]:
+    """Modeled bridge window: sunrise (whole minute) and its minute-of-day bounds, 12 h capped at midnight."""
+    start = sunrise_dt.replace(second=0, microsecond=0)
+    i0 = start.hour * 60 + start.minute
+    return start, i0, min(PV_TABLE_MINUTES, i0 + 12 * 60)
 
 
-def _estimate_full_supply_and_energy(sunrise_dt: datetime, now: datetime,
-                                     hourly_profile: Dict[str, Any]) -> Tuple[Optional[datetime], float]:
-    """Returns expected full-supply timestamp and needed bridge energy from sunrise."""
-    if not hourly_profile:
-        return None, 0.0
+def _full_supply_minute(start: datetime, i0: int, i1: int, now: datetime, next_full: array) -> int:
+    """
+    We need a future full-supply point for runtime start-guard decisions: the first modeled minute
+    of the day at or after now where PV covers the miner (>= i1 when there is none in the window).
+    """
+    if now.date() < start.date():
+        first = i0
+    elif now.date() > start.date():
+        first = i1
+    else:
+        first = max(i0, now.hour * 60 + now.minute + (1 if now.second or now.microsecond else 0))
+    return next_full[first] if first < i1 else PV_TABLE_MINUTES
 
-    start = sunrise_dt.replace(second=0, microsecond=0)
-    end = (start + timedelta(hours=12)).replace(second=0, microsecond=0)
-    t = start
-    step_min = 5
-    needed_wh = 0.0
-    full_supply_dt: Optional[datetime] = None
-
-    while t < end:
-        pv = _pv_estimate_at(t, hourly_profile)
-        deficit = max(0.0, MINER_POWER_W - pv)
-        # We need a future full-supply point for runtime start-guard decisions.
-        if full_supply_dt is None and t >= now and deficit <= 1e-6:
-            full_supply_dt = t
-            break
-        needed_wh += deficit * (step_min / 60.0)
-        t += timedelta(minutes=step_min)
 
-    if full_supply_dt is None:
-        # if we never reach full feed in modeled window, use conservative future fallback
-        base = max(now, sunrise_dt).replace(second=0, microsecond=0)
-        full_supply_dt = base + timedelta(hours=3)
-    return full_supply_dt, max(0.0, needed_wh)
+def _full_supply_dt(sunrise_dt: datetime, now: datetime, full: int) -> datetime:
+    start, i0, i1 = _bridge_window(sunrise_dt)
+    if full < i1:
+        return start + timedelta(minutes=full - i0)
+    # if we never reach full feed in modeled window, use conservative future fallback
+    return max(now, sunrise_dt).replace(second=0, microsecond=0) + timedelta(hours=3)
+
 
+class BridgeDayMemo:
+    """
+    Day-level bridge guard quantities memoized per day key: the historical profile version, the
+    production band, MINER_POWER_W and the sunrise minute; a different day key drops all entries.
+    The cloud forecast is applied after the day lookup: each 10% cloud bucket of the day keeps its
+    deficit prefix sums, and the needs (needed Wh, needed minutes) are kept per full-supply minute,
+    which only moves in steps as now advances.
+    """
 
-def _estimate_minutes_for_energy_budget(sunrise_dt: datetime, hourly_profile: Dict[str, Any],
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day_key: Optional[Tuple[int, str, float, datetime]] = None
+        self._prefix: Dict[Optional[float], Tuple[array, array]] = {}
+        self._entries: Dict[Tuple[Optional[float], int], Tuple[float, float]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.last_invalidation: Optional[str] = None
+
+    def invalidate(self, reason: str) -> None:
+        with self._lock:
+            self._invalidate_locked(reason)
+
+    def _invalidate_locked(self, reason: str) -> None:
+        if self._day_key is not None or self._entries:
+            self.invalidations += 1
+            self.last_invalidation = reason
+        self._day_key = None
+        self._prefix = {}
+        self._entries = {}
+
+    def daily_needs(self, sunrise_dt: datetime, now: datetime, field: str, clouds: Optional[float],
+                    pv_table: Optional[PvExpectationTable]) -> Tuple[Optional[datetime], float, float]:
+        """
+        (estimated full-supply time, daily needed bridge Wh, daily needed bridge minutes). pv_table is
+        _pv_expectation(now, field, clouds), with clouds already bucketed (_cloud_bucket).
+        """
+        if pv_table is None:
+            return None, 0.0, 0.0
+
+        start, i0, i1 = _bridge_window(sunrise_dt)
+        day_key = (historical_profile_version, field, MINER_POWER_W, start)
+        with self._lock:
+            if day_key != self._day_key:
+                if self._day_key is not None:
+                    previous = self._day_key
+                    reason = "profile" if previous[0] != day_key[0] else (
+                        "band" if previous[1] != day_key[1] else (
+                            "miner_power" if previous[2] != day_key[2] else "sunrise"))
+                    self._invalidate_locked(reason)
+                self._day_key = day_key
+            prefix = self._prefix.get(clouds)
+        if prefix is None:
+            prefix = pv_table.deficit_prefix(start, MINER_POWER_W)
+            with self._lock:
+                if self._day_key == day_key:
+                    self._prefix[clouds] = prefix
+        cum, next_full = prefix
+        full = _full_supply_minute(start, i0, i1, now, next_full)
+        with self._lock:
+            needs = self._entries.get((clouds, full))
+            if needs is not None:
+                self.hits += 1
+        if needs is None:
+            needed_wh = max(0.0, cum[min(full, i1)] - cum[i0])
+            needed_minutes = (
+                _estimate_minutes_for_energy_budget(sunrise_dt, pv_table, needed_wh)
+                if needed_wh > 0 else 0.0
+            )
+            needs = (needed_wh, needed_minutes)
+            with self._lock:
+                self.misses += 1
+                if self._day_key == day_key:
+                    self._entries[(clouds, full)] = needs
+        return _full_supply_dt(sunrise_dt, now, full), needs[0], needs[1]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "invalidations": self.invalidations,
+                "last_invalidation": self.last_invalidation,
+                "entries": len(self._entries),
+                "cloud_variants": len(self._prefix),
+                "sunrise": self._day_key[3].isoformat() if self._day_key else None,
+            }
+
+
+bridge_day_memo = BridgeDayMemo()
+
+
+def _estimate_minutes_for_energy_budget(sunrise_dt: datetime, pv_table: Optional[PvExpectationTable],
                                         energy_budget_wh: float) -> float:
     """Estimate bridge minutes from sunrise until a given energy budget is consumed."""
-    if not hourly_profile or energy_budget_wh <= 0:
+    if pv_table is None or energy_budget_wh <= 0:
         return 0.0
 
-    start = sunrise_dt.replace(second=0, microsecond=0)
-    end = (start + timedelta(hours=12)).replace(second=0, microsecond=0)
-    t = start
-    step_min = 5
-    spent_wh = 0.0
-
-    while t < end:
-        pv = _pv_estimate_at(t, hourly_profile)
-        deficit = max(0.0, MINER_POWER_W - pv)
-        step_wh = deficit * (step_min / 60.0)
-        if spent_wh + step_wh >= energy_budget_wh:
-            if step_wh <= 1e-9:
-                break
-            frac = (energy_budget_wh - spent_wh) / step_wh
-            return max(0.0, (t - start).total_seconds() / 60.0 + frac * step_min)
-        spent_wh += step_wh
-        t += timedelta(minutes=step_min)
-
-    return max(0.0, (end - start).total_seconds() / 60.0)
+    start, i0, i1 = _bridge_window(sunrise_dt)
+    cum = pv_table.deficit_prefix(start, MINER_POWER_W)[0]
+    target = cum[i0] + energy_budget_wh
+    i = bisect.bisect_left(cum, target, i0 + 1, i1 + 1)
+    if i > i1:
+        return float(i1 - i0)
+    step_wh = cum[i] - cum[i - 1]
+    if step_wh <= 1e-9:
+        return float(i1 - i0)
+    return max(0.0, (i - 1 - i0) + (target - cum[i - 1]) / step_wh)
 
 
 def _estimate_bridge_energy_between(start_dt: datetime, end_dt: datetime,
-                                    hourly_profile: Dict[str, Any]) -> float:
+                                    pv_table: Optional[PvExpectationTable]) -> float:
     """Estimate required bridge energy (Wh) between two timestamps."""
-    if not hourly_profile or not isinstance(start_dt, datetime) or not isinstance(end_dt, datetime):
+    if pv_table is None or not isinstance(start_dt, datetime) or not isinstance(end_dt, datetime):
         return 0.0
 
     start = start_dt.replace(second=0, microsecond=0)
     end = end_dt.replace(second=0, microsecond=0)
-    if end <= start:
-        return 0.0
-
-    t = start
-    step_min = 5
     needed_wh = 0.0
-
-    while t < end:
-        next_t = min(t + timedelta(minutes=step_min), end)
-        pv = _pv_estimate_at(t, hourly_profile)
-        deficit = max(0.0, MINER_POWER_W - pv)
-        needed_wh += deficit * ((next_t - t).total_seconds() / 3600.0)
-        t = next_t
+    # One prefix-sum difference per calendar day touched (normally just today).
+    while start < end:
+        next_day = (start + timedelta(days=1)).replace(hour=0, minute=0)
+        i = start.hour * 60 + start.minute
+        j = PV_TABLE_MINUTES if end >= next_day else end.hour * 60 + end.minute
+        cum = pv_table.deficit_prefix(start, MINER_POWER_W)[0]
+        needed_wh += cum[j] - cum[i]
+        start = next_day
 
     return max(0.0, needed_wh)
 
 
-def _telemetry_context_for_history(now: datetime) -> Dict[str, Any]:
-    """Recent telemetry context (fresh/runtime signal) to blend with long-range Solarman history."""
-    items = list(telemetry_history)
-    if not items:
-        return {
-            "samples": 0,
-            "fresh_midday_pv": 0.0,
-            "fresh_charge_rate_pct_per_hour": 0.0,
-            "fresh_clouds": 100.0,
-            "fresh_soc_floor": 0.0,
-            "fresh_month_quality": "neutral",
-            "confidence": 0.0,
-        }
+def _sorted_median(values: List[float]) -> float:
+    """statistics.median for an already sorted list, without the re-sort."""
+    n = len(values)
+    i = n // 2
+    return values[i] if n % 2 else (values[i - 1] + values[i]) / 2
 
-    points: List[Dict[str, Any]] = []
-    for rec in items[-1200:]:  # cap scan cost
-        try:
-            ts = datetime.fromisoformat(str(rec.get("ts", "")))
-        except Exception:
-            continue
-        if ts.tzinfo is None:
-            ts = ts.replace(tzinfo=budapest_tz)
 
-        # Prefer fresh data from the same month and within ~10 days.
-        age_h = (now - ts).total_seconds() / 3600.0
-        if age_h < 0 or age_h > 24 * 10:
-            continue
-        if ts.month != now.month:
-            continue
+def _sorted_quantile(values: List[float], n: int, i: int) -> float:
+    """Return statistics.quantiles(values, n=n)[i - 1] (exclusive method) for a sorted list."""
+    ld = len(values)
+    m = ld + 1
+    j = i * m // n
+    j = 1 if j < 1 else ld - 1 if j > ld - 1 else j
+    delta = i * m - j * n
+    return (values[j - 1] * (n - delta) + values[j] * delta) / n
 
-        points.append({
-            "ts": ts,
-            "battery": _safe_float(rec.get("battery"), 0.0),
-            "power": _safe_float(rec.get("power"), 0.0),
-            "clouds": _safe_float(rec.get("clouds"), 100.0),
-        })
 
-    if len(points) < 8:
-        return {
-            "samples": len(points),
-            "fresh_midday_pv": 0.0,
-            "fresh_charge_rate_pct_per_hour": 0.0,
-            "fresh_clouds": 100.0,
-            "fresh_soc_floor": 0.0,
-            "fresh_month_quality": "neutral",
-            "confidence": 0.2 if points else 0.0,
-        }
+def _sorted_remove(values: List[float], value: float) -> None:
+    del values[bisect.bisect_left(values, value)]
+
+
+class TelemetryContextWindow:
+    """
+    Rolling 10-day, same-month window over telemetry for _telemetry_context_for_history.
+    Rows are pushed as they are recorded and evicted as they age out; sorted value lists
+    (bisect insert/remove) keep the medians and the SOC-floor quantile current, so a query
+    never rescans history. Rebuilt from the in-memory buffer on month change, on a query
+    for an earlier time, or after an out-of-order row.
+    """
 
-    points.sort(key=lambda x: x["ts"])
-    midday = [x["power"] for x in points if 10 <= x["ts"].hour <= 14]
-    fresh_midday_pv = statistics.median(midday) if midday else statistics.median([x["power"] for x in points])
+    WINDOW_US = 24 * 10 * 3600 * 10 ** 6
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, month: Optional[int]) -> None:
+        self.month = month
+        self.now_us: Optional[int] = None
+        # (epoch_us, battery, power, clouds, local hour), oldest first.
+        self.points: deque = deque()
+        # Charge rate of each consecutive point pair (None when filtered out), aligned with points.
+        self.pair_rates: deque = deque()
+        self.power: List[float] = []
+        self.midday_power: List[float] = []
+        self.clouds: List[float] = []
+        self.active_soc: List[float] = []
+        self.charge_rates: List[float] = []
+
+    @staticmethod
+    def _point(row: Mapping) -> Tuple[int, float, float, float, int]:
+        return (
+            row.epoch_us,
+            _safe_float(row.get("battery"), 0.0),
+            _safe_float(row.get("power"), 0.0),
+            _safe_float(row.get("clouds"), 100.0),
+            row.local_dt.hour,
+        )
 
-    charge_rates: List[float] = []
-    for i in range(1, len(points)):
-        p0 = points[i - 1]
-        p1 = points[i]
-        dt_h = (p1["ts"] - p0["ts"]).total_seconds() / 3600.0
+    @staticmethod
+    def _pair_rate(p0: Tuple, p1: Tuple) -> Optional[float]:
+        dt_h = (p1[0] - p0[0]) / 10 ** 6 / 3600.0
         if dt_h <= 0 or dt_h > 0.5:
-            continue
-        if max(p0["power"], p1["power"]) < 700:
-            continue
-        rate = (p1["battery"] - p0["battery"]) / dt_h
-        if 0.05 <= rate <= 18:
-            charge_rates.append(rate)
+            return None
+        if max(p0[2], p1[2]) < 700:
+            return None
+        rate = (p1[1] - p0[1]) / dt_h
+        return rate if 0.05 <= rate <= 18 else None
+
+    def _push(self, point: Tuple) -> None:
+        if self.points:
+            rate = self._pair_rate(self.points[-1], point)
+            self.pair_rates.append(rate)
+            if rate is not None:
+                bisect.insort(self.charge_rates, rate)
+        self.points.append(point)
+        _, battery, power, clouds, hour = point
+        bisect.insort(self.power, power)
+        bisect.insort(self.clouds, clouds)
+        if 10 <= hour <= 14:
+            bisect.insort(self.midday_power, power)
+        if 9 <= hour <= 18:
+            bisect.insort(self.active_soc, battery)
+
+    def _pop_oldest(self) -> None:
+        _, battery, power, clouds, hour = self.points.popleft()
+        if self.pair_rates:
+            rate = self.pair_rates.popleft()
+            if rate is not None:
+                _sorted_remove(self.charge_rates, rate)
+        _sorted_remove(self.power, power)
+        _sorted_remove(self.clouds, clouds)
+        if 10 <= hour <= 14:
+            _sorted_remove(self.midday_power, power)
+        if 9 <= hour <= 18:
+            _sorted_remove(self.active_soc, battery)
+
+    def observe(self, row: Mapping) -> None:
+        """Push a freshly recorded row (ignored until the first refresh picks a month)."""
+        epoch_us = row.epoch_us
+        with self._lock:
+            if self.month is None or epoch_us is None:
+                return
+            if self.points and epoch_us < self.points[-1][0]:
+                self._reset(None)
+                return
+            if row.local_dt.month == self.month:
+                self._push(self._point(row))
+
+    def refresh(self, now: datetime, rows_source: "TelemetryBuffer") -> None:
+        """Bring the window to [now - 10 days, now] for now's month."""
+        now_us = (now - _EPOCH_EPOCH) // timedelta(microseconds=1)
+        lo_us = now_us - self.WINDOW_US
+        with self._lock:
+            stale = (
+                self.month != now.month
+                or self.now_us is None
+                or now_us < self.now_us
+                or (self.points and self.points[-1][0] > now_us)
+            )
+            if stale:
+                self._reset(now.month)
+                for row in rows_source.rows_between(lo_us / 1e6, (now_us + 1) / 1e6):
+                    if row.epoch_us is not None and lo_us <= row.epoch_us <= now_us and row.local_dt.month == now.month:
+                        self._push(self._point(row))
+            while self.points and self.points[0][0] < lo_us:
+                self._pop_oldest()
+            self.now_us = now_us
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = len(self.points)
+            if samples < 8:
+                return {
+                    "samples": samples,
+                    "fresh_midday_pv": 0.0,
+                    "fresh_charge_rate_pct_per_hour": 0.0,
+                    "fresh_clouds": 100.0,
+                    "fresh_soc_floor": 0.0,
+                    "fresh_month_quality": "neutral",
+                    "confidence": 0.2 if samples else 0.0,
+                }
+            fresh_midday_pv = _sorted_median(self.midday_power) if self.midday_power else _sorted_median(self.power)
+            fresh_charge_rate = _sorted_median(self.charge_rates) if self.charge_rates else 0.0
+            fresh_clouds = _sorted_median(self.clouds)
+            # Recent low-SOC behavior during active hours to shape reserve discipline.
+            active_soc = self.active_soc
+            fresh_soc_floor = _sorted_quantile(active_soc, 5, 2) if len(active_soc) >= 5 else (active_soc[0] if active_soc else 0.0)
+
+        if fresh_midday_pv >= 2300 and fresh_charge_rate >= 2.2 and fresh_clouds <= 70:
+            fresh_month_quality = "strong"
+        elif fresh_midday_pv <= 1500 or fresh_charge_rate <= 1.0 or fresh_clouds >= 85:
+            fresh_month_quality = "weak"
+        else:
+            fresh_month_quality = "neutral"
 
-    fresh_charge_rate = statistics.median(charge_rates) if charge_rates else 0.0
-    fresh_clouds = statistics.median([x["clouds"] for x in points])
+        confidence = min(1.0, samples / 120.0)
+        return {
+            "samples": samples,
+            "fresh_midday_pv": float(fresh_midday_pv),
+            "fresh_charge_rate_pct_per_hour": float(fresh_charge_rate),
+            "fresh_clouds": float(fresh_clouds),
+            "fresh_soc_floor": float(fresh_soc_floor),
+            "fresh_month_quality": fresh_month_quality,
+            "confidence": float(confidence),
+        }
 
-    # Recent low-SOC behavior during active hours to shape reserve discipline.
-    active_soc = [x["battery"] for x in points if 9 <= x["ts"].hour <= 18]
-    fresh_soc_floor = statistics.quantiles(active_soc, n=5)[1] if len(active_soc) >= 5 else (min(active_soc) if active_soc else 0.0)
 
-    if fresh_midday_pv >= 2300 and fresh_charge_rate >= 2.2 and fresh_clouds <= 70:
-        fresh_month_quality = "strong"
-    elif fresh_midday_pv <= 1500 or fresh_charge_rate <= 1.0 or fresh_clouds >= 85:
-        fresh_month_quality = "weak"
-    else:
-        fresh_month_quality = "neutral"
+telemetry_context_window = TelemetryContextWindow()
 
-    confidence = min(1.0, len(points) / 120.0)
-    return {
-        "samples": len(points),
-        "fresh_midday_pv": float(fresh_midday_pv),
-        "fresh_charge_rate_pct_per_hour": float(fresh_charge_rate),
-        "fresh_clouds": float(fresh_clouds),
-        "fresh_soc_floor": float(fresh_soc_floor),
-        "fresh_month_quality": fresh_month_quality,
-        "confidence": float(confidence),
-    }
+
+def _telemetry_context_for_history(now: datetime) -> Dict[str, Any]:
+    """Recent telemetry context (fresh/runtime signal) to blend with long-range Solarman history."""
+    telemetry_context_window.refresh(now, telemetry_history)
+    return telemetry_context_window.summary()
 
 
 def _history_recommendation(now: datetime, battery_charge: float, current_power: float,
@@ -1046,10 +3203,8 @@ def _history_recommendation(now: datetime, battery_charge: float, current_power:
     Creates dynamic decision hints from historical production behavior for current month.
     Blends long-range Solarman history with fresh runtime telemetry context.
     """
-    global historical_profile
-    months = (historical_profile or {}).get("months", {})
-    month_cfg = _interpolate_month_config(now.month, months)
-    interpolated_hourly = _interpolate_hourly_profile_for_month(now.month, months)
+    month_cfg = _month_config(now.month)
+    hourly_prod_mean = _month_hourly_prod(now.month)
     telem_ctx = _telemetry_context_for_history(now)
     wx = weather_outlook or {}
     wx5 = str(wx.get("summary_5d", "unknown")).lower()
@@ -1063,6 +3218,8 @@ def _history_recommendation(now: datetime, battery_charge: float, current_power:
             "should_preserve_battery": now.hour >= 15 and battery_charge < 80,
             "headroom_good": current_power >= 2500,
             "hourly_prod_mean": {},
+            "bridge_pv_band": BRIDGE_PV_BAND,
+            "bridge_hourly_prod": {},
             "predicted_minutes_to_full": None,
             "predicted_full_charge_time": None,
             "can_refill_before_sunset": False,
@@ -1130,7 +3287,8 @@ def _history_recommendation(now: datetime, battery_charge: float, current_power:
         and current_power < max(1400.0, 0.4 * daily_peak_p75)
     )
 
-    full_charge_pred = _predict_time_to_full_charge(now, battery_charge, current_power, sunrise_dt, sunset_dt, interpolated_hourly)
+    full_charge_pred = _predict_time_to_full_charge(now, battery_charge, current_power, sunrise_dt, sunset_dt,
+                                                    _pv_expectation(now, clouds_pct=wx.get("clouds_today_pct")))
 
     refill_confident_morning = False
     full_charge_time_raw = full_charge_pred.get("full_charge_time")
@@ -1171,7 +3329,12 @@ def _history_recommendation(now: datetime, battery_charge: float, current_power:
         "late_day_reserve_soc": late_day_reserve_soc,
         "should_preserve_battery": should_preserve_battery,
         "headroom_good": headroom_good,
-        "hourly_prod_mean": month_cfg.get("hourly_prod_mean", {}) or interpolated_hourly,
+        "hourly_prod_mean": hourly_prod_mean,
+        "bridge_pv_band": BRIDGE_PV_BAND,
+        # Empty for the "mean" band: the bridge guard then falls back to hourly_prod_mean.
+        "bridge_hourly_prod": (
+            {} if BRIDGE_PV_BAND == "mean" else _month_hourly_prod(now.month, f"hourly_prod_{BRIDGE_PV_BAND}")
+        ),
         "predicted_minutes_to_full": full_charge_pred.get("minutes_to_full"),
         "predicted_full_charge_time": full_charge_pred.get("full_charge_time"),
         "can_refill_before_sunset": bool(full_charge_pred.get("can_refill_before_sunset", False)),
@@ -1186,13 +3349,148 @@ def _history_recommendation(now: datetime, battery_charge: float, current_power:
         "weather_sunny_ratio_5d": float(wx.get("sunny_ratio_5d", 0.0)),
         "weather_bad_ratio_5d": float(wx.get("bad_ratio_5d", 0.0)),
         "weather_confidence": float(wx.get("confidence", 0.0)),
+        "weather_clouds_today_pct": wx.get("clouds_today_pct"),
         "weather_source": str(wx.get("source", "none")),
     }
 
 
+class P2Quantile:
+    """
+    P² streaming quantile estimator (Jain & Chlamtac, 1985): five markers, O(1) memory and
+    O(1) update. Exact while it has seen five values or fewer.
+    """
+
+    def __init__(self, p: float = 0.5):
+        self.p = p
+        self.n = 0
+        self.heights: List[float] = []
+        self.positions = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self.desired = [1.0, 1.0 + 2 * p, 1.0 + 4 * p, 3.0 + 2 * p, 5.0]
+        self.increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, x: float) -> None:
+        self.n += 1
+        q = self.heights
+        if self.n <= 5:
+            bisect.insort(q, x)
+            return
+
+        pos = self.positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(q, x) - 1
+        for i in range(k + 1, 5):
+            pos[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in (1, 2, 3):
+            d = self.desired[i] - pos[i]
+            if (d >= 1 and pos[i + 1] - pos[i] > 1) or (d <= -1 and pos[i - 1] - pos[i] < -1):
+                step = 1 if d > 0 else -1
+                parabolic = q[i] + step / (pos[i + 1] - pos[i - 1]) * (
+                    (pos[i] - pos[i - 1] + step) * (q[i + 1] - q[i]) / (pos[i + 1] - pos[i])
+                    + (pos[i + 1] - pos[i] - step) * (q[i] - q[i - 1]) / (pos[i] - pos[i - 1])
+                )
+                if q[i - 1] < parabolic < q[i + 1]:
+                    q[i] = parabolic
+                else:
+                    q[i] = q[i] + step * (q[i + step] - q[i]) / (pos[i + step] - pos[i])
+                pos[i] += step
+
+    def value(self) -> Optional[float]:
+        if self.n == 0:
+            return None
+        if self.n <= 5:
+            rank = self.p * (self.n - 1)
+            lo = int(math.floor(rank))
+            hi = min(lo + 1, self.n - 1)
+            return self.heights[lo] + (self.heights[hi] - self.heights[lo]) * (rank - lo)
+        return self.heights[2]
+
+
+def _charge_rate_between(prev: Mapping, cur: Mapping, month: int) -> Optional[float]:
+    """
+    Battery %/h between two consecutive telemetry rows, or None when the pair is not a clean
+    same-month charging segment (gap > 0.5 h, PV < 700 W, clouds > 90 %, implausible rate).
+    """
+    e0, e1 = prev.epoch_us, cur.epoch_us
+    if e0 is None or e1 is None or e1 <= e0:
+        return None
+
+    dt_h = (e1 - e0) / 10 ** 6 / 3600.0
+    if dt_h > 0.5 or cur.local_dt.month != month:
+        return None
+
+    b0 = _safe_float(prev.get("battery"), -1)
+    b1 = _safe_float(cur.get("battery"), -1)
+    if not (0 <= b0 <= 100 and 0 <= b1 <= 100):
+        return None
+
+    p0 = _safe_float(prev.get("power"), 0)
+    p1 = _safe_float(cur.get("power"), 0)
+    c0 = _safe_float(prev.get("clouds"), 100)
+    c1 = _safe_float(cur.get("clouds"), 100)
+
+    # Prefer segments where PV is meaningful and weather is not heavily overcast.
+    if max(p0, p1) < 700 or max(c0, c1) > 90:
+        return None
+
+    rate = (b1 - b0) / dt_h
+    return rate if 0.05 <= rate <= 18.0 else None
+
+
+class ChargeRateEstimator:
+    """
+    Per-calendar-month streaming median of the telemetry charge rate (%/h). A month's sketch
+    is seeded once from stored telemetry the first time it is asked for; after that every
+    appended row is paired with its predecessor and fed in O(1).
+    """
+
+    def __init__(self):
+        self.sketches: Dict[int, P2Quantile] = {}
+        self._prev_row: Optional[Mapping] = None
+
+    def reset(self, last_row: Optional[Mapping] = None) -> None:
+        self.sketches = {}
+        self._prev_row = last_row
+
+    def observe(self, row: Mapping) -> None:
+        prev, self._prev_row = self._prev_row, row
+        if prev is None or row.epoch_us is None:
+            return
+        month = row.local_dt.month
+        sketch = self.sketches.get(month)
+        if sketch is None:
+            return
+        rate = _charge_rate_between(prev, row, month)
+        if rate is not None:
+            sketch.add(rate)
+
+    def median(self, month: int) -> Optional[float]:
+        sketch = self.sketches.get(month)
+        if sketch is None:
+            sketch = P2Quantile(0.5)
+            rows = _telemetry_rows_for_month(month)
+            for i in range(1, len(rows)):
+                rate = _charge_rate_between(rows[i - 1], rows[i], month)
+                if rate is not None:
+                    sketch.add(rate)
+            self.sketches[month] = sketch
+        return sketch.value()
+
+
+charge_rate_estimator = ChargeRateEstimator()
+
+
 def _predict_time_to_full_charge(now: datetime, battery_charge: float, current_power: float,
                                  sunrise_dt: datetime, sunset_dt: datetime,
-                                 hourly_prod_mean: Dict[str, Any]) -> Dict[str, Any]:
+                                 pv_table: Optional[PvExpectationTable]) -> Dict[str, Any]:
     """
     Estimate minutes to 100% SOC based on recent telemetry trend and historical month profile.
     This is intentionally conservative: it only allows early-start relaxation when refill
@@ -1207,52 +3505,12 @@ def _predict_time_to_full_charge(now: datetime, battery_charge: float, current_p
             "rate_pct_per_hour": 0.0,
         }
 
-    # 1) Learn charge-rate from telemetry deltas (same month, daytime, positive charging periods).
-    rates: List[float] = []
-    hist_items = list(telemetry_history)
-    for i in range(1, len(hist_items)):
-        prev = hist_items[i - 1]
-        cur = hist_items[i]
-        try:
-            t0 = datetime.fromisoformat(str(prev.get("ts", "")))
-            t1 = datetime.fromisoformat(str(cur.get("ts", "")))
-        except Exception:
-            continue
-
-        if t0.tzinfo is None:
-            t0 = t0.replace(tzinfo=budapest_tz)
-        if t1.tzinfo is None:
-            t1 = t1.replace(tzinfo=budapest_tz)
-
-        if t1 <= t0 or t1.month != now.month:
-            continue
-
-        dt_h = (t1 - t0).total_seconds() / 3600.0
-        if dt_h <= 0 or dt_h > 0.5:
-            continue
-
-        b0 = _safe_float(prev.get("battery"), -1)
-        b1 = _safe_float(cur.get("battery"), -1)
-        if not (0 <= b0 <= 100 and 0 <= b1 <= 100):
-            continue
-
-        p0 = _safe_float(prev.get("power"), 0)
-        p1 = _safe_float(cur.get("power"), 0)
-        c0 = _safe_float(prev.get("clouds"), 100)
-        c1 = _safe_float(cur.get("clouds"), 100)
-
-        # Prefer segments where PV is meaningful and weather is not heavily overcast.
-        if max(p0, p1) < 700 or max(c0, c1) > 90:
-            continue
-
-        rate = (b1 - b0) / dt_h
-        if 0.05 <= rate <= 18.0:
-            rates.append(rate)
-
-    rate_pct_per_hour = statistics.median(rates) if rates else 0.0
+    # 1) Charge-rate from telemetry deltas (same month, daytime, positive charging periods),
+    # kept as a streaming per-month median.
+    rate_pct_per_hour = charge_rate_estimator.median(now.month) or 0.0
 
     # 2) Blend with profile confidence from expected hourly PV around "now".
-    expected_now_pv = _pv_estimate_at(now, hourly_prod_mean) if hourly_prod_mean else 0.0
+    expected_now_pv = pv_table.at(now) if pv_table is not None else 0.0
     if rate_pct_per_hour <= 0.0 and expected_now_pv > MINER_POWER_W * 0.8:
         # fallback conservative synthetic rate when telemetry is sparse
         rate_pct_per_hour = 2.8 if now.month in (4, 5, 6, 7, 8) else 1.8
@@ -1309,9 +3567,19 @@ def _compute_start_bridge_guard(now: datetime, battery_charge: float, current_po
     to bridge the period until typical PV can continuously feed the miner load.
     """
     min_stop_soc = float(hist.get("min_stop_soc", BATTERY_FLOOR_SOC))
-    hourly_prod_mean = hist.get("hourly_prod_mean", {}) if isinstance(hist, dict) else {}
-    if not isinstance(hourly_prod_mean, dict):
-        hourly_prod_mean = {}
+    # Bridge estimates follow the configured production band; older profiles without bands use the mean.
+    # With a cloud forecast this is today's blended clear-sky/history curve (see _pv_expectation).
+    bridge_pv_table = None
+    bridge_field = "hourly_prod_mean"
+    clouds = None
+    if isinstance(hist, dict) and hist.get("hourly_prod_mean"):
+        clouds = _cloud_bucket(hist.get("weather_clouds_today_pct"))
+        if hist.get("bridge_hourly_prod"):
+            bridge_field = f"hourly_prod_{hist.get('bridge_pv_band', 'mean')}"
+            bridge_pv_table = _pv_expectation(now, bridge_field, clouds)
+        if bridge_pv_table is None:
+            bridge_field = "hourly_prod_mean"
+            bridge_pv_table = _pv_expectation(now, bridge_field, clouds)
 
     capacity_wh = _effective_battery_capacity_wh(battery_voltage, battery_ah)
 
@@ -1327,12 +3595,9 @@ def _compute_start_bridge_guard(now: datetime, battery_charge: float, current_po
     guard_bridge_minutes = 999.0 if deficit_w <= 0 else (usable_wh / deficit_w) * 60.0
     current_bridge_minutes = 0.0 if deficit_w <= 0 else (bridge_usable_wh / deficit_w) * 60.0
 
-    estimated_full_supply_dt, daily_needed_bridge_wh = _estimate_full_supply_and_energy(
-        sunrise_dt, now, hourly_prod_mean
-    )
-    daily_needed_bridge_minutes = (
-        _estimate_minutes_for_energy_budget(sunrise_dt, hourly_prod_mean, daily_needed_bridge_wh)
-        if daily_needed_bridge_wh > 0 else 0.0
+    # Day-level needs only change with the profile, band, miner power, sunrise, cloud bucket or the full-supply minute.
+    estimated_full_supply_dt, daily_needed_bridge_wh, daily_needed_bridge_minutes = bridge_day_memo.daily_needs(
+        sunrise_dt, now, bridge_field, clouds, bridge_pv_table
     )
 
     eta_minutes = 999.0
@@ -1345,7 +3610,7 @@ def _compute_start_bridge_guard(now: datetime, battery_charge: float, current_po
 
         # Remaining requirement from now to full-supply moment for runtime safety checks.
         remaining_bridge_wh = (
-            _estimate_bridge_energy_between(now, estimated_full_supply_dt, hourly_prod_mean)
+            _estimate_bridge_energy_between(now, estimated_full_supply_dt, bridge_pv_table)
             if eta_minutes > 0.0 else 0.0
         )
     else:
@@ -1373,7 +3638,7 @@ def _compute_start_bridge_guard(now: datetime, battery_charge: float, current_po
         needed_bridge_wh = bms_window_wh
         needed_bridge_minutes = min(
             needed_bridge_minutes,
-            _estimate_minutes_for_energy_budget(sunrise_dt, hourly_prod_mean, needed_bridge_wh)
+            _estimate_minutes_for_energy_budget(sunrise_dt, bridge_pv_table, needed_bridge_wh)
         )
     remaining_bridge_wh = min(remaining_bridge_wh, bms_window_wh)
 
@@ -1439,6 +3704,7 @@ def _compute_start_bridge_guard(now: datetime, battery_charge: float, current_po
         "min_stop_soc": round(min_stop_soc, 2),
         "bms_floor_soc": round(bms_floor_soc, 2),
         "bms_window_wh": round(bms_window_wh, 2),
+        "pv_band": str(hist.get("bridge_pv_band", "mean")) if isinstance(hist, dict) else "mean",
     }
 
 def _runtime_info() -> str:
@@ -1507,6 +3773,8 @@ def notify_shutdown(reason: str = "normal", err: Exception = None):
 def _signal_handler(sig, frame):
     name = signal.Signals(sig).name if isinstance(sig, int) else str(sig)
     try:
+        # Queued state/telemetry writes must hit the disk before the hard exit below.
+        _flush_persistence()
         notify_shutdown(reason=f"signal {name}", err=None)
     finally:
         # Immediate exit after notifying
@@ -1766,9 +4034,8 @@ def process_message(message_text, battery, power, state, current_condition, sunr
             l3 = snap.get("inv_l3")
             lt = snap.get("inv_lt")
         try:
-            if (l1 is None or l2 is None or l3 is None or lt is None) and os.path.exists(SOLARMAN_FILE):
-                with open(SOLARMAN_FILE, 'r', encoding='utf-8') as f:
-                    saved = json.load(f)
+            if (l1 is None or l2 is None or l3 is None or lt is None) and _json_file_exists(SOLARMAN_FILE):
+                saved = _read_json_file(SOLARMAN_FILE)
                 phase = saved.get("phasePowers", {})
                 l1 = phase.get("L1") if l1 is None else l1
                 l2 = phase.get("L2") if l2 is None else l2
@@ -1904,9 +4171,8 @@ def process_message(message_text, battery, power, state, current_condition, sunr
 
     if message_text == "/phase":
         try:
-            if os.path.exists(SOLARMAN_FILE):
-                with open(SOLARMAN_FILE, 'r', encoding='utf-8') as f:
-                    saved = json.load(f)
+            if _json_file_exists(SOLARMAN_FILE):
+                saved = _read_json_file(SOLARMAN_FILE)
                 phase = saved.get("phasePowers")
                 ts = None
                 try:
@@ -1966,19 +4232,165 @@ def process_message(message_text, battery, power, state, current_condition, sunr
             send_telegram_message(f"✅ Wallet updated: {WALLET_ADDRESS}")
 
 
+# =========================
+# WRITE-BEHIND PERSISTENCE
+# =========================
+# The control loop only renders payloads and queues them; one worker thread does the file
+# I/O. File snapshots are coalesced per path (last write wins), telemetry records are
+# batched in order. fsync happens at most every PERSIST_FSYNC_SECONDS and on flush.
+_persist_cond = threading.Condition(threading.RLock())
+_persist_io_lock = threading.Lock()
+_persist_files: Dict[str, str] = {}
+_persist_files_inflight: Dict[str, str] = {}
+_persist_telemetry: List[Dict[str, Any]] = []
+_persist_dirty: set = set()
+_persist_store_dirty: bool = False
+_persist_last_fsync: float = 0.0
+_persist_thread: Optional[threading.Thread] = None
+
+
+def _ensure_persist_worker() -> None:
+    global _persist_thread
+    if _persist_thread is not None and _persist_thread.is_alive():
+        return
+    _persist_thread = threading.Thread(target=_persist_loop, name="persister", daemon=True)
+    _persist_thread.start()
+
+
+def _persist_file(path: str, text: str) -> None:
+    """Queue a full-file snapshot; a newer snapshot of the same path replaces a queued one."""
+    with _persist_cond:
+        _persist_files[str(path)] = text
+        _persist_cond.notify_all()
+    _ensure_persist_worker()
+
+
+def _persist_telemetry_record(record: Dict[str, Any]) -> None:
+    """Queue one telemetry record; blocks only if PERSIST_QUEUE_MAX records are already waiting."""
+    _ensure_persist_worker()
+    with _persist_cond:
+        while len(_persist_telemetry) >= PERSIST_QUEUE_MAX:
+            _persist_cond.wait(timeout=1.0)
+        _persist_telemetry.append(record)
+        _persist_cond.notify_all()
+
+
+def _pending_persist_text(path: str) -> Optional[str]:
+    """Latest queued (or currently being written) content for path, if any."""
+    with _persist_cond:
+        text = _persist_files.get(str(path))
+        return text if text is not None else _persist_files_inflight.get(str(path))
+
+
+def _read_json_file(path: str) -> Any:
+    """Read a JSON file as the persister will leave it: queued snapshots win over disk."""
+    text = _pending_persist_text(path)
+    if text is not None:
+        return json.loads(text)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _json_file_exists(path: str) -> bool:
+    return _pending_persist_text(path) is not None or os.path.exists(path)
+
+
+def _write_file_atomic(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_name(path.name + ".tmp")
+    with tmp_file.open("w", encoding="utf-8") as fh:
+        fh.write(text)
+    tmp_file.replace(path)
+
+
+def _fsync_path(path: Path) -> None:
+    for target in (path, path.parent):
+        fd = os.open(str(target), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _persist_drain(force_fsync: bool = False) -> None:
+    """Write everything queued so far, then fsync if the cadence (or force_fsync) says so."""
+    global _persist_files, _persist_files_inflight, _persist_store_dirty, _persist_last_fsync
+    with _persist_io_lock:
+        with _persist_cond:
+            files = _persist_files
+            records = list(_persist_telemetry)
+            _persist_files = {}
+            _persist_files_inflight = files
+            del _persist_telemetry[:]
+            _persist_cond.notify_all()
+        try:
+            for path, text in files.items():
+                try:
+                    _write_file_atomic(Path(path), text)
+                    _persist_dirty.add(Path(path))
+                except Exception as err:
+                    print(f"[Persist] Failed writing {path}: {err}")
+            if records:
+                if telemetry_store is not None:
+                    _persist_store_dirty = True
+                _persist_dirty.update(_append_telemetry_records(records))
+                last_ts = _parse_timestamp(records[-1].get("ts"))
+                try:
+                    _apply_telemetry_retention(datetime.now(tz=budapest_tz), last_ts.timestamp() if last_ts else float("inf"))
+                except Exception as err:
+                    print(f"[Telemetry] Retention pass failed: {err}")
+        finally:
+            with _persist_cond:
+                _persist_files_inflight = {}
+
+        due = time.monotonic() - _persist_last_fsync >= PERSIST_FSYNC_SECONDS
+        if (force_fsync or due) and (_persist_dirty or _persist_store_dirty):
+            for path in list(_persist_dirty):
+                try:
+                    _fsync_path(path)
+                except Exception as err:
+                    print(f"[Persist] fsync failed for {path}: {err}")
+            _persist_dirty.clear()
+            if _persist_store_dirty and telemetry_store is not None:
+                try:
+                    telemetry_store.sync()
+                except Exception as err:
+                    print(f"[Persist] Telemetry store sync failed: {err}")
+            _persist_store_dirty = False
+            _persist_last_fsync = time.monotonic()
+
+
+def _persist_loop() -> None:
+    while True:
+        with _persist_cond:
+            if not _persist_files and not _persist_telemetry:
+                _persist_cond.wait(timeout=max(1.0, PERSIST_FSYNC_SECONDS))
+        try:
+            _persist_drain()
+        except Exception as err:
+            print(f"[Persist] Write-behind worker error: {err}")
+            time.sleep(1)
+
+
+def _flush_persistence() -> None:
+    """Synchronously write and fsync everything queued (shutdown path)."""
+    try:
+        _persist_drain(force_fsync=True)
+    except Exception as err:
+        print(f"[Persist] Flush failed: {err}")
+
+
 def load_quote_usage():
-    if os.path.exists(QUOTE_FILE):
+    if _json_file_exists(QUOTE_FILE):
         try:
-            with open(QUOTE_FILE, 'r') as f:
-                return json.load(f).get('used_quote', 0)
+            return _read_json_file(QUOTE_FILE).get('used_quote', 0)
         except Exception:
             return 0
     return 0
 
 def save_quote_usage(used_quote_val: int):
     try:
-        with open(QUOTE_FILE, 'w') as f:
-            json.dump({'used_quote': used_quote_val}, f, indent=4)
+        _persist_file(QUOTE_FILE, json.dumps({'used_quote': used_quote_val}, indent=4))
     except Exception as e:
         print(f"Failed to persist quote usage: {e}")
 
@@ -2037,17 +4449,15 @@ def store_data(data, filename=SOLARMAN_FILE):
     try:
         out = dict(data) if isinstance(data, dict) else {"raw": data}
         out["phasePowers"] = _extract_phase_powers(out)
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(out, f, indent=4, ensure_ascii=False)
-        print(f"Data stored to {filename}")
+        _persist_file(filename, json.dumps(out, indent=4, ensure_ascii=False))
+        print(f"Data queued for {filename}")
     except Exception as e:
         print(f"[Warning] Failed to store data: {e}")
 
 def load_data(filename=SOLARMAN_FILE):
-    if os.path.exists(filename):
+    if _json_file_exists(filename):
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return _read_json_file(filename)
         except Exception as e:
             print(f"[Warning] Failed to load {filename}: {e}")
             return {}
@@ -2056,10 +4466,9 @@ def load_data(filename=SOLARMAN_FILE):
 
 def load_prev_state():
     global WALLET_ADDRESS, _last_production_start_at, _last_hashrate_restart_at, _last_force_shutdown_at
-    if os.path.exists(STATE_FILE):
+    if _json_file_exists(STATE_FILE):
         try:
-            with open(STATE_FILE, 'r') as f:
-                d = json.load(f)
+            d = _read_json_file(STATE_FILE)
         except Exception:
             return None, None
         wallet = _parse_wallet_address(d.get("wallet_address", WALLET_ADDRESS))
@@ -2088,10 +4497,9 @@ def save_prev_state(state_val, uptime_val):
     global WALLET_ADDRESS, _last_production_start_at, _last_hashrate_restart_at, _last_force_shutdown_at
     try:
         existing = {}
-        if os.path.exists(STATE_FILE):
+        if _json_file_exists(STATE_FILE):
             try:
-                with open(STATE_FILE, 'r') as f:
-                    existing = json.load(f) or {}
+                existing = _read_json_file(STATE_FILE) or {}
             except Exception:
                 existing = {}
         uptime_str = uptime_val.isoformat() if isinstance(uptime_val, datetime) else uptime_val
@@ -2103,11 +4511,137 @@ def save_prev_state(state_val, uptime_val):
             'last_hashrate_restart_at': _last_hashrate_restart_at.isoformat() if isinstance(_last_hashrate_restart_at, datetime) else None,
             'last_force_shutdown_at': _last_force_shutdown_at.isoformat() if isinstance(_last_force_shutdown_at, datetime) else None,
         })
-        with open(STATE_FILE, 'w') as f:
-            json.dump(existing, f, indent=4)
+        _persist_file(STATE_FILE, json.dumps(existing, indent=4))
     except Exception as e:
         print(f"[Warning] Failed to save prev state: {e}")
 
+# Sun position from the NOAA solar calculator equations (about a minute of accuracy for sunrise/sunset).
+SUN_ZENITH_RISE_SET = 90.833  # refraction + solar disc radius at the horizon
+SUNRISE_LEAD_MINUTES = 10
+SUNSET_LEAD_MINUTES = 90
+_solar_days: "OrderedDict[date_cls, SolarDay]" = OrderedDict()
+_solar_days_lock = threading.Lock()
+
+
+def _sun_declination_eqtime(jd: float) -> Tuple[float, float]:
+    """(solar declination in radians, equation of time in minutes) at a Julian day."""
+    t = (jd - 2451545.0) / 36525.0
+    l0 = math.radians((280.46646 + t * (36000.76983 + t * 0.0003032)) % 360.0)
+    m = math.radians(357.52911 + t * (35999.05029 - 0.0001537 * t))
+    e = 0.016708634 - t * (0.000042037 + 0.0000001267 * t)
+    center = (
+        math.sin(m) * (1.914602 - t * (0.004817 + 0.000014 * t))
+        + math.sin(2 * m) * (0.019993 - 0.000101 * t)
+        + math.sin(3 * m) * 0.000289
+    )
+    omega = math.radians(125.04 - 1934.136 * t)
+    apparent_long = math.radians(math.degrees(l0) + center - 0.00569 - 0.00478 * math.sin(omega))
+    obliquity = math.radians(
+        23.0 + (26.0 + (21.448 - t * (46.815 + t * (0.00059 - t * 0.001813))) / 60.0) / 60.0
+        + 0.00256 * math.cos(omega)
+    )
+    declination = math.asin(math.sin(obliquity) * math.sin(apparent_long))
+    y = math.tan(obliquity / 2.0) ** 2
+    eqtime = 4.0 * math.degrees(
+        y * math.sin(2 * l0) - 2 * e * math.sin(m) + 4 * e * y * math.sin(m) * math.cos(2 * l0)
+        - 0.5 * y * y * math.sin(4 * l0) - 1.25 * e * e * math.sin(2 * m)
+    )
+    return declination, eqtime
+
+
+class SolarDay:
+    """
+    Sunrise, sunset, solar noon and per-minute sun elevation for one local date at the configured
+    location. sunrise/sunset are None during polar day/night. elevation[i] is the sun elevation in
+    degrees at local minute i of the day.
+    """
+
+    def __init__(self, day: date_cls, lat: float, lon: float):
+        self.day = day
+        midnight = datetime(day.year, day.month, day.day, tzinfo=budapest_tz)
+        jd_noon = day.toordinal() + 1721424.5 + 0.5 - lon / 360.0
+
+        lat_r = math.radians(lat)
+
+        def event_utc_minutes(sign: int, jd: float) -> Optional[float]:
+            declination, eqtime = _sun_declination_eqtime(jd)
+            cos_ha = (
+                math.cos(math.radians(SUN_ZENITH_RISE_SET)) / (math.cos(lat_r) * math.cos(declination))
+                - math.tan(lat_r) * math.tan(declination)
+            )
+            if not -1.0 <= cos_ha <= 1.0:
+                return None
+            return 720.0 - 4.0 * (lon + sign * math.degrees(math.acos(cos_ha))) - eqtime
+
+        def to_local(utc_minutes: Optional[float]) -> Optional[datetime]:
+            if utc_minutes is None:
+                return None
+            utc = datetime(day.year, day.month, day.day, tzinfo=dt_timezone.utc) + timedelta(minutes=utc_minutes)
+            return utc.astimezone(budapest_tz).replace(microsecond=0)
+
+        noon_decl, noon_eqtime = _sun_declination_eqtime(jd_noon)
+        self.solar_noon = to_local(720.0 - 4.0 * lon - noon_eqtime)
+        # Refine each event with the sun's position at (roughly) that moment.
+        events = []
+        for sign in (1, -1):
+            first = event_utc_minutes(sign, jd_noon)
+            events.append(None if first is None else event_utc_minutes(sign, jd_noon + (first - 720.0) / 1440.0))
+        self.sunrise, self.sunset = to_local(events[0]), to_local(events[1])
+
+        # Elevation per local minute; declination/equation of time are taken at solar noon.
+        day_offset = _ts_day_offset(day.toordinal())
+        sin_lat, cos_lat = math.sin(lat_r), math.cos(lat_r)
+        sin_decl, cos_decl = math.sin(noon_decl), math.cos(noon_decl)
+        self.elevation = array("f")
+        for minute in range(PV_TABLE_MINUTES):
+            if day_offset is None:
+                offset = (midnight + timedelta(minutes=minute)).utcoffset().total_seconds()
+            else:
+                offset = day_offset
+            solar_minutes = minute - offset / 60.0 + noon_eqtime + 4.0 * lon
+            hour_angle = math.radians(solar_minutes / 4.0 - 180.0)
+            cos_zenith = sin_lat * sin_decl + cos_lat * cos_decl * math.cos(hour_angle)
+            self.elevation.append(90.0 - math.degrees(math.acos(max(-1.0, min(1.0, cos_zenith)))))
+
+    def elevation_at(self, dt: datetime) -> float:
+        return self.elevation[dt.hour * 60 + dt.minute]
+
+
+def solar_day(day: date_cls) -> Optional[SolarDay]:
+    """SolarDay for LOCATION_LAT/LON, computed once per local date (None if the location is unusable)."""
+    with _solar_days_lock:
+        cached = _solar_days.get(day)
+        if cached is not None:
+            _solar_days.move_to_end(day)
+            return cached
+    try:
+        lat, lon = float(LOCATION_LAT), float(LOCATION_LON)
+    except (TypeError, ValueError):
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        return None
+    computed = SolarDay(day, lat, lon)
+    with _solar_days_lock:
+        _solar_days[day] = computed
+        while len(_solar_days) > 8:
+            _solar_days.popitem(last=False)
+    return computed
+
+
+def _sun_window(now: datetime) -> Tuple[datetime, datetime]:
+    """
+    Operating window for the day: sunrise 10 min early, sunset 90 min early (as with the weather API
+    times), computed locally so weather outages do not move it. Falls back to 06:00/18:00.
+    """
+    sun = solar_day(now.date())
+    if sun is None or sun.sunrise is None or sun.sunset is None:
+        return now.replace(hour=6, minute=0, second=0), now.replace(hour=18, minute=0, second=0)
+    return (
+        sun.sunrise - timedelta(minutes=SUNRISE_LEAD_MINUTES),
+        sun.sunset - timedelta(minutes=SUNSET_LEAD_MINUTES),
+    )
+
+
 def get_current_weather(api_key, location_lat, location_lon):
     try:
         # Current
@@ -2119,11 +4653,6 @@ def get_current_weather(api_key, location_lat, location_lon):
 
         current_condition = d['weather'][0]['description'].lower()
         clouds = d['clouds']['all']
-        sunrise_ts = d['sys']['sunrise']
-        sunset_ts = d['sys']['sunset']
-
-        sunrise_dt = datetime.fromtimestamp(sunrise_ts, tz=budapest_tz) - timedelta(minutes=10)
-        sunset_dt = datetime.fromtimestamp(sunset_ts, tz=budapest_tz) - timedelta(minutes=90)
 
         # Forecast
         url = "https://api.openweathermap.org/data/2.5/forecast"
@@ -2145,12 +4674,12 @@ def get_current_weather(api_key, location_lat, location_lon):
         current_condition = "unknown"
         clouds = 0
         now = datetime.now(tz=budapest_tz)
-        sunrise_dt = now.replace(hour=6, minute=0, second=0)
-        sunset_dt = now.replace(hour=18, minute=0, second=0)
         f1_cond = "unknown"; f1_clouds = 0; f1_ts = now.strftime("%Y-%m-%d %H:%M:%S")
         f3_cond = "unknown"; f3_clouds = 0; f3_ts = (now + timedelta(hours=3)).strftime("%Y-%m-%d %H:%M:%S")
         outlook = _summarize_free_weather_outlook({"list": []}, now)
 
+    # Sun times are computed locally, so a failed request no longer shifts the day window.
+    sunrise_dt, sunset_dt = _sun_window(datetime.now(tz=budapest_tz))
     return (
         current_condition, sunrise_dt, sunset_dt, clouds,
         f1_cond, f1_clouds, f1_ts,
@@ -2267,17 +4796,517 @@ def check_hashrate_guard(now: datetime, effective_state: str) -> None:
         f"for {HASHRATE_LOW_STREAK_LIMIT} consecutive checks. "
         f"Wallet={wallet}, measured={measured_mhs:.2f} MH/s. Restarting miner."
     )
-    print(msg)
-    send_telegram_message(msg)
-    if is_rpi and GPIO_AVAILABLE:
-        press_power_button(16, POWER_BUTTON_LONG_PRESS_SECONDS)
-        time.sleep(15)
-        press_power_button(16, POWER_BUTTON_SHORT_PRESS_SECONDS)
-        _last_hashrate_restart_at = now
-        _hashrate_low_streak = 0
-        _restart_triggered_this_cycle = True
-        save_prev_state(prev_state, now)
-        send_telegram_message(f"✅ Hashrate guard restart sequence completed. Latest hashrate: {measured_mhs:.2f} MH/s.")
+    print(msg)
+    send_telegram_message(msg)
+    if is_rpi and GPIO_AVAILABLE:
+        press_power_button(16, POWER_BUTTON_LONG_PRESS_SECONDS)
+        time.sleep(15)
+        press_power_button(16, POWER_BUTTON_SHORT_PRESS_SECONDS)
+        _last_hashrate_restart_at = now
+        _hashrate_low_streak = 0
+        _restart_triggered_this_cycle = True
+        save_prev_state(prev_state, now)
+        send_telegram_message(f"✅ Hashrate guard restart sequence completed. Latest hashrate: {measured_mhs:.2f} MH/s.")
+
+
+class DecisionInputs:
+    """
+    Snapshot of everything one production decision reads: battery/inverter readings, weather
+    conditions, the sun window, the history recommendation and bridge guard computed from it,
+    the persisted and current state and the debounce bookkeeping carried over from the previous cycle.
+    """
+
+    __slots__ = (
+        "now", "battery_charge", "current_power",
+        "inv_l1", "inv_l2", "inv_l3", "inv_lt",
+        "current_condition", "f1_cond", "f3_cond", "sunrise", "sunset", "hist", "guard",
+        "prev_state", "state", "pending", "last_state_change_us",
+    )
+
+    def __init__(self, now: datetime, battery_charge: float, current_power: float,
+                 inv_l1: float, inv_l2: float, inv_l3: float, inv_lt: float,
+                 current_condition: str, f1_cond: str, f3_cond: str,
+                 sunrise: datetime, sunset: datetime, hist: Dict[str, Any], guard: Dict[str, Any],
+                 prev_state: Optional[str], state: Optional[str] = None,
+                 pending: Tuple[Optional[str], Optional[datetime], int] = (None, None, 0),
+                 last_state_change_us: Optional[int] = None):
+        self.now = now
+        self.battery_charge = battery_charge
+        self.current_power = current_power
+        self.inv_l1 = inv_l1
+        self.inv_l2 = inv_l2
+        self.inv_l3 = inv_l3
+        self.inv_lt = inv_lt
+        self.current_condition = current_condition
+        self.f1_cond = f1_cond
+        self.f3_cond = f3_cond
+        self.sunrise = sunrise
+        self.sunset = sunset
+        self.hist = hist
+        # _compute_start_bridge_guard output for this snapshot.
+        self.guard = guard
+        self.prev_state = prev_state
+        self.state = state
+        # (pending state, pending since, confirmations so far) of the transition debounce.
+        self.pending = pending
+        # Last persisted state change (epoch us) from the transition index, None if never.
+        self.last_state_change_us = last_state_change_us
+
+
+class Decision:
+    """
+    Outcome of evaluate_decision: the state to apply, rule hits, guard details and the side
+    effects the driver should perform (button press, notification kind, log lines).
+    """
+
+    __slots__ = (
+        "state", "summary", "start_rules", "stop_rules", "guard", "start_guard",
+        "press_seconds", "notify", "pending", "log",
+    )
+
+    def __init__(self, state: str, summary: str, start_rules: List[str], stop_rules: List[str],
+                 guard: Dict[str, Any], start_guard: Dict[str, Any],
+                 press_seconds: Optional[float], notify: Optional[str],
+                 pending: Tuple[Optional[str], Optional[datetime], int], log: List[str]):
+        self.state = state
+        self.summary = summary
+        self.start_rules = start_rules
+        self.stop_rules = stop_rules
+        # Bridge guard as computed, and after the sunny-day / morning-refill relaxations.
+        self.guard = guard
+        self.start_guard = start_guard
+        self.press_seconds = press_seconds
+        # "started", "stopped", "hard_cutoff", "power_safety" or None.
+        self.notify = notify
+        self.pending = pending
+        self.log = log
+
+    def hist_fields(self) -> Dict[str, Any]:
+        """start_guard_* and decision_* fields merged into the history recommendation."""
+        guard = self.guard
+        return {
+            "start_guard_allow": bool(guard.get("allow_start", False)),
+            "start_guard_reason": str(guard.get("reason", "unknown")),
+            "start_guard_bridge_minutes": float(guard.get("bridge_minutes", 0.0)),
+            "start_guard_eta_minutes": float(guard.get("eta_minutes", 0.0)),
+            "start_guard_capacity_wh": float(guard.get("capacity_wh", 0.0)),
+            "start_guard_battery_ah": float(guard.get("battery_ah", 0.0)),
+            "start_guard_battery_voltage": float(guard.get("battery_voltage", 0.0)),
+            "start_guard_usable_wh": float(guard.get("usable_wh", 0.0)),
+            "start_guard_soc_window_pct": float(guard.get("soc_window_pct", 0.0)),
+            "start_guard_min_stop_soc": float(guard.get("min_stop_soc", 0.0)),
+            "start_guard_bms_floor_soc": float(guard.get("bms_floor_soc", 20.0)),
+            "start_guard_bms_window_wh": float(guard.get("bms_window_wh", 0.0)),
+            "start_guard_needed_bridge_minutes": float(guard.get("needed_bridge_minutes", 0.0)),
+            "start_guard_needed_bridge_wh": float(guard.get("needed_bridge_wh", 0.0)),
+            "decision_state": self.state,
+            "decision_start_rules": self.start_rules,
+            "decision_stop_rules": self.stop_rules,
+            "decision_summary": self.summary,
+        }
+
+
+def evaluate_decision(inputs: DecisionInputs) -> Decision:
+    """
+    Production start/stop decision for one snapshot. Reads only its argument and configuration
+    constants: no sensor, network, disk, GPIO or Telegram access and no module state, so the same
+    snapshot always gives the same Decision and recorded snapshots can be replayed offline.
+    """
+    now = inputs.now
+    battery_charge = inputs.battery_charge
+    current_power = inputs.current_power
+    inv_l2, inv_l3, inv_lt = inputs.inv_l2, inputs.inv_l3, inputs.inv_lt
+    sunrise, sunset = inputs.sunrise, inputs.sunset
+    hist = inputs.hist
+    prev_state = inputs.prev_state
+    state = inputs.state
+    pending_state, pending_since, pending_hits = inputs.pending
+    log: List[str] = []
+    press_seconds: Optional[float] = None
+
+    guard = inputs.guard
+    start_guard = dict(guard)
+
+    solar_keywords = [
+        'sunny', 'clear', 'clear sky', 'scattered clouds', 'few clouds', 'broken clouds',
+        'partly cloudy', 'mostly sunny', 'sunshine', 'sunrise', 'sunset'
+    ]
+    non_solar_keywords = [
+        'rain', 'storm', 'thunder', 'snow', 'fog', 'haze',
+        'sleet', 'blizzard', 'dust', 'sand', 'ash', 'drizzle', 'shower', 'mist', 'smoke',
+        'tornado', 'hurricane', 'squall', 'lightning', 'moderate rain', 'heavy intensity rain', 'overcast'
+    ]
+
+    cond_now = str(inputs.current_condition).lower()
+    cond_f1 = str(inputs.f1_cond).lower()
+    cond_f3 = str(inputs.f3_cond).lower()
+    solar_now = any(k in cond_now for k in solar_keywords)
+    solar_f1 = any(k in cond_f1 for k in solar_keywords)
+    solar_f3 = any(k in cond_f3 for k in solar_keywords)
+    non_solar_now = any(k in cond_now for k in non_solar_keywords)
+    non_solar_f1 = any(k in cond_f1 for k in non_solar_keywords)
+    non_solar_f3 = any(k in cond_f3 for k in non_solar_keywords)
+
+    confident_sunny_bridge_start = (
+        bool(hist.get("refill_confident_morning", False))
+        and bool(hist.get("can_refill_before_sunset", False))
+        and bool(start_guard.get("energy_cover_ok", False))
+        and battery_charge >= (hist["min_stop_soc"] + 4)
+        and solar_now and solar_f1 and solar_f3
+        and not non_solar_now and not non_solar_f1 and not non_solar_f3
+        and now.hour < 11
+    )
+    if confident_sunny_bridge_start and not start_guard.get("allow_start", False):
+        start_guard["allow_start"] = True
+        start_guard["reason"] = "bridge_energy_confident_sunny_day_relaxation"
+
+    summer_clear_day = (
+        now.month in (5, 6, 7, 8)
+        and solar_now and solar_f1 and solar_f3
+        and not non_solar_now and not non_solar_f1 and not non_solar_f3
+    )
+    summer_fast_start = (
+        summer_clear_day
+        and battery_charge > hist["min_stop_soc"]
+        and bool(start_guard.get("energy_cover_ok", False))
+    )
+
+    aggressive_morning_refill_start = (
+        now.hour < 10
+        and battery_charge >= max(hist["min_stop_soc"] + 10, 42)
+        and bool(hist.get("can_refill_before_sunset", False))
+        and _safe_float(hist.get("predicted_minutes_to_full"), 9999) <= 240
+        and solar_now and solar_f1 and solar_f3
+        and not non_solar_now and not non_solar_f1 and not non_solar_f3
+        and str(hist.get("weather_risk_5d", "unknown")).lower() != "solar_weak"
+        and current_power >= max(150.0, MINER_POWER_W * 0.15)
+    )
+    if aggressive_morning_refill_start and not start_guard.get("allow_start", False):
+        start_guard["allow_start"] = True
+        start_guard["reason"] = "aggressive_morning_refill_start"
+
+    # Intelligent real-time start: require meaningful PV headroom and seasonal SOC discipline.
+    # This prevents autumn/winter starts from eating into battery recharge.
+    month_quality = str(hist.get("month_quality", "neutral")).lower()
+    weather_risk_5d = str(hist.get("weather_risk_5d", "unknown")).lower()
+    season_margin_w = 50 if month_quality == "strong" else (180 if month_quality == "neutral" else 350)
+    if weather_risk_5d == "solar_weak":
+        season_margin_w += 140
+    elif weather_risk_5d == "solar_friendly":
+        season_margin_w = max(30, season_margin_w - 40)
+    season_soc_floor = (
+        max(hist["min_stop_soc"] + 4, hist["early_start_soc"] - 6)
+        if month_quality == "strong"
+        else (max(hist["early_start_soc"] - 2, 52) if month_quality == "neutral" else max(hist["early_start_soc"], 68))
+    )
+    if weather_risk_5d == "solar_weak":
+        season_soc_floor = max(season_soc_floor, hist["min_stop_soc"] + 12)
+    season_time_ok = now.hour < (15 if month_quality == "strong" else (14 if month_quality == "neutral" else 12))
+    if weather_risk_5d == "solar_weak":
+        season_time_ok = season_time_ok and now.hour < 12
+    smart_bridge_pv_start = (
+        bool(start_guard.get("allow_start", False))
+        and current_power >= (MINER_POWER_W + season_margin_w)
+        and battery_charge >= season_soc_floor
+        and season_time_ok
+        and not hist.get("should_preserve_battery", False)
+    )
+    predictive_early_start = (
+        bool(start_guard.get("allow_start", False))
+        and bool(hist.get("can_refill_before_sunset", False))
+        and weather_risk_5d in {"solar_friendly", "mixed"}
+        and now.hour < 12
+        and battery_charge >= (hist["min_stop_soc"] + 6)
+        and current_power >= max(120.0, MINER_POWER_W * 0.10)
+    )
+    immediate_capacity_start = (
+        bool(start_guard.get("allow_start", False))
+        and now >= (sunrise - timedelta(minutes=30))
+        and now.hour < 15
+        and battery_charge >= (hist["min_stop_soc"] + 4)
+        and (
+            current_power >= max(100.0, MINER_POWER_W * 0.08)
+            or (
+                bool(hist.get("can_refill_before_sunset", False))
+                and _safe_float(hist.get("sunset_margin_minutes"), 0.0) >= 20.0
+            )
+        )
+    )
+
+    start_rule_hits: List[str] = []
+    stop_rule_hits: List[str] = []
+    pv_start_threshold = max(150.0, MINER_POWER_W * PV_COVERAGE_RATIO_START)
+    pv_stop_threshold = max(150.0, MINER_POWER_W * PV_COVERAGE_RATIO_STOP)
+    pv_covers_miner = current_power >= pv_stop_threshold
+
+    start_rules = [
+        ("Summer clear-day fast start: usable bridge energy covers needed bridge energy", summer_fast_start),
+        ("Immediate capacity start: bridge energy ready and daily refill still feasible", immediate_capacity_start),
+        ("Confident sunny-day bridge start: PV can be 0W if bridge energy is enough (before 11h)", confident_sunny_bridge_start),
+        ("Aggressive morning refill start: battery can still refill before sunset", aggressive_morning_refill_start),
+        (
+            "Bridge guard OK + PV headroom + seasonal SOC/time gate",
+            smart_bridge_pv_start,
+        ),
+        ("Predictive early start: refill before sunset is likely", predictive_early_start),
+        ("Sunny+1H forecast, PV>0, SOC>=early_start, before 13h", solar_now and solar_f1 and current_power > 0 and battery_charge >= hist["early_start_soc"] and now.hour < 13),
+        (f"Sunny+1H forecast, PV>={pv_start_threshold:.0f}W, SOC>=65, before 13h", solar_now and solar_f1 and current_power >= pv_start_threshold and battery_charge >= 65 and now.hour < 13),
+        (f"Sunny+1H forecast, PV>={pv_start_threshold:.0f}W, SOC>=55, before 12h", solar_now and solar_f1 and current_power >= pv_start_threshold and battery_charge >= 55 and now.hour < 12),
+        (f"Sunny+1H forecast, PV>={pv_start_threshold:.0f}W, SOC>=35, before 11h", solar_now and solar_f1 and current_power >= pv_start_threshold and battery_charge >= 35 and now.hour < 11),
+        ("Bridge-friendly morning start: SOC>=min_stop+12 and PV>=450W before 11h", battery_charge >= (hist["min_stop_soc"] + 12) and current_power >= 450 and now.hour < 11),
+        ("Sunny+3H forecast, PV>0, SOC>=early_start, before 13h", solar_now and solar_f3 and current_power > 0 and battery_charge >= hist["early_start_soc"] and now.hour < 13),
+        (f"Sunny+3H forecast, PV>={pv_start_threshold:.0f}W, SOC>=65, before 13h", solar_now and solar_f3 and current_power >= pv_start_threshold and battery_charge >= 65 and now.hour < 13),
+        (f"Sunny+3H forecast, PV>={pv_start_threshold:.0f}W, SOC>=55, before 12h", solar_now and solar_f3 and current_power >= pv_start_threshold and battery_charge >= 55 and now.hour < 12),
+        (f"Sunny+3H forecast, PV>={pv_start_threshold:.0f}W, SOC>=35, before 11h", solar_now and solar_f3 and current_power >= pv_start_threshold and battery_charge >= 35 and now.hour < 11),
+        ("Historical headroom good + SOC>=early_start, before 14h", hist["headroom_good"] and battery_charge >= hist["early_start_soc"] and now.hour < 14),
+        ("SOC>=60 and PV>=2500W, before 11h", battery_charge >= 60 and current_power >= 2500 and now.hour < 11),
+        ("SOC>=70 and PV>=2250W, before 12h", battery_charge >= 70 and current_power >= 2250 and now.hour < 12),
+        ("SOC>=80 and PV>=2000W, before 13h", battery_charge >= 80 and current_power >= 2000 and now.hour < 13),
+        ("SOC>=40 and PV>=3000W, before 14h", battery_charge >= 40 and current_power >= 3000 and now.hour < 14),
+        (f"SOC>{BATTERY_PROTECT_SOC:.0f}% and PV>={pv_start_threshold:.0f}W", battery_charge > BATTERY_PROTECT_SOC and current_power >= pv_start_threshold),
+    ]
+    for label, ok in start_rules:
+        if ok:
+            start_rule_hits.append(label)
+
+    stop_battery_rules = [
+        ("Battery below minimum stop SOC while running", prev_state == "production" and battery_charge < hist["min_stop_soc"]),
+        ("Late-day reserve protection (after 14h)", prev_state == "production" and now.hour > 14 and battery_charge < hist["late_day_reserve_soc"]),
+        ("Historical preserve-battery flag while running", prev_state == "production" and hist["should_preserve_battery"]),
+    ]
+    for label, ok in stop_battery_rules:
+        if ok:
+            stop_rule_hits.append(label)
+
+    curtailment_prevent_window = (
+        prev_state == "production"
+        and now.hour < 17
+        and battery_charge >= 96
+        and current_power >= max(350.0, MINER_POWER_W * 0.35)
+    )
+    minutes_to_sunset = _safe_float((sunset - now).total_seconds() / 60.0, -1.0) if isinstance(sunset, datetime) else -1.0
+    eta_to_full_min = _safe_float(hist.get("predicted_minutes_to_full"), -1.0)
+    eta_exceeds_daylight_low_soc_while_running = (
+        prev_state == "production"
+        and eta_to_full_min >= 0.0
+        and minutes_to_sunset >= 0.0
+        and eta_to_full_min > minutes_to_sunset
+        and battery_charge < 90.0
+    )
+    cannot_refill_before_sunset_while_running = (
+        prev_state == "production"
+        and eta_to_full_min >= 0.0
+        and not bool(hist.get("can_refill_before_sunset", False))
+        and _safe_float(hist.get("sunset_margin_minutes"), 0.0) < -5.0
+        and not curtailment_prevent_window
+    )
+    required_rate_to_full_pct_per_h = 0.0
+    if minutes_to_sunset > 1.0 and battery_charge < 100.0:
+        required_rate_to_full_pct_per_h = max(0.0, (100.0 - battery_charge) / (minutes_to_sunset / 60.0))
+    predicted_rate_pct_per_h = _safe_float(hist.get("predicted_charge_rate_pct_per_hour"), 0.0)
+    likely_no_full_recharge_if_running = (
+        prev_state == "production"
+        and now.hour >= 12
+        and minutes_to_sunset > 0.0
+        and battery_charge < 99.0
+        and not curtailment_prevent_window
+        and (
+            (
+                predicted_rate_pct_per_h > 0.0
+                and predicted_rate_pct_per_h < (required_rate_to_full_pct_per_h * 0.9)
+                and current_power < max(600.0, MINER_POWER_W * 0.80)
+            )
+            or (
+                predicted_rate_pct_per_h <= 0.0
+                and minutes_to_sunset <= 240.0
+                and current_power < max(500.0, MINER_POWER_W * 0.65)
+            )
+        )
+    )
+
+    stop_runtime_rules = [
+        (
+            "ETA to 100% exceeds remaining daylight while SOC<90% (force stop protection)",
+            eta_exceeds_daylight_low_soc_while_running,
+        ),
+        (
+            f"Battery<{BATTERY_PROTECT_SOC:.0f}% and PV<{pv_stop_threshold:.0f}W (insufficient solar cover) while running",
+            prev_state == "production" and battery_charge < BATTERY_PROTECT_SOC and not pv_covers_miner and not curtailment_prevent_window,
+        ),
+        (
+            "Predicted full charge is after sunset while running (sunset refill protection)",
+            cannot_refill_before_sunset_while_running,
+        ),
+        (
+            "Required charge rate to reach 100% by sunset is no longer achievable while running",
+            likely_no_full_recharge_if_running,
+        ),
+        ("Late-day reserve reached (after 14h, while running)", prev_state == "production" and now.hour >= 14 and battery_charge <= hist["late_day_reserve_soc"] and not curtailment_prevent_window),
+        (
+            f"High-SOC bridge drained (SOC<{HIGH_SOC_STOP_SOC:.0f}% and PV<={HIGH_SOC_STOP_MAX_PV_W:.0f}W while running)",
+            prev_state == "production" and battery_charge < HIGH_SOC_STOP_SOC and current_power <= HIGH_SOC_STOP_MAX_PV_W and not curtailment_prevent_window,
+        ),
+        ("PV <= 150W", current_power <= 150 and not curtailment_prevent_window),
+        ("Current weather non-solar + battery<=95 + PV<=1000W", non_solar_now and battery_charge <= 95 and current_power <= 1000 and not curtailment_prevent_window),
+        ("1H forecast non-solar + battery<=95 + PV<=1000W", non_solar_f1 and battery_charge <= 95 and current_power <= 1000 and not curtailment_prevent_window),
+        ("3H forecast non-solar + battery<=95 + PV<=1000W", non_solar_f3 and battery_charge <= 95 and current_power <= 1000 and not curtailment_prevent_window),
+        ("Historical preserve-battery after 14h", hist["should_preserve_battery"] and now.hour >= 14 and not curtailment_prevent_window),
+        ("5-day weather risk is solar_weak + PV<70% miner", weather_risk_5d == "solar_weak" and current_power < (MINER_POWER_W * 0.7) and not curtailment_prevent_window),
+    ]
+
+    decision_summary = "No state change"
+
+    # HARD RULE: after configured afternoon hour, SOC under threshold must stop immediately.
+    # This is intentionally unconditional and bypasses forecast/curtailment relaxations.
+    if now.hour >= HARD_AFTERNOON_STOP_HOUR and battery_charge < HARD_AFTERNOON_STOP_SOC:
+        log.append("Hard afternoon SOC cutoff triggered → forcing STOP.")
+        if prev_state == "production":
+            log.append("Trying to press power button.")
+            press_seconds = POWER_BUTTON_LONG_PRESS_SECONDS
+        return Decision(
+            "stop", "STOP: hard afternoon SOC cutoff", start_rule_hits,
+            [f"Hard afternoon cutoff: SOC<{HARD_AFTERNOON_STOP_SOC:.0f}% after {HARD_AFTERNOON_STOP_HOUR}:00"],
+            guard, start_guard, press_seconds, "hard_cutoff" if prev_state != "stop" else None,
+            inputs.pending, log,
+        )
+
+    # IMMEDIATE POWER-BASED STOP RULE MINER IS ON L2 and L3
+    if (inv_l2 > 2500) or (inv_l3 > 2500) or (inv_lt > 5000):
+        log.append("Power safety threshold exceeded → Crypto production over (STOP).")
+        if prev_state == "production":
+            log.append("Trying to press power button.")
+            press_seconds = POWER_BUTTON_LONG_PRESS_SECONDS
+        return Decision(
+            "stop", "STOP: power safety", start_rule_hits,
+            ["Power safety threshold exceeded (L2/L3/Total inverter output)"],
+            guard, start_guard, press_seconds, "power_safety" if prev_state != "stop" else None,
+            inputs.pending, log,
+        )
+
+    matched_runtime_stops = [label for label, ok in stop_runtime_rules if ok]
+
+    if stop_rule_hits:
+        log.append("Battery emergency shutdown.")
+        decision_summary = "STOP: battery protection"
+        state = "stop"
+        if prev_state == "production":
+            log.append("Trying to press power button.")
+            # The stop is persisted right away, so no "Production stopped." notification follows.
+            prev_state = state
+            press_seconds = POWER_BUTTON_LONG_PRESS_SECONDS
+    elif matched_runtime_stops:
+        stop_rule_hits = matched_runtime_stops
+        decision_summary = "STOP: runtime stop rules satisfied"
+        log.append("Crypto production over.")
+        state = "stop"
+        if prev_state == "production":
+            log.append("Trying to press power button.")
+            press_seconds = POWER_BUTTON_LONG_PRESS_SECONDS
+    elif start_guard["allow_start"] and start_rule_hits:
+        log.append("Crypto production ready!")
+        decision_summary = "START: start rules satisfied"
+        state = "production"
+        if prev_state == "stop":
+            log.append("Trying to press power button.")
+            press_seconds = POWER_BUTTON_SHORT_PRESS_SECONDS
+    elif (not start_guard["allow_start"]) and prev_state != "production":
+        log.append("Start trigger blocked by battery bridge guard.")
+        decision_summary = "STOP: bridge guard blocked start"
+        stop_rule_hits = [f"Start guard blocked start ({start_guard.get('reason', 'unknown')})"]
+        state = "stop"
+    else:
+        log.append("No change!")
+
+    # Debounce non-emergency transitions to avoid flip-flop on short weather/PV noise.
+    # IMPORTANT: production starts are intentionally immediate once start rules are met,
+    # so we do not lose mining hours during strong morning bridge-energy windows.
+    emergency_stop = decision_summary == "STOP: battery protection"
+    desired_state = state or prev_state or "stop"
+    stable_prev_state = prev_state or "stop"
+    if not emergency_stop:
+        confirmation_needed = 1 if desired_state == "production" else 3
+        min_hold_minutes = 0 if desired_state == "production" else 12
+
+        if desired_state == stable_prev_state:
+            pending_state, pending_since, pending_hits = None, None, 0
+            transition_confirmed = True
+        else:
+            if pending_state != desired_state:
+                pending_state, pending_since, pending_hits = desired_state, now, 1
+            else:
+                pending_hits += 1
+            pending_age_min = (
+                (now - pending_since).total_seconds() / 60.0
+                if isinstance(pending_since, datetime) else 0.0
+            )
+            transition_confirmed = (
+                pending_hits >= confirmation_needed
+                and pending_age_min >= min_hold_minutes
+            )
+
+        effective_state, blocked, gate_reason = _apply_transition_guard(
+            stable_prev_state, desired_state, now, inputs.last_state_change_us,
+            confirmed=transition_confirmed,
+        )
+        state = effective_state
+        if blocked and effective_state != desired_state:
+            decision_summary = f"HOLD: transition guard blocked ({gate_reason})"
+            if desired_state == "production":
+                stop_rule_hits = stop_rule_hits or [f"Start delayed by transition guard ({gate_reason})"]
+            else:
+                start_rule_hits = start_rule_hits or [f"Stop delayed by transition guard ({gate_reason})"]
+        elif state == desired_state:
+            pending_state, pending_since, pending_hits = None, None, 0
+
+    notify: Optional[str] = None
+    if state == "production" and prev_state != "production":
+        notify = "started"
+    elif state == "stop" and prev_state != "stop":
+        notify = "stopped"
+
+    return Decision(
+        state, decision_summary, start_rule_hits, stop_rule_hits, guard, start_guard,
+        press_seconds, notify, (pending_state, pending_since, pending_hits), log,
+    )
+
+
+class DecisionLatencyStats:
+    """Running evaluate_decision latency (ms): count, last, mean, max and P² p50/p95 estimates."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_ms = 0.0
+        self.last_ms: Optional[float] = None
+        self.max_ms = 0.0
+        self._p50 = P2Quantile(0.5)
+        self._p95 = P2Quantile(0.95)
+
+    def observe(self, ms: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.total_ms += ms
+            self.last_ms = ms
+            self.max_ms = max(self.max_ms, ms)
+            self._p50.add(ms)
+            self._p95.add(ms)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            def _r(v: Optional[float]) -> Optional[float]:
+                return round(v, 3) if v is not None else None
+            return {
+                "count": self.count,
+                "last_ms": _r(self.last_ms),
+                "mean_ms": _r(self.total_ms / self.count) if self.count else None,
+                "p50_ms": _r(self._p50.value()),
+                "p95_ms": _r(self._p95.value()),
+                "max_ms": _r(self.max_ms) if self.count else None,
+            }
+
+
+decision_latency = DecisionLatencyStats()
+
 
 def check_crypto_production_conditions(data, weather_api_key, location_lat, location_lon):
     global prev_state, state, used_quote, sunrise, sunset, uptime, _last_production_start_at
@@ -2340,284 +5369,39 @@ def check_crypto_production_conditions(data, weather_api_key, location_lat, loca
             f"wx5={hist.get('weather_risk_5d', 'unknown')} "
             f"wx_conf={float(hist.get('weather_confidence', 0.0)):.2f}"
         )
-        start_guard = _compute_start_bridge_guard(now, battery_charge, current_power, sunrise, sunset, hist, battery_voltage, battery_ah)
+        guard = _compute_start_bridge_guard(now, battery_charge, current_power, sunrise, sunset, hist,
+                                            battery_voltage, battery_ah)
         print(
             "[Start guard] "
-            f"allow={start_guard['allow_start']} reason={start_guard['reason']} "
-            f"capacity={start_guard['capacity_wh']}Wh ({start_guard['battery_ah']}Ah @ {start_guard['battery_voltage']}V) "
-            f"usable_wh={start_guard['usable_wh']}Wh deficit={start_guard['deficit_w']}W bridge={start_guard['bridge_minutes']}min eta={start_guard['eta_minutes']}min"
-        )
-        hist.update({
-            "start_guard_allow": bool(start_guard.get("allow_start", False)),
-            "start_guard_reason": str(start_guard.get("reason", "unknown")),
-            "start_guard_bridge_minutes": float(start_guard.get("bridge_minutes", 0.0)),
-            "start_guard_eta_minutes": float(start_guard.get("eta_minutes", 0.0)),
-            "start_guard_capacity_wh": float(start_guard.get("capacity_wh", 0.0)),
-            "start_guard_battery_ah": float(start_guard.get("battery_ah", 0.0)),
-            "start_guard_battery_voltage": float(start_guard.get("battery_voltage", 0.0)),
-            "start_guard_usable_wh": float(start_guard.get("usable_wh", 0.0)),
-            "start_guard_soc_window_pct": float(start_guard.get("soc_window_pct", 0.0)),
-            "start_guard_min_stop_soc": float(start_guard.get("min_stop_soc", 0.0)),
-            "start_guard_bms_floor_soc": float(start_guard.get("bms_floor_soc", 20.0)),
-            "start_guard_bms_window_wh": float(start_guard.get("bms_window_wh", 0.0)),
-            "start_guard_needed_bridge_minutes": float(start_guard.get("needed_bridge_minutes", 0.0)),
-            "start_guard_needed_bridge_wh": float(start_guard.get("needed_bridge_wh", 0.0)),
-        })
-
-        solar_keywords = [
-            'sunny', 'clear', 'clear sky', 'scattered clouds', 'few clouds', 'broken clouds',
-            'partly cloudy', 'mostly sunny', 'sunshine', 'sunrise', 'sunset'
-        ]
-        non_solar_keywords = [
-            'rain', 'storm', 'thunder', 'snow', 'fog', 'haze',
-            'sleet', 'blizzard', 'dust', 'sand', 'ash', 'drizzle', 'shower', 'mist', 'smoke',
-            'tornado', 'hurricane', 'squall', 'lightning', 'moderate rain', 'heavy intensity rain', 'overcast'
-        ]
-
-        cond_now = str(current_condition).lower()
-        cond_f1 = str(f1_cond).lower()
-        cond_f3 = str(f3_cond).lower()
-        solar_now = any(k in cond_now for k in solar_keywords)
-        solar_f1 = any(k in cond_f1 for k in solar_keywords)
-        solar_f3 = any(k in cond_f3 for k in solar_keywords)
-        non_solar_now = any(k in cond_now for k in non_solar_keywords)
-        non_solar_f1 = any(k in cond_f1 for k in non_solar_keywords)
-        non_solar_f3 = any(k in cond_f3 for k in non_solar_keywords)
-
-        confident_sunny_bridge_start = (
-            bool(hist.get("refill_confident_morning", False))
-            and bool(hist.get("can_refill_before_sunset", False))
-            and bool(start_guard.get("energy_cover_ok", False))
-            and battery_charge >= (hist["min_stop_soc"] + 4)
-            and solar_now and solar_f1 and solar_f3
-            and not non_solar_now and not non_solar_f1 and not non_solar_f3
-            and now.hour < 11
-        )
-        if confident_sunny_bridge_start and not start_guard.get("allow_start", False):
-            start_guard["allow_start"] = True
-            start_guard["reason"] = "bridge_energy_confident_sunny_day_relaxation"
-
-        summer_clear_day = (
-            now.month in (5, 6, 7, 8)
-            and solar_now and solar_f1 and solar_f3
-            and not non_solar_now and not non_solar_f1 and not non_solar_f3
-        )
-        summer_fast_start = (
-            summer_clear_day
-            and battery_charge > hist["min_stop_soc"]
-            and bool(start_guard.get("energy_cover_ok", False))
-        )
-
-        aggressive_morning_refill_start = (
-            now.hour < 10
-            and battery_charge >= max(hist["min_stop_soc"] + 10, 42)
-            and bool(hist.get("can_refill_before_sunset", False))
-            and _safe_float(hist.get("predicted_minutes_to_full"), 9999) <= 240
-            and solar_now and solar_f1 and solar_f3
-            and not non_solar_now and not non_solar_f1 and not non_solar_f3
-            and str(hist.get("weather_risk_5d", "unknown")).lower() != "solar_weak"
-            and current_power >= max(150.0, MINER_POWER_W * 0.15)
-        )
-        if aggressive_morning_refill_start and not start_guard.get("allow_start", False):
-            start_guard["allow_start"] = True
-            start_guard["reason"] = "aggressive_morning_refill_start"
-
-        # Intelligent real-time start: require meaningful PV headroom and seasonal SOC discipline.
-        # This prevents autumn/winter starts from eating into battery recharge.
-        month_quality = str(hist.get("month_quality", "neutral")).lower()
-        weather_risk_5d = str(hist.get("weather_risk_5d", "unknown")).lower()
-        season_margin_w = 50 if month_quality == "strong" else (180 if month_quality == "neutral" else 350)
-        if weather_risk_5d == "solar_weak":
-            season_margin_w += 140
-        elif weather_risk_5d == "solar_friendly":
-            season_margin_w = max(30, season_margin_w - 40)
-        season_soc_floor = (
-            max(hist["min_stop_soc"] + 4, hist["early_start_soc"] - 6)
-            if month_quality == "strong"
-            else (max(hist["early_start_soc"] - 2, 52) if month_quality == "neutral" else max(hist["early_start_soc"], 68))
-        )
-        if weather_risk_5d == "solar_weak":
-            season_soc_floor = max(season_soc_floor, hist["min_stop_soc"] + 12)
-        season_time_ok = now.hour < (15 if month_quality == "strong" else (14 if month_quality == "neutral" else 12))
-        if weather_risk_5d == "solar_weak":
-            season_time_ok = season_time_ok and now.hour < 12
-        smart_bridge_pv_start = (
-            bool(start_guard.get("allow_start", False))
-            and current_power >= (MINER_POWER_W + season_margin_w)
-            and battery_charge >= season_soc_floor
-            and season_time_ok
-            and not hist.get("should_preserve_battery", False)
-        )
-        predictive_early_start = (
-            bool(start_guard.get("allow_start", False))
-            and bool(hist.get("can_refill_before_sunset", False))
-            and weather_risk_5d in {"solar_friendly", "mixed"}
-            and now.hour < 12
-            and battery_charge >= (hist["min_stop_soc"] + 6)
-            and current_power >= max(120.0, MINER_POWER_W * 0.10)
-        )
-        immediate_capacity_start = (
-            bool(start_guard.get("allow_start", False))
-            and now >= (sunrise - timedelta(minutes=30))
-            and now.hour < 15
-            and battery_charge >= (hist["min_stop_soc"] + 4)
-            and (
-                current_power >= max(100.0, MINER_POWER_W * 0.08)
-                or (
-                    bool(hist.get("can_refill_before_sunset", False))
-                    and _safe_float(hist.get("sunset_margin_minutes"), 0.0) >= 20.0
-                )
-            )
-        )
-
-        start_rule_hits: List[str] = []
-        stop_rule_hits: List[str] = []
-        pv_start_threshold = max(150.0, MINER_POWER_W * PV_COVERAGE_RATIO_START)
-        pv_stop_threshold = max(150.0, MINER_POWER_W * PV_COVERAGE_RATIO_STOP)
-        pv_covers_miner = current_power >= pv_stop_threshold
-
-        start_rules = [
-            ("Summer clear-day fast start: usable bridge energy covers needed bridge energy", summer_fast_start),
-            ("Immediate capacity start: bridge energy ready and daily refill still feasible", immediate_capacity_start),
-            ("Confident sunny-day bridge start: PV can be 0W if bridge energy is enough (before 11h)", confident_sunny_bridge_start),
-            ("Aggressive morning refill start: battery can still refill before sunset", aggressive_morning_refill_start),
-            (
-                "Bridge guard OK + PV headroom + seasonal SOC/time gate",
-                smart_bridge_pv_start,
-            ),
-            ("Predictive early start: refill before sunset is likely", predictive_early_start),
-            ("Sunny+1H forecast, PV>0, SOC>=early_start, before 13h", solar_now and solar_f1 and current_power > 0 and battery_charge >= hist["early_start_soc"] and now.hour < 13),
-            (f"Sunny+1H forecast, PV>={pv_start_threshold:.0f}W, SOC>=65, before 13h", solar_now and solar_f1 and current_power >= pv_start_threshold and battery_charge >= 65 and now.hour < 13),
-            (f"Sunny+1H forecast, PV>={pv_start_threshold:.0f}W, SOC>=55, before 12h", solar_now and solar_f1 and current_power >= pv_start_threshold and battery_charge >= 55 and now.hour < 12),
-            (f"Sunny+1H forecast, PV>={pv_start_threshold:.0f}W, SOC>=35, before 11h", solar_now and solar_f1 and current_power >= pv_start_threshold and battery_charge >= 35 and now.hour < 11),
-            ("Bridge-friendly morning start: SOC>=min_stop+12 and PV>=450W before 11h", battery_charge >= (hist["min_stop_soc"] + 12) and current_power >= 450 and now.hour < 11),
-            ("Sunny+3H forecast, PV>0, SOC>=early_start, before 13h", solar_now and solar_f3 and current_power > 0 and battery_charge >= hist["early_start_soc"] and now.hour < 13),
-            (f"Sunny+3H forecast, PV>={pv_start_threshold:.0f}W, SOC>=65, before 13h", solar_now and solar_f3 and current_power >= pv_start_threshold and battery_charge >= 65 and now.hour < 13),
-            (f"Sunny+3H forecast, PV>={pv_start_threshold:.0f}W, SOC>=55, before 12h", solar_now and solar_f3 and current_power >= pv_start_threshold and battery_charge >= 55 and now.hour < 12),
-            (f"Sunny+3H forecast, PV>={pv_start_threshold:.0f}W, SOC>=35, before 11h", solar_now and solar_f3 and current_power >= pv_start_threshold and battery_charge >= 35 and now.hour < 11),
-            ("Historical headroom good + SOC>=early_start, before 14h", hist["headroom_good"] and battery_charge >= hist["early_start_soc"] and now.hour < 14),
-            ("SOC>=60 and PV>=2500W, before 11h", battery_charge >= 60 and current_power >= 2500 and now.hour < 11),
-            ("SOC>=70 and PV>=2250W, before 12h", battery_charge >= 70 and current_power >= 2250 and now.hour < 12),
-            ("SOC>=80 and PV>=2000W, before 13h", battery_charge >= 80 and current_power >= 2000 and now.hour < 13),
-            ("SOC>=40 and PV>=3000W, before 14h", battery_charge >= 40 and current_power >= 3000 and now.hour < 14),
-            (f"SOC>{BATTERY_PROTECT_SOC:.0f}% and PV>={pv_start_threshold:.0f}W", battery_charge > BATTERY_PROTECT_SOC and current_power >= pv_start_threshold),
-        ]
-        for label, ok in start_rules:
-            if ok:
-                start_rule_hits.append(label)
-
-        stop_battery_rules = [
-            ("Battery below minimum stop SOC while running", prev_state == "production" and battery_charge < hist["min_stop_soc"]),
-            ("Late-day reserve protection (after 14h)", prev_state == "production" and now.hour > 14 and battery_charge < hist["late_day_reserve_soc"]),
-            ("Historical preserve-battery flag while running", prev_state == "production" and hist["should_preserve_battery"]),
-        ]
-        for label, ok in stop_battery_rules:
-            if ok:
-                stop_rule_hits.append(label)
-
-        curtailment_prevent_window = (
-            prev_state == "production"
-            and now.hour < 17
-            and battery_charge >= 96
-            and current_power >= max(350.0, MINER_POWER_W * 0.35)
-        )
-        minutes_to_sunset = _safe_float((sunset - now).total_seconds() / 60.0, -1.0) if isinstance(sunset, datetime) else -1.0
-        eta_to_full_min = _safe_float(hist.get("predicted_minutes_to_full"), -1.0)
-        eta_exceeds_daylight_low_soc_while_running = (
-            prev_state == "production"
-            and eta_to_full_min >= 0.0
-            and minutes_to_sunset >= 0.0
-            and eta_to_full_min > minutes_to_sunset
-            and battery_charge < 90.0
+            f"allow={guard['allow_start']} reason={guard['reason']} "
+            f"capacity={guard['capacity_wh']}Wh ({guard['battery_ah']}Ah @ {guard['battery_voltage']}V) "
+            f"usable_wh={guard['usable_wh']}Wh deficit={guard['deficit_w']}W bridge={guard['bridge_minutes']}min eta={guard['eta_minutes']}min"
         )
-        cannot_refill_before_sunset_while_running = (
-            prev_state == "production"
-            and eta_to_full_min >= 0.0
-            and not bool(hist.get("can_refill_before_sunset", False))
-            and _safe_float(hist.get("sunset_margin_minutes"), 0.0) < -5.0
-            and not curtailment_prevent_window
-        )
-        required_rate_to_full_pct_per_h = 0.0
-        if minutes_to_sunset > 1.0 and battery_charge < 100.0:
-            required_rate_to_full_pct_per_h = max(0.0, (100.0 - battery_charge) / (minutes_to_sunset / 60.0))
-        predicted_rate_pct_per_h = _safe_float(hist.get("predicted_charge_rate_pct_per_hour"), 0.0)
-        likely_no_full_recharge_if_running = (
-            prev_state == "production"
-            and now.hour >= 12
-            and minutes_to_sunset > 0.0
-            and battery_charge < 99.0
-            and not curtailment_prevent_window
-            and (
-                (
-                    predicted_rate_pct_per_h > 0.0
-                    and predicted_rate_pct_per_h < (required_rate_to_full_pct_per_h * 0.9)
-                    and current_power < max(600.0, MINER_POWER_W * 0.80)
-                )
-                or (
-                    predicted_rate_pct_per_h <= 0.0
-                    and minutes_to_sunset <= 240.0
-                    and current_power < max(500.0, MINER_POWER_W * 0.65)
-                )
-            )
+        inputs = DecisionInputs(
+            now, battery_charge, current_power, inv_l1, inv_l2, inv_l3, inv_lt,
+            current_condition, f1_cond, f3_cond, sunrise, sunset, hist, guard,
+            prev_state, state,
+            pending=(_pending_transition_state, _pending_transition_since, _pending_transition_hits),
+            last_state_change_us=telemetry_transitions.last_change_us(),
         )
+        t0 = time.perf_counter()
+        decision = evaluate_decision(inputs)
+        decision_latency.observe((time.perf_counter() - t0) * 1000.0)
+
+        for line in decision.log:
+            print(line)
+        hist.update(decision.hist_fields())
+        state = decision.state
+        _pending_transition_state, _pending_transition_since, _pending_transition_hits = decision.pending
+
+        if decision.press_seconds is not None:
+            uptime = now
+            if is_rpi:
+                press_power_button(16, decision.press_seconds)
 
-        stop_runtime_rules = [
-            (
-                "ETA to 100% exceeds remaining daylight while SOC<90% (force stop protection)",
-                eta_exceeds_daylight_low_soc_while_running,
-            ),
-            (
-                f"Battery<{BATTERY_PROTECT_SOC:.0f}% and PV<{pv_stop_threshold:.0f}W (insufficient solar cover) while running",
-                prev_state == "production" and battery_charge < BATTERY_PROTECT_SOC and not pv_covers_miner and not curtailment_prevent_window,
-            ),
-            (
-                "Predicted full charge is after sunset while running (sunset refill protection)",
-                cannot_refill_before_sunset_while_running,
-            ),
-            (
-                "Required charge rate to reach 100% by sunset is no longer achievable while running",
-                likely_no_full_recharge_if_running,
-            ),
-            ("Late-day reserve reached (after 14h, while running)", prev_state == "production" and now.hour >= 14 and battery_charge <= hist["late_day_reserve_soc"] and not curtailment_prevent_window),
-            (
-                f"High-SOC bridge drained (SOC<{HIGH_SOC_STOP_SOC:.0f}% and PV<={HIGH_SOC_STOP_MAX_PV_W:.0f}W while running)",
-                prev_state == "production" and battery_charge < HIGH_SOC_STOP_SOC and current_power <= HIGH_SOC_STOP_MAX_PV_W and not curtailment_prevent_window,
-            ),
-            ("PV <= 150W", current_power <= 150 and not curtailment_prevent_window),
-            ("Current weather non-solar + battery<=95 + PV<=1000W", non_solar_now and battery_charge <= 95 and current_power <= 1000 and not curtailment_prevent_window),
-            ("1H forecast non-solar + battery<=95 + PV<=1000W", non_solar_f1 and battery_charge <= 95 and current_power <= 1000 and not curtailment_prevent_window),
-            ("3H forecast non-solar + battery<=95 + PV<=1000W", non_solar_f3 and battery_charge <= 95 and current_power <= 1000 and not curtailment_prevent_window),
-            ("Historical preserve-battery after 14h", hist["should_preserve_battery"] and now.hour >= 14 and not curtailment_prevent_window),
-            ("5-day weather risk is solar_weak + PV<70% miner", weather_risk_5d == "solar_weak" and current_power < (MINER_POWER_W * 0.7) and not curtailment_prevent_window),
-        ]
-
-        decision_summary = "No state change"
-        decision_state = state or "unknown"
-
-        # HARD RULE: after configured afternoon hour, SOC under threshold must stop immediately.
-        # This is intentionally unconditional and bypasses forecast/curtailment relaxations.
-        if now.hour >= HARD_AFTERNOON_STOP_HOUR and battery_charge < HARD_AFTERNOON_STOP_SOC:
-            stop_rule_hits = [f"Hard afternoon cutoff: SOC<{HARD_AFTERNOON_STOP_SOC:.0f}% after {HARD_AFTERNOON_STOP_HOUR}:00"]
-            decision_summary = "STOP: hard afternoon SOC cutoff"
-            print("Hard afternoon SOC cutoff triggered → forcing STOP.")
-            state = "stop"
-            decision_state = state
-            if prev_state == "production":
-                print("Trying to press power button.")
-                uptime = now
-                if is_rpi:
-                    press_power_button(16, POWER_BUTTON_LONG_PRESS_SECONDS)
-            hist.update({
-                "decision_state": decision_state,
-                "decision_start_rules": start_rule_hits,
-                "decision_stop_rules": stop_rule_hits,
-                "decision_summary": decision_summary,
-            })
-            if state != prev_state:
-                prev_state = state
-                save_prev_state(prev_state, now)
-                send_telegram_message(
-                    f""" Production stopped (hard afternoon SOC cutoff).
+        if decision.notify == "hard_cutoff":
+            send_telegram_message(
+                f""" Production stopped (hard afternoon SOC cutoff).
 ________________________________
 ________________________________
  Battery: {battery_charge}%
@@ -2628,34 +5412,10 @@ ________________________________
  Temperature: {temperature}
  Humidity: {humidity}%
 """
-                )
-            return (battery_charge, current_power, state, current_condition, sunrise, sunset, clouds,
-                    f1_cond, f1_clouds, f1_ts,
-                    f3_cond, f3_clouds, f3_ts, hist)
-
-        # IMMEDIATE POWER-BASED STOP RULE MINER IS ON L2 and L3
-        if (inv_l2 > 2500) or (inv_l3 > 2500) or (inv_lt > 5000):
-            stop_rule_hits = ["Power safety threshold exceeded (L2/L3/Total inverter output)"]
-            decision_summary = "STOP: power safety"
-            print("Power safety threshold exceeded → Crypto production over (STOP).")
-            state = "stop"
-            decision_state = state
-            if prev_state == "production":
-                print("Trying to press power button.")
-                uptime = now
-                if is_rpi:
-                    press_power_button(16, POWER_BUTTON_LONG_PRESS_SECONDS)
-            hist.update({
-                "decision_state": decision_state,
-                "decision_start_rules": start_rule_hits,
-                "decision_stop_rules": stop_rule_hits,
-                "decision_summary": decision_summary,
-            })
-            if state != prev_state:
-                prev_state = state
-                save_prev_state(prev_state, now)
-                send_telegram_message(
-                    f""" Production stopped (power threshold).
+            )
+        elif decision.notify == "power_safety":
+            send_telegram_message(
+                f""" Production stopped (power threshold).
 ________________________________
 ________________________________
  Battery: {battery_charge}%
@@ -2666,115 +5426,8 @@ ________________________________
  Temperature: {temperature}
  Humidity: {humidity}%
 """
-                )
-            return (battery_charge, current_power, state, current_condition, sunrise, sunset, clouds,
-                    f1_cond, f1_clouds, f1_ts,
-                    f3_cond, f3_clouds, f3_ts, hist)
-
-        # ===== existing logic continues below =====
-        matched_runtime_stops = [label for label, ok in stop_runtime_rules if ok]
-
-        if stop_rule_hits:
-            print("Battery emergency shutdown.")
-            decision_summary = "STOP: battery protection"
-            state = "stop"
-            decision_state = state
-            if prev_state == "production":
-                print("Trying to press power button.")
-                if state != prev_state:
-                    prev_state = state
-                    uptime = now
-                    save_prev_state(prev_state, uptime)
-                if is_rpi:
-                    press_power_button(16, POWER_BUTTON_LONG_PRESS_SECONDS)
-        elif matched_runtime_stops:
-            stop_rule_hits = matched_runtime_stops
-            decision_summary = "STOP: runtime stop rules satisfied"
-            print("Crypto production over.")
-            state = "stop"
-            decision_state = state
-            if prev_state == "production":
-                print("Trying to press power button.")
-                uptime = now
-                if is_rpi:
-                    press_power_button(16, POWER_BUTTON_LONG_PRESS_SECONDS)
-        elif start_guard["allow_start"] and start_rule_hits:
-            print("Crypto production ready!")
-            decision_summary = "START: start rules satisfied"
-            state = "production"
-            decision_state = state
-            if prev_state == "stop":
-                print("Trying to press power button.")
-                uptime = now
-                if is_rpi:
-                    press_power_button(16, POWER_BUTTON_SHORT_PRESS_SECONDS)
-        elif (not start_guard["allow_start"]) and prev_state != "production":
-            print("Start trigger blocked by battery bridge guard.")
-            decision_summary = "STOP: bridge guard blocked start"
-            stop_rule_hits = [f"Start guard blocked start ({start_guard.get('reason', 'unknown')})"]
-            state = "stop"
-            decision_state = state
-        else:
-            print("No change!")
-
-        # Debounce non-emergency transitions to avoid flip-flop on short weather/PV noise.
-        # IMPORTANT: production starts are intentionally immediate once start rules are met,
-        # so we do not lose mining hours during strong morning bridge-energy windows.
-        emergency_stop = decision_summary in {"STOP: battery protection", "STOP: power safety"}
-        desired_state = state or prev_state or "stop"
-        stable_prev_state = prev_state or "stop"
-        if not emergency_stop:
-            confirmation_needed = 1 if desired_state == "production" else 3
-            min_hold_minutes = 0 if desired_state == "production" else 12
-
-            if desired_state == stable_prev_state:
-                _pending_transition_state = None
-                _pending_transition_since = None
-                _pending_transition_hits = 0
-                transition_confirmed = True
-            else:
-                if _pending_transition_state != desired_state:
-                    _pending_transition_state = desired_state
-                    _pending_transition_since = now
-                    _pending_transition_hits = 1
-                else:
-                    _pending_transition_hits += 1
-                pending_age_min = (
-                    (now - _pending_transition_since).total_seconds() / 60.0
-                    if isinstance(_pending_transition_since, datetime) else 0.0
-                )
-                transition_confirmed = (
-                    _pending_transition_hits >= confirmation_needed
-                    and pending_age_min >= min_hold_minutes
-                )
-
-            effective_state, blocked, gate_reason = _apply_transition_guard(
-                stable_prev_state, desired_state, now, confirmed=transition_confirmed
             )
-            if blocked and effective_state != desired_state:
-                state = effective_state
-                decision_state = state
-                decision_summary = f"HOLD: transition guard blocked ({gate_reason})"
-                if desired_state == "production":
-                    stop_rule_hits = stop_rule_hits or [f"Start delayed by transition guard ({gate_reason})"]
-                else:
-                    start_rule_hits = start_rule_hits or [f"Stop delayed by transition guard ({gate_reason})"]
-            else:
-                state = effective_state
-                decision_state = state
-                if state == desired_state:
-                    _pending_transition_state = None
-                    _pending_transition_since = None
-                    _pending_transition_hits = 0
-
-        hist.update({
-            "decision_state": decision_state,
-            "decision_start_rules": start_rule_hits,
-            "decision_stop_rules": stop_rule_hits,
-            "decision_summary": decision_summary,
-        })
-
-        if state == "production" and prev_state != "production":
+        elif decision.notify == "started":
             _last_production_start_at = now
             send_telegram_message(
                 f""" Production started!
@@ -2787,7 +5440,7 @@ ________________________________
  Temperature: {temperature}
  Humidity: {humidity}%"""
             )
-        elif state == "stop" and prev_state != "stop":
+        elif decision.notify == "stopped":
             _last_production_start_at = None
             send_telegram_message(
                 f""" Production stopped.
@@ -2822,59 +5475,464 @@ ________________________________
         )
 
 
-def _load_telemetry_from_file() -> int:
-    """Load persisted telemetry points into in-memory deque at startup."""
-    candidates = [TELEMETRY_FILE, TELEMETRY_BACKUP_FILE]
+def _telemetry_journal_targets() -> List[Path]:
+    targets = [TELEMETRY_JOURNAL_FILE]
+    if TELEMETRY_BACKUP_JOURNAL_FILE != TELEMETRY_JOURNAL_FILE:
+        targets.append(TELEMETRY_BACKUP_JOURNAL_FILE)
+    return targets
 
-    # Backward compatibility: previous versions may have written to cwd/telemetry_history.json
-    legacy_cwd_file = (Path.cwd() / "telemetry_history.json").resolve()
-    if legacy_cwd_file not in candidates:
-        candidates.append(legacy_cwd_file)
 
-    loaded_total = 0
-    seen_ts = set()
+def _read_telemetry_journal(fp: Path) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Read a JSONL telemetry journal and return (records, bad_lines).
+    A torn last line (crash in the middle of an append) is truncated away so the next
+    append starts on a clean line boundary; corrupt lines elsewhere are skipped.
+    """
+    records: List[Dict[str, Any]] = []
+    bad_lines = 0
+    offset = 0
+    good_end = 0
+    torn_tail = False
+    missing_newline = False
+
+    with fp.open("rb") as fh:
+        for raw in fh:
+            offset += len(raw)
+            complete = raw.endswith(b"\n")
+            if not raw.strip():
+                good_end = offset
+                continue
+            try:
+                item = json.loads(raw)
+            except ValueError:
+                item = None
+            if isinstance(item, dict):
+                records.append(item)
+                good_end = offset
+                missing_newline = not complete
+            elif not complete:
+                torn_tail = True
+            else:
+                bad_lines += 1
+                good_end = offset
 
-    try:
-        telemetry_history.clear()
+    if torn_tail:
+        print(f"[Telemetry] Truncating torn journal tail in {fp} ({offset - good_end} bytes).")
+        with fp.open("r+b") as fh:
+            fh.truncate(good_end)
+    elif missing_newline:
+        with fp.open("ab") as fh:
+            fh.write(b"\n")
+    return records, bad_lines
 
-        for fp in candidates:
-            if not fp.exists():
+
+def _legacy_telemetry_files(journals: List[Path]) -> List[Path]:
+    # Pre-journal versions stored a single JSON list per store (and at one point in cwd).
+    legacy_files = [TELEMETRY_FILE, TELEMETRY_BACKUP_FILE, (Path.cwd() / "telemetry_history.json").resolve()]
+    return [fp for i, fp in enumerate(legacy_files) if fp not in journals and fp not in legacy_files[:i]]
+
+
+def _collect_persisted_telemetry(journals: List[Path], legacy_files: List[Path]) -> Tuple[List[Dict[str, Any]], bool, List[Path]]:
+    """
+    Merge journals and legacy JSON list files into one ts-deduplicated, epoch-sorted list.
+    Returns (records, was_sorted, legacy_files_read).
+    """
+    merged: List[Dict[str, Any]] = []
+    merged_epochs: List[float] = []
+    seen_ts = set()
+    legacy_read: List[Path] = []
+
+    def _take(items: List[Any]) -> None:
+        for item in items:
+            if not isinstance(item, dict):
                 continue
-            try:
-                with fp.open("r", encoding="utf-8") as fh:
-                    payload = json.load(fh)
-            except Exception as err:
-                print(f"[Telemetry] Failed reading {fp}: {err}")
+            ts = str(item.get("ts", "")).strip()
+            if not ts or ts in seen_ts:
                 continue
+            parsed = _parse_timestamp(ts)
+            merged.append(item)
+            merged_epochs.append(parsed.timestamp() if parsed else float("-inf"))
+            seen_ts.add(ts)
 
-            if not isinstance(payload, list):
-                print(f"[Telemetry] Ignoring non-list telemetry payload in {fp}.")
-                continue
+    for fp in journals:
+        if not fp.exists():
+            continue
+        try:
+            records, bad_lines = _read_telemetry_journal(fp)
+        except Exception as err:
+            print(f"[Telemetry] Failed reading {fp}: {err}")
+            continue
+        _telemetry_journal_lines[fp] = len(records) + bad_lines
+        if bad_lines:
+            print(f"[Telemetry] Skipped {bad_lines} corrupt line(s) in {fp}.")
+        _take(records)
 
-            for item in payload:
-                if not isinstance(item, dict):
-                    continue
-                ts = str(item.get("ts", "")).strip()
-                if not ts or ts in seen_ts:
-                    continue
-                telemetry_history.append(item)
-                seen_ts.add(ts)
-                loaded_total += 1
+    for fp in legacy_files:
+        if not fp.exists():
+            continue
+        try:
+            with fp.open("r", encoding="utf-8") as fh:
+                payload = json.load(fh)
+        except Exception as err:
+            print(f"[Telemetry] Failed reading {fp}: {err}")
+            continue
+
+        if not isinstance(payload, list):
+            print(f"[Telemetry] Ignoring non-list telemetry payload in {fp}.")
+            continue
+        _take(payload)
+        legacy_read.append(fp)
+
+    order = sorted(range(len(merged)), key=merged_epochs.__getitem__)
+    was_sorted = all(i == j for i, j in enumerate(order))
+    return [merged[i] for i in order], was_sorted, legacy_read
 
-        sorted_hist = sorted(list(telemetry_history), key=lambda x: str(x.get("ts", "")))
+
+def _load_telemetry_from_store() -> int:
+    """
+    SQLite/segment backend startup: import file stores once into an empty store, then keep
+    only a recent hot window in memory. Older ranges are read from disk on demand.
+    """
+    try:
         telemetry_history.clear()
-        telemetry_history.extend(sorted_hist)
+        # An empty store that already has rollups was emptied by retention, not newly created.
+        if telemetry_store.count() == 0 and not any(recs for recs, _ in telemetry_rollups.values()):
+            journals = _telemetry_journal_targets()
+            records, _, _ = _collect_persisted_telemetry(journals, _legacy_telemetry_files(journals))
+            if records:
+                imported = telemetry_store.extend(records)
+                print(f"[Telemetry] Imported {imported} file-store points into {telemetry_store.path}")
+
+        now = datetime.now(tz=budapest_tz)
+        since = now - timedelta(days=TELEMETRY_MEMORY_DAYS)
+        telemetry_history.extend(telemetry_store.rows_between(since.timestamp(), float("inf")))
+        print(
+            f"[Telemetry] {TELEMETRY_BACKEND} store has {telemetry_store.count()} points; "
+            f"{len(telemetry_history)} from the last {TELEMETRY_MEMORY_DAYS} days kept in memory."
+        )
+        return len(telemetry_history)
+    except Exception as err:
+        print(f"[Telemetry] Failed loading telemetry history: {err}")
+        return 0
+
+
+def _load_telemetry_from_file() -> int:
+    """Load persisted telemetry points (and rollups) into memory at startup, then apply retention."""
+    _load_telemetry_rollups()
+    loaded = _load_telemetry_from_store() if telemetry_store is not None else _load_telemetry_from_journals()
+    telemetry_transitions.rebuild(telemetry_history)
+    _seed_state_transitions_from_store()
+    charge_rate_estimator.reset(telemetry_history[-1] if telemetry_history else None)
+    try:
+        _apply_telemetry_retention(datetime.now(tz=budapest_tz))
+    except Exception as err:
+        print(f"[Telemetry] Retention pass failed: {err}")
+    return min(loaded, len(telemetry_history))
+
 
-        # Heal/seed both telemetry stores so restarts always have a consistent source.
-        _write_full_telemetry_history(telemetry_history)
+def _load_telemetry_from_journals() -> int:
+    journals = _telemetry_journal_targets()
+    legacy_files = _legacy_telemetry_files(journals)
+
+    try:
+        telemetry_history.clear()
+        _telemetry_journal_lines.clear()
+        records, was_sorted, migrated_legacy = _collect_persisted_telemetry(journals, legacy_files)
+        telemetry_history.extend(records)
+
+        # Heal/seed both journals only when they diverge from the merged history, so a clean
+        # restart costs one sequential read instead of a full rewrite.
+        stale = [fp for fp in journals if not was_sorted or _telemetry_journal_lines.get(fp) != len(telemetry_history)]
+        if stale:
+            _write_full_telemetry_history(records, stale)
+
+        if all(_telemetry_journal_lines.get(fp) == len(telemetry_history) for fp in journals):
+            for fp in migrated_legacy:
+                try:
+                    fp.replace(fp.with_name(fp.name + ".migrated"))
+                    print(f"[Telemetry] Migrated legacy telemetry file {fp} into the JSONL journal.")
+                except Exception as err:
+                    print(f"[Telemetry] Could not rename migrated legacy file {fp}: {err}")
 
-        print(f"[Telemetry] Loaded {len(telemetry_history)} points (raw read: {loaded_total}) from: {', '.join(str(x) for x in candidates)}")
+        print(f"[Telemetry] Loaded {len(telemetry_history)} points from: {', '.join(str(x) for x in journals + legacy_files)}")
         return len(telemetry_history)
     except Exception as err:
         print(f"[Telemetry] Failed loading telemetry history: {err}")
         return 0
 
 
+def _telemetry_rows_between(start_ts: datetime, end_ts: datetime) -> List[TelemetryRow]:
+    """Telemetry rows with start_ts <= ts < end_ts, oldest first (epoch range lookup)."""
+    source = telemetry_store if telemetry_store is not None else telemetry_history
+    return source.rows_between(start_ts.timestamp(), end_ts.timestamp())
+
+
+def _telemetry_rows_for_month(month: int) -> List[TelemetryRow]:
+    """
+    Telemetry that can contain same-calendar-month samples (any year), oldest first.
+    Answered with one epoch range lookup per year on record.
+    """
+    source = telemetry_store if telemetry_store is not None else telemetry_history
+    lo, hi = source.epoch_bounds()
+    if lo is None or hi is None:
+        return []
+    rows: List[TelemetryRow] = []
+    first_year = datetime.fromtimestamp(lo, tz=budapest_tz).year
+    last_year = datetime.fromtimestamp(hi, tz=budapest_tz).year
+    for year in range(first_year, last_year + 1):
+        # Include the last half hour of the previous month so pairs crossing the boundary survive.
+        start = datetime(year, month, 1, tzinfo=budapest_tz) - timedelta(minutes=30)
+        end = datetime(year + 1, 1, 1, tzinfo=budapest_tz) if month == 12 else datetime(year, month + 1, 1, tzinfo=budapest_tz)
+        rows.extend(source.rows_between(start.timestamp(), end.timestamp()))
+    return rows
+
+
+def _telemetry_export_rows() -> List[Dict[str, Any]]:
+    if telemetry_store is not None:
+        return [dict(x) for x in telemetry_store.rows_between(float("-inf"), float("inf"))]
+    return [dict(x) for x in telemetry_history]
+
+
+# =========================
+# TELEMETRY RETENTION / ROLLUPS
+# =========================
+ROLLUP_RANGE_FIELDS = ("battery", "power", "inv_l1", "inv_l2", "inv_l3", "inv_lt")
+ROLLUP_MEAN_FIELDS = (
+    "clouds", "garage_temp", "garage_hum", "internal_power", "early_start_soc", "min_stop_soc",
+    "late_day_reserve_soc", "weather_sunny_ratio_5d", "weather_bad_ratio_5d",
+)
+
+# Rollup records and their epochs, oldest first; each resolution's pair is swapped as a whole
+# so dashboard readers never see the two lists out of step.
+telemetry_rollups: Dict[str, Tuple[List[Dict[str, Any]], List[float]]] = {"1h": ([], []), "1d": ([], [])}
+_telemetry_retention_day: Optional[date_cls] = None
+
+
+class _TelemetryRollupBucket:
+    """
+    Running aggregate of one rollup bucket: min/mean/max for battery, power and phases, means
+    for the other numeric fields, share of each state/condition (state_share is the duty
+    cycle) and ratio of true flags. Accepts raw rows or finer rollup records.
+    """
+
+    def __init__(self, start: datetime, resolution: str):
+        self.start = start
+        self.resolution = resolution
+        self.samples = 0
+        self.sums: Dict[str, float] = defaultdict(float)
+        self.weights: Dict[str, float] = defaultdict(float)
+        self.mins: Dict[str, float] = {}
+        self.maxs: Dict[str, float] = {}
+        self.shares: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+    def _add(self, field: str, mean: float, lo: float, hi: float, weight: float) -> None:
+        self.sums[field] += mean * weight
+        self.weights[field] += weight
+        if field in ROLLUP_RANGE_FIELDS:
+            self.mins[field] = min(lo, self.mins.get(field, lo))
+            self.maxs[field] = max(hi, self.maxs.get(field, hi))
+
+    def add_row(self, row: Mapping) -> None:
+        self.samples += 1
+        for field in ROLLUP_RANGE_FIELDS + ROLLUP_MEAN_FIELDS:
+            v = row.get(field)
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                self._add(field, float(v), float(v), float(v), 1.0)
+        for field in TELEMETRY_CATEGORY_FIELDS:
+            v = row.get(field)
+            if isinstance(v, str):
+                self.shares[field][v] += 1.0
+        for field in TELEMETRY_BOOL_FIELDS:
+            v = row.get(field)
+            if isinstance(v, bool):
+                self._add(field, 1.0 if v else 0.0, 0.0, 0.0, 1.0)
+
+    def add_rollup(self, rec: Mapping) -> None:
+        n = _safe_float(rec.get("samples"), 0.0)
+        if n <= 0:
+            return
+        self.samples += int(n)
+        for field in ROLLUP_RANGE_FIELDS + ROLLUP_MEAN_FIELDS:
+            v = rec.get(field)
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                self._add(field, float(v), _safe_float(rec.get(f"{field}_min"), v), _safe_float(rec.get(f"{field}_max"), v), n)
+        for field in TELEMETRY_CATEGORY_FIELDS:
+            for value, share in (rec.get(f"{field}_share") or {}).items():
+                self.shares[field][value] += _safe_float(share) * n
+        for field in TELEMETRY_BOOL_FIELDS:
+            ratio = rec.get(f"{field}_ratio")
+            if isinstance(ratio, (int, float)):
+                self._add(field, float(ratio), 0.0, 0.0, n)
+
+    def to_record(self) -> Dict[str, Any]:
+        rec: Dict[str, Any] = {"ts": self.start.isoformat(), "resolution": self.resolution, "samples": self.samples}
+        for field in ROLLUP_RANGE_FIELDS + ROLLUP_MEAN_FIELDS:
+            weight = self.weights.get(field)
+            if not weight:
+                continue
+            rec[field] = round(self.sums[field] / weight, 3)
+            if field in ROLLUP_RANGE_FIELDS:
+                rec[f"{field}_min"] = self.mins[field]
+                rec[f"{field}_max"] = self.maxs[field]
+        for field in TELEMETRY_CATEGORY_FIELDS:
+            counts = self.shares.get(field)
+            if not counts:
+                continue
+            total = sum(counts.values())
+            rec[field] = max(counts, key=counts.get)
+            rec[f"{field}_share"] = {k: round(v / total, 4) for k, v in sorted(counts.items())}
+        for field in TELEMETRY_BOOL_FIELDS:
+            weight = self.weights.get(field)
+            if weight:
+                ratio = self.sums[field] / weight
+                rec[field] = ratio >= 0.5
+                rec[f"{field}_ratio"] = round(ratio, 4)
+        return rec
+
+
+def _rollup_bucket_start(dt: datetime, resolution: str) -> datetime:
+    local = dt.astimezone(budapest_tz)
+    if resolution == "1d":
+        return datetime(local.year, local.month, local.day, tzinfo=budapest_tz)
+    return local.replace(minute=0, second=0, microsecond=0)
+
+
+def _rollup_rows(rows, resolution: str) -> List[Dict[str, Any]]:
+    """Aggregate raw TelemetryRows or finer rollup records into buckets of the given resolution."""
+    buckets: Dict[datetime, _TelemetryRollupBucket] = {}
+    for row in rows:
+        dt = row.local_dt if isinstance(row, TelemetryRow) else _parse_timestamp(row.get("ts"))
+        if dt is None:
+            continue
+        start = _rollup_bucket_start(dt, resolution)
+        bucket = buckets.get(start)
+        if bucket is None:
+            bucket = buckets[start] = _TelemetryRollupBucket(start, resolution)
+        if "resolution" in row:
+            bucket.add_rollup(row)
+        else:
+            bucket.add_row(row)
+    return [buckets[k].to_record() for k in sorted(buckets)]
+
+
+def _rollup_epoch(rec: Dict[str, Any]) -> float:
+    ts = _parse_timestamp(rec.get("ts"))
+    return ts.timestamp() if ts else float("-inf")
+
+
+def _load_telemetry_rollups() -> None:
+    for res, fp in TELEMETRY_ROLLUP_FILES.items():
+        records: List[Dict[str, Any]] = []
+        if fp.exists():
+            try:
+                records, _ = _read_telemetry_journal(fp)
+            except Exception as err:
+                print(f"[Telemetry] Failed reading rollups {fp}: {err}")
+        records.sort(key=_rollup_epoch)
+        telemetry_rollups[res] = (records, [_rollup_epoch(r) for r in records])
+    print(
+        f"[Telemetry] Loaded {len(telemetry_rollups['1h'][0])} hourly and "
+        f"{len(telemetry_rollups['1d'][0])} daily rollups."
+    )
+
+
+def _add_telemetry_rollups(res: str, records: List[Dict[str, Any]]) -> int:
+    """Append rollups newer than the last stored bucket (a retried rollup is skipped)."""
+    old_records, old_epochs = telemetry_rollups[res]
+    last = old_epochs[-1] if old_epochs else float("-inf")
+    fresh = [(e, r) for e, r in ((_rollup_epoch(r), r) for r in records) if e > last]
+    if not fresh:
+        return 0
+    fp = TELEMETRY_ROLLUP_FILES[res]
+    try:
+        fp.parent.mkdir(parents=True, exist_ok=True)
+        with fp.open("a", encoding="utf-8") as fh:
+            fh.writelines(json.dumps(r, ensure_ascii=False) + "\n" for _, r in fresh)
+        _persist_dirty.add(fp)
+    except Exception as err:
+        print(f"[Telemetry] Failed to append rollups into {fp}: {err}")
+    telemetry_rollups[res] = (old_records + [r for _, r in fresh], old_epochs + [e for e, _ in fresh])
+    return len(fresh)
+
+
+def _apply_telemetry_retention(now: datetime, written_until: float = float("inf")) -> None:
+    """
+    Once per local day: roll raw rows older than TELEMETRY_RAW_DAYS into hourly buckets and
+    drop them (memory, journal or store), then fold hourly rollups older than
+    TELEMETRY_HOURLY_DAYS into daily ones. Cutoffs sit on local midnight so buckets are whole.
+    """
+    global _telemetry_retention_day
+    if TELEMETRY_RAW_DAYS <= 0 or _telemetry_retention_day == now.date():
+        return
+    _telemetry_retention_day = now.date()
+
+    def _midnight(days_back: int) -> float:
+        d = now.date() - timedelta(days=days_back)
+        return datetime(d.year, d.month, d.day, tzinfo=budapest_tz).timestamp()
+
+    raw_cutoff = _midnight(TELEMETRY_RAW_DAYS)
+    source = telemetry_store if telemetry_store is not None else telemetry_history
+    aged = source.rows_between(float("-inf"), raw_cutoff)
+    if aged:
+        added = _add_telemetry_rollups("1h", _rollup_rows(aged, "1h"))
+        if telemetry_store is not None:
+            telemetry_store.delete_before(raw_cutoff)
+        telemetry_history.drop_before(raw_cutoff)
+        if telemetry_store is None:
+            _compact_telemetry_journals(written_until)
+        print(f"[Telemetry] Retention: rolled {len(aged)} raw rows into {added} hourly buckets.")
+
+    hourly_cutoff = _midnight(TELEMETRY_HOURLY_DAYS)
+    hourly, hourly_epochs = telemetry_rollups["1h"]
+    k = bisect.bisect_left(hourly_epochs, hourly_cutoff)
+    if k:
+        added = _add_telemetry_rollups("1d", _rollup_rows(hourly[:k], "1d"))
+        telemetry_rollups["1h"] = (hourly[k:], hourly_epochs[k:])
+        try:
+            _write_file_atomic(
+                TELEMETRY_ROLLUP_FILES["1h"],
+                "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in hourly[k:]),
+            )
+            _persist_dirty.add(TELEMETRY_ROLLUP_FILES["1h"])
+        except Exception as err:
+            print(f"[Telemetry] Failed to compact hourly rollups: {err}")
+        print(f"[Telemetry] Retention: folded {k} hourly buckets into {added} daily buckets.")
+
+
+def _telemetry_rollups_between(res: str, start_epoch: float, end_epoch: float) -> List[Dict[str, Any]]:
+    """Rollup buckets overlapping [start_epoch, end_epoch), including the one start_epoch falls into."""
+    records, epochs = telemetry_rollups[res]
+    if start_epoch > float("-inf"):
+        start_epoch = _rollup_bucket_start(datetime.fromtimestamp(start_epoch, tz=budapest_tz), res).timestamp()
+    return records[bisect.bisect_left(epochs, start_epoch):bisect.bisect_left(epochs, end_epoch)]
+
+
+def _telemetry_series_between(start_ts: datetime, end_ts: datetime) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    Dashboard series for a range: raw rows when the range lies inside the raw retention
+    window, otherwise hourly (or, for spans past the hourly horizon, daily) rollups, with the
+    still-raw tail rolled up on the fly so the series is continuous. Returns (rows, resolution).
+    """
+    span_days = (end_ts - start_ts).total_seconds() / 86400.0
+    raw_from = datetime.now(tz=budapest_tz).date() - timedelta(days=TELEMETRY_RAW_DAYS)
+    if TELEMETRY_RAW_DAYS <= 0 or (
+        span_days <= TELEMETRY_RAW_DAYS
+        and start_ts >= datetime(raw_from.year, raw_from.month, raw_from.day, tzinfo=budapest_tz)
+    ):
+        return [dict(x) for x in _telemetry_rows_between(start_ts, end_ts)], "raw"
+
+    resolution = "1h" if span_days <= TELEMETRY_HOURLY_DAYS else "1d"
+    # The first bucket is returned whole, so the raw tail has to start on the same boundary.
+    start_ts = _rollup_bucket_start(start_ts, resolution)
+    lo, hi = start_ts.timestamp(), end_ts.timestamp()
+    raw = _telemetry_rows_between(start_ts, end_ts)
+    hourly = _telemetry_rollups_between("1h", lo, hi)
+    daily = _telemetry_rollups_between("1d", lo, hi)
+    if resolution == "1h":
+        return daily + hourly + _rollup_rows(raw, "1h"), "1h"
+    return daily + _rollup_rows(hourly + _rollup_rows(raw, "1h"), "1d"), "1d"
+
+
 def _record_telemetry(now: datetime, data: Dict[str, Any], battery: float, power: float,
                       state_val: str, current_condition: str, clouds: float,
                       garage_temp: Optional[float], garage_hum: Optional[float],
@@ -2910,7 +5968,11 @@ def _record_telemetry(now: datetime, data: Dict[str, Any], battery: float, power
         "weather_bad_ratio_5d": float((historical_hints or {}).get("weather_bad_ratio_5d", 0.0)),
     }
     telemetry_history.append(record)
-    _append_telemetry_to_file(record)
+    telemetry_transitions.observe(telemetry_history[-1].epoch_us, record["state"])
+    charge_rate_estimator.observe(telemetry_history[-1])
+    telemetry_context_window.observe(telemetry_history[-1])
+    _prune_telemetry_hot_window()
+    _persist_telemetry_record(record)
 
 
 def _is_active_window(now: datetime, sunrise_dt: Optional[datetime], sunset_dt: Optional[datetime]) -> bool:
@@ -2930,46 +5992,74 @@ def _is_active_window(now: datetime, sunrise_dt: Optional[datetime], sunset_dt:
     return (sunrise_dt.hour, sunrise_dt.minute) <= (now.hour, now.minute) <= (sunset_dt.hour, sunset_dt.minute)
 
 
-def _append_telemetry_to_file(record: Dict[str, Any]) -> None:
-    _persist_telemetry_record_to_file(TELEMETRY_FILE, record)
-    if TELEMETRY_BACKUP_FILE != TELEMETRY_FILE:
-        _persist_telemetry_record_to_file(TELEMETRY_BACKUP_FILE, record)
+def _prune_telemetry_hot_window() -> None:
+    """With a disk-backed store only the hot window stays in memory; older rows are read on demand."""
+    if telemetry_store is None:
+        return
+    telemetry_history.drop_before((datetime.now(tz=budapest_tz) - timedelta(days=TELEMETRY_MEMORY_DAYS)).timestamp())
 
 
-def _persist_telemetry_record_to_file(target_file: Path, record: Dict[str, Any]) -> None:
-    try:
-        target_file.parent.mkdir(parents=True, exist_ok=True)
+def _append_telemetry_records(records: List[Dict[str, Any]]) -> List[Path]:
+    """
+    Append a batch of records to the store or to each journal (one write per file); cost is
+    independent of how much history exists. Runs on the persister thread; returns the
+    journal files written.
+    """
+    global _telemetry_appends_since_compaction
+    if telemetry_store is not None:
+        try:
+            telemetry_store.extend(records)
+        except Exception as err:
+            print(f"[Telemetry] Failed to persist records into {telemetry_store.path}: {err}")
+        return []
 
-        existing: List[Dict[str, Any]] = []
-        if target_file.exists():
-            try:
-                with target_file.open("r", encoding="utf-8") as fh:
-                    payload = json.load(fh)
-                if isinstance(payload, list):
-                    existing = payload
-            except Exception as err:
-                print(f"[Telemetry] Could not read telemetry file {target_file}, recreating: {err}")
+    chunk = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+    targets = _telemetry_journal_targets()
+    for target_file in targets:
+        _append_telemetry_journal_line(target_file, chunk, len(records))
 
-        existing.append(record)
-        tmp_file = target_file.with_suffix(target_file.suffix + ".tmp")
-        with tmp_file.open("w", encoding="utf-8") as fh:
-            json.dump(existing, fh, ensure_ascii=False)
-        tmp_file.replace(target_file)
+    _telemetry_appends_since_compaction += len(records)
+    if _telemetry_appends_since_compaction >= TELEMETRY_COMPACT_EVERY:
+        _telemetry_appends_since_compaction = 0
+        last_ts = _parse_timestamp(records[-1].get("ts"))
+        _compact_telemetry_journals(last_ts.timestamp() if last_ts else float("inf"))
+    return targets
+
+
+def _compact_telemetry_journals(written_until: float = float("inf")) -> None:
+    """Rewrite journals whose line count drifted from the in-memory history."""
+    # Records still queued behind the current batch are not on disk yet; leave them out so
+    # the next batch does not append them a second time.
+    written = [row for row in telemetry_history if row.epoch is None or row.epoch <= written_until]
+    stale = [fp for fp in _telemetry_journal_targets() if _telemetry_journal_lines.get(fp) != len(written)]
+    if stale:
+        _write_full_telemetry_history(written, stale)
+
+
+def _append_telemetry_journal_line(target_file: Path, line: str, count: int = 1) -> None:
+    try:
+        target_file.parent.mkdir(parents=True, exist_ok=True)
+        with target_file.open("a", encoding="utf-8") as fh:
+            fh.write(line)
+        _telemetry_journal_lines[target_file] = _telemetry_journal_lines.get(target_file, 0) + count
     except Exception as err:
-        print(f"[Telemetry] Failed to persist record into {target_file}: {err}")
+        print(f"[Telemetry] Failed to append record into {target_file}: {err}")
 
 
-def _write_full_telemetry_history(history: deque) -> None:
+def _write_full_telemetry_history(history, targets: Optional[List[Path]] = None) -> None:
+    """Compact journals: atomically rewrite them from the in-memory history."""
     payload = list(history)
-    for target_file in {TELEMETRY_FILE, TELEMETRY_BACKUP_FILE}:
+    for target_file in (targets or _telemetry_journal_targets()):
         try:
             target_file.parent.mkdir(parents=True, exist_ok=True)
             tmp_file = target_file.with_suffix(target_file.suffix + ".tmp")
             with tmp_file.open("w", encoding="utf-8") as fh:
-                json.dump(payload, fh, ensure_ascii=False)
+                for rec in payload:
+                    fh.write(json.dumps(dict(rec), ensure_ascii=False) + "\n")
             tmp_file.replace(target_file)
+            _telemetry_journal_lines[target_file] = len(payload)
         except Exception as err:
-            print(f"[Telemetry] Failed to sync telemetry history into {target_file}: {err}")
+            print(f"[Telemetry] Failed to compact telemetry journal {target_file}: {err}")
 
 
 def _miner_action(action: str) -> Dict[str, Any]:
@@ -3292,13 +6382,8 @@ init();applyI18n();pull();setInterval(pull,10000);document.getElementById('theme
 """
 
 
-def _build_snapshot_payload(from_date: Optional[str] = None, to_date: Optional[str] = None) -> Dict[str, Any]:
-    with snapshot_lock:
-        snap = dict(_shared_snapshot)
-        hist = list(telemetry_history)
-    notices = list(web_notifications)[:5]
-
-    now = datetime.now(tz=budapest_tz)
+def _parse_date_range(from_date: Optional[str], to_date: Optional[str], now: datetime) -> Tuple[datetime, datetime]:
+    """Dashboard ?from=&to= (YYYY-MM-DD, inclusive) as [start, end); defaults to the last 30 days."""
     start_ts = None
     end_ts = None
     try:
@@ -3315,19 +6400,17 @@ def _build_snapshot_payload(from_date: Optional[str] = None, to_date: Optional[s
     if start_ts is None or end_ts is None:
         end_ts = now + timedelta(seconds=1)
         start_ts = now - timedelta(days=30)
+    return start_ts, end_ts
 
-    filtered_hist = []
-    for item in hist:
-        try:
-            ts = datetime.fromisoformat(str(item.get("ts", "")))
-        except Exception:
-            continue
-        if ts.tzinfo is None:
-            ts = ts.replace(tzinfo=budapest_tz)
-        if start_ts <= ts < end_ts:
-            filtered_hist.append(item)
 
-    filtered_hist.sort(key=lambda x: str(x.get("ts", "")))
+def _build_snapshot_payload(from_date: Optional[str] = None, to_date: Optional[str] = None) -> Dict[str, Any]:
+    with snapshot_lock:
+        snap = dict(_shared_snapshot)
+    notices = list(web_notifications)[:5]
+
+    now = datetime.now(tz=budapest_tz)
+    start_ts, end_ts = _parse_date_range(from_date, to_date, now)
+    history, history_resolution = _telemetry_series_between(start_ts, end_ts)
 
     return {
         "battery": snap.get("battery", 0),
@@ -3340,13 +6423,58 @@ def _build_snapshot_payload(from_date: Optional[str] = None, to_date: Optional[s
         "hashrate_mhs": snap.get("hashrate_mhs"),
         "sunrise": snap.get("sunrise").isoformat() if snap.get("sunrise") else "",
         "sunset": snap.get("sunset").isoformat() if snap.get("sunset") else "",
-        "history_count": len(filtered_hist),
-        "history": filtered_hist,
+        "history_count": len(history),
+        "history": history,
+        "history_resolution": history_resolution,
         "historical_hints": snap.get("historical_hints", {}),
         "notifications": notices,
     }
 
 
+def _build_transitions_payload(from_date: Optional[str] = None, to_date: Optional[str] = None) -> Dict[str, Any]:
+    """State run windows (from the transition index) overlapping the requested range."""
+    now = datetime.now(tz=budapest_tz)
+    start_ts, end_ts = _parse_date_range(from_date, to_date, now)
+    start_us = (start_ts - _EPOCH_EPOCH) // timedelta(microseconds=1)
+    end_us = (end_ts - _EPOCH_EPOCH) // timedelta(microseconds=1)
+
+    index = telemetry_transitions
+    if index.first_us is None or start_us < index.first_us:
+        # Range reaches before the in-memory index (store backends keep a hot window only).
+        index = StateTransitionIndex()
+        index.rebuild(_telemetry_rows_between(start_ts, end_ts))
+
+    def _iso(us: int) -> str:
+        return (_EPOCH_EPOCH + timedelta(microseconds=us)).astimezone(budapest_tz).isoformat()
+
+    runs = []
+    for run in index.runs(start_us, end_us):
+        runs.append({
+            "state": run["state"],
+            "start": _iso(run["start_us"]),
+            "end": None if run["ongoing"] else _iso(run["end_us"]),
+            "last_seen": _iso(run["end_us"]),
+            "duration_minutes": round((run["end_us"] - run["start_us"]) / 6e7, 1),
+            "ongoing": run["ongoing"],
+        })
+    return {
+        "from": start_ts.isoformat(),
+        "to": end_ts.isoformat(),
+        "transition_count": sum(1 for us, _, _ in index.events if start_us <= us < end_us),
+        "runs": runs,
+    }
+
+
+def _build_stats_payload() -> Dict[str, Any]:
+    """Internal cache/counter stats for checking that the memoization layers work."""
+    return {
+        "historical_profile_version": historical_profile_version,
+        "profile_views": dict(_profile_views_stats, entries=len(_profile_views)),
+        "bridge_day_memo": bridge_day_memo.stats(),
+        "decision_latency": decision_latency.stats(),
+    }
+
+
 class WebHandler(BaseHTTPRequestHandler):
     def _write(self, code: int, body: bytes, ctype: str):
         self.send_response(code)
@@ -3406,10 +6534,26 @@ class WebHandler(BaseHTTPRequestHandler):
             ).encode("utf-8")
             self._write(200, payload, "application/json")
             return
+        if parsed.path == "/api/stats":
+            self._write(200, json.dumps(_build_stats_payload()).encode("utf-8"), "application/json")
+            return
+        if parsed.path == "/api/transitions":
+            qs = parse_qs(parsed.query)
+            payload = json.dumps(
+                _build_transitions_payload(
+                    qs.get("from", [None])[0],
+                    qs.get("to", [None])[0],
+                )
+            ).encode("utf-8")
+            self._write(200, payload, "application/json")
+            return
         if parsed.path == "/api/telemetry/download":
             try:
-                with snapshot_lock:
-                    payload_data = list(telemetry_history)
+                resolution = parse_qs(parsed.query).get("resolution", ["raw"])[0]
+                if resolution in telemetry_rollups:
+                    payload_data = list(telemetry_rollups[resolution][0])
+                else:
+                    payload_data = _telemetry_export_rows()
                 body = json.dumps(payload_data, ensure_ascii=False).encode("utf-8")
                 filename = f"telemetry_history_{datetime.now(tz=budapest_tz).strftime('%Y%m%d_%H%M%S')}.json"
                 self.send_response(200)
@@ -3476,11 +6620,12 @@ def _telegram_loop():
 
 
 def main_loop():
-    global prev_state, state, used_quote, sunrise, sunset, uptime, last_quote_reset_date, historical_profile
+    global prev_state, state, used_quote, sunrise, sunset, uptime, last_quote_reset_date
     global _restart_triggered_this_cycle
 
     if historical_profile is None:
-        historical_profile = build_historical_profile(HISTORY_DIR)
+        # No other thread is running yet, so this is the one build that may fork parser processes.
+        _install_historical_profile(build_historical_profile(HISTORY_DIR, parallel=True))
 
     _load_telemetry_from_file()
 
@@ -3496,6 +6641,9 @@ def main_loop():
     web_thread = threading.Thread(target=_start_web_server, name="web-gui", daemon=True)
     web_thread.start()
 
+    if HISTORY_WATCH_SECONDS > 0:
+        threading.Thread(target=_history_watch_loop, args=(HISTORY_DIR,), name="history-watcher", daemon=True).start()
+
     garage_temp_history = deque(maxlen=12)
     garage_hum_history = deque(maxlen=12)
     prev_garage_temp = None
@@ -3723,6 +6871,7 @@ if __name__ == '__main__':
     # Also try atexit as a last resort (won't catch SIGKILL)
     import atexit
     atexit.register(lambda: notify_shutdown(reason="atexit", err=None))
+    atexit.register(_flush_persistence)
 
     try:
         if is_rpi and OLED_AVAILABLE:
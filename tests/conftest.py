@@ -0,0 +1,23 @@
+"""
+solar.py reads its required settings at import time; placeholders are enough for the tests.
+State, quote and telemetry files go to a scratch directory and the profile artifact cache is
+off, so importing solar never touches the repo's own data files.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+for _key in ("MY_BOT_TOKEN", "MY_CHAT_ID", "MY_WEATHER_API", "MY_APP_ID", "MY_APP_SECRET",
+             "MY_EMAIL", "MY_PASSWORD", "MY_DEVICE_SN", "WALLET_ADDRESS"):
+    os.environ.setdefault(_key, "test")
+os.environ.setdefault("MY_LOCATION_LAT", "47.5")
+os.environ.setdefault("MY_LOCATION_LON", "19.04")
+_scratch = tempfile.mkdtemp(prefix="solar_test_")
+for _key, _name in (("MY_QUOTE_FILE", "quote.json"), ("MY_STATE_FILE", "state.json"),
+                    ("MY_SOLARMAN_FILE", "solarman.json"), ("MY_TELEMETRY_FILE", "telemetry_history.json")):
+    os.environ[_key] = os.path.join(_scratch, _name)
+os.environ["MY_TELEMETRY_BACKEND"] = "jsonl"
+os.environ["MY_HISTORY_PROFILE_CACHE"] = "off"
+sys.path.insert(0, ROOT)
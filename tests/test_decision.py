@@ -0,0 +1,200 @@
+import copy
+from datetime import datetime
+
+import solar
+
+TZ = solar.budapest_tz
+DAY = datetime(2026, 4, 11, tzinfo=TZ)
+
+
+def _hist(**over):
+    hist = {
+        "min_stop_soc": 35.0,
+        "early_start_soc": 60.0,
+        "late_day_reserve_soc": 50.0,
+        "headroom_good": False,
+        "should_preserve_battery": False,
+        "month_quality": "neutral",
+        "weather_risk_5d": "mixed",
+        "can_refill_before_sunset": True,
+        "predicted_minutes_to_full": 180.0,
+        "sunset_margin_minutes": 120.0,
+        "predicted_charge_rate_pct_per_hour": 10.0,
+    }
+    hist.update(over)
+    return hist
+
+
+def _guard(**over):
+    guard = {
+        "allow_start": True,
+        "reason": "bridge_energy_ok",
+        "energy_cover_ok": True,
+        "bridge_minutes": 95.0,
+        "eta_minutes": 40.0,
+        "capacity_wh": 5120.0,
+        "usable_wh": 2300.0,
+        "min_stop_soc": 35.0,
+    }
+    guard.update(over)
+    return guard
+
+
+def _inputs(hour=10, minute=0, soc=80.0, pv=2600.0, l2=1200.0, lt=1600.0, cond="clear sky",
+            hist=None, guard=None, prev_state="stop", pending=(None, None, 0), last_change=None):
+    now = DAY.replace(hour=hour, minute=minute)
+    return solar.DecisionInputs(
+        now, soc, pv, 0.0, l2, 0.0, lt, cond, cond, cond,
+        DAY.replace(hour=6, minute=15), DAY.replace(hour=19, minute=40),
+        hist if hist is not None else _hist(), guard if guard is not None else _guard(),
+        prev_state, None, pending,
+        last_state_change_us=round(last_change.timestamp() * 1e6) if last_change else None,
+    )
+
+
+def _fields(decision):
+    return {name: getattr(decision, name) for name in solar.Decision.__slots__}
+
+
+def test_start_snapshot():
+    decision = solar.evaluate_decision(_inputs())
+
+    assert decision.state == "production"
+    assert decision.summary == "START: start rules satisfied"
+    assert decision.start_rules == [
+        "Immediate capacity start: bridge energy ready and daily refill still feasible",
+        "Bridge guard OK + PV headroom + seasonal SOC/time gate",
+        "Predictive early start: refill before sunset is likely",
+        "Sunny+1H forecast, PV>0, SOC>=early_start, before 13h",
+        "Sunny+1H forecast, PV>=788W, SOC>=65, before 13h",
+        "Sunny+1H forecast, PV>=788W, SOC>=55, before 12h",
+        "Sunny+1H forecast, PV>=788W, SOC>=35, before 11h",
+        "Bridge-friendly morning start: SOC>=min_stop+12 and PV>=450W before 11h",
+        "Sunny+3H forecast, PV>0, SOC>=early_start, before 13h",
+        "Sunny+3H forecast, PV>=788W, SOC>=65, before 13h",
+        "Sunny+3H forecast, PV>=788W, SOC>=55, before 12h",
+        "Sunny+3H forecast, PV>=788W, SOC>=35, before 11h",
+        "SOC>=60 and PV>=2500W, before 11h",
+        "SOC>=70 and PV>=2250W, before 12h",
+        "SOC>=80 and PV>=2000W, before 13h",
+    ]
+    assert decision.stop_rules == []
+    assert decision.press_seconds == solar.POWER_BUTTON_SHORT_PRESS_SECONDS
+    assert decision.notify == "started"
+    assert decision.pending == (None, None, 0)
+    assert decision.log == ["Crypto production ready!", "Trying to press power button."]
+    assert decision.start_guard == decision.guard
+
+
+def test_hard_afternoon_cutoff_keeps_pending():
+    pending = ("production", DAY.replace(hour=14, minute=50), 1)
+    decision = solar.evaluate_decision(
+        _inputs(hour=solar.HARD_AFTERNOON_STOP_HOUR, soc=solar.HARD_AFTERNOON_STOP_SOC - 1,
+                prev_state="production", pending=pending)
+    )
+
+    assert decision.state == "stop"
+    assert decision.summary == "STOP: hard afternoon SOC cutoff"
+    assert decision.stop_rules == [
+        f"Hard afternoon cutoff: SOC<{solar.HARD_AFTERNOON_STOP_SOC:.0f}% after {solar.HARD_AFTERNOON_STOP_HOUR}:00"
+    ]
+    assert decision.press_seconds == solar.POWER_BUTTON_LONG_PRESS_SECONDS
+    assert decision.notify == "hard_cutoff"
+    assert decision.pending == pending
+
+
+def test_power_safety_while_stopped_is_silent():
+    decision = solar.evaluate_decision(_inputs(l2=2700.0, prev_state="stop"))
+
+    assert decision.state == "stop"
+    assert decision.summary == "STOP: power safety"
+    assert decision.stop_rules == ["Power safety threshold exceeded (L2/L3/Total inverter output)"]
+    assert decision.press_seconds is None
+    assert decision.notify is None
+    assert decision.log == ["Power safety threshold exceeded → Crypto production over (STOP)."]
+
+
+def test_battery_protection_skips_debounce_and_notification():
+    decision = solar.evaluate_decision(
+        _inputs(soc=30.0, prev_state="production", last_change=DAY.replace(hour=9, minute=55))
+    )
+
+    assert decision.state == "stop"
+    assert decision.summary == "STOP: battery protection"
+    assert decision.stop_rules == ["Battery below minimum stop SOC while running"]
+    assert decision.press_seconds == solar.POWER_BUTTON_LONG_PRESS_SECONDS
+    assert decision.notify is None
+    assert decision.pending == (None, None, 0)
+
+
+def test_runtime_stop_needs_three_confirmations_over_twelve_minutes():
+    stop_labels = [
+        f"Battery<{solar.BATTERY_PROTECT_SOC:.0f}% and PV<{max(150.0, solar.MINER_POWER_W * solar.PV_COVERAGE_RATIO_STOP):.0f}W"
+        " (insufficient solar cover) while running",
+        f"High-SOC bridge drained (SOC<{solar.HIGH_SOC_STOP_SOC:.0f}% and PV<={solar.HIGH_SOC_STOP_MAX_PV_W:.0f}W while running)",
+        "PV <= 150W",
+    ]
+    first = solar.evaluate_decision(_inputs(pv=100.0, prev_state="production"))
+    t0 = DAY.replace(hour=10)
+    assert first.state == "production"
+    assert first.summary == "HOLD: transition guard blocked (confirmation_pending)"
+    assert first.stop_rules == stop_labels
+    assert first.pending == ("stop", t0, 1)
+    # The stop branch picks the press before the debounce runs, as the loop always has.
+    assert first.press_seconds == solar.POWER_BUTTON_LONG_PRESS_SECONDS
+    assert first.notify is None
+
+    second = solar.evaluate_decision(_inputs(minute=5, pv=100.0, prev_state="production", pending=first.pending))
+    assert second.state == "production"
+    assert second.pending == ("stop", t0, 2)
+
+    third = solar.evaluate_decision(_inputs(minute=13, pv=100.0, prev_state="production", pending=second.pending))
+    assert third.state == "stop"
+    assert third.summary == "STOP: runtime stop rules satisfied"
+    assert third.stop_rules == stop_labels
+    assert third.press_seconds == solar.POWER_BUTTON_LONG_PRESS_SECONDS
+    assert third.notify == "stopped"
+    assert third.pending == (None, None, 0)
+
+
+def test_min_run_protection_holds_confirmed_stop():
+    pending = ("stop", DAY.replace(hour=9, minute=40), 2)
+    decision = solar.evaluate_decision(
+        _inputs(pv=100.0, prev_state="production", pending=pending,
+                last_change=DAY.replace(hour=9, minute=55))
+    )
+
+    assert decision.state == "production"
+    assert decision.summary == f"HOLD: transition guard blocked (min_run_protection(5.0<{solar.MIN_RUN_MINUTES}min))"
+    assert decision.pending == ("stop", pending[1], 3)
+    assert decision.notify is None
+
+
+def test_bridge_guard_blocks_start():
+    decision = solar.evaluate_decision(
+        _inputs(hour=11, soc=50.0, pv=300.0, guard=_guard(allow_start=False, reason="bridge_short"))
+    )
+
+    assert decision.state == "stop"
+    assert decision.summary == "STOP: bridge guard blocked start"
+    assert decision.stop_rules == ["Start guard blocked start (bridge_short)"]
+    assert decision.press_seconds is None
+    assert decision.notify is None
+    assert decision.hist_fields()["start_guard_allow"] is False
+
+
+def test_evaluation_is_deterministic_and_does_not_mutate_inputs():
+    inputs = _inputs(hour=9, soc=50.0, pv=300.0, guard=_guard(allow_start=False, reason="bridge_short"))
+    hist_before = copy.deepcopy(inputs.hist)
+    guard_before = copy.deepcopy(inputs.guard)
+
+    first = solar.evaluate_decision(inputs)
+    second = solar.evaluate_decision(inputs)
+
+    assert _fields(first) == _fields(second)
+    assert inputs.hist == hist_before
+    assert inputs.guard == guard_before
+    assert first.guard == guard_before
+    assert first.start_guard["allow_start"] is True
+    assert first.start_guard["reason"] == "aggressive_morning_refill_start"
+    assert first.state == "production"
@@ -0,0 +1,202 @@
+import json
+import os
+import shutil
+import threading
+
+import pytest
+
+import solar
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "solarman_json")
+SMALL_EXPORTS = ["2026-02-15_2026-03-01.json", "2026-03-01_2026-03-29.json", "2026-03-30_2026-04-01.json"]
+
+
+def _copy_exports(target, names):
+    target.mkdir(exist_ok=True)
+    for name in names:
+        shutil.copy2(os.path.join(SOURCE_DIR, name), target / name)
+    return str(target)
+
+
+def _fresh_profile(history_dir, monkeypatch):
+    """Profile built from scratch, without any artifact or aggregate."""
+    with monkeypatch.context() as m:
+        m.setattr(solar, "HISTORY_PROFILE_CACHE", "off")
+        return solar.build_historical_profile(history_dir)
+
+
+@pytest.fixture
+def cached(tmp_path, monkeypatch):
+    """Route the profile artifact and aggregate into tmp_path; counts files handed to the parser."""
+    monkeypatch.setattr(solar, "HISTORY_PROFILE_CACHE", str(tmp_path / "profile.json"))
+    monkeypatch.setattr(solar, "HISTORY_ENGINE", "python")
+    parsed = []
+    parse = solar._parse_history_file
+    monkeypatch.setattr(solar, "_parse_history_file", lambda fp: (parsed.append(os.path.basename(fp)), parse(fp))[1])
+    return parsed
+
+
+def test_artifact_is_reused_while_sources_are_unchanged(tmp_path, cached, monkeypatch):
+    history_dir = _copy_exports(tmp_path / "exports", SMALL_EXPORTS)
+    first = solar.build_historical_profile(history_dir)
+    assert sorted(cached) == SMALL_EXPORTS
+
+    cached.clear()
+    second = solar.build_historical_profile(history_dir)
+
+    assert cached == []
+    assert second == first == _fresh_profile(history_dir, monkeypatch)
+
+
+def test_touched_file_with_same_content_is_not_reparsed(tmp_path, cached):
+    history_dir = _copy_exports(tmp_path / "exports", SMALL_EXPORTS)
+    first = solar.build_historical_profile(history_dir)
+    touched = os.path.join(history_dir, SMALL_EXPORTS[1])
+    os.utime(touched, ns=(0, os.stat(touched).st_mtime_ns + 10 ** 9))
+
+    cached.clear()
+    assert solar.build_historical_profile(history_dir) == first
+    assert cached == []
+
+
+def test_changed_file_is_the_only_one_reparsed(tmp_path, cached, monkeypatch):
+    history_dir = _copy_exports(tmp_path / "exports", SMALL_EXPORTS)
+    solar.build_historical_profile(history_dir)
+    changed = os.path.join(history_dir, SMALL_EXPORTS[0])
+    with open(changed, encoding="utf-8") as fh:
+        rows = json.load(fh)
+    with open(changed, "w", encoding="utf-8") as fh:
+        json.dump(rows[: len(rows) // 2], fh)
+
+    cached.clear()
+    profile = solar.build_historical_profile(history_dir)
+
+    assert cached == [SMALL_EXPORTS[0]]
+    assert profile == _fresh_profile(history_dir, monkeypatch)
+
+
+def test_added_export_merges_into_the_same_profile_as_a_rebuild(tmp_path, cached, monkeypatch):
+    # The first two exports overlap on 2026-03-01, so the merge also has to re-pick duplicate minutes.
+    history_dir = _copy_exports(tmp_path / "exports", SMALL_EXPORTS[:2])
+    solar.build_historical_profile(history_dir)
+    _copy_exports(tmp_path / "exports", SMALL_EXPORTS[2:])
+
+    cached.clear()
+    profile = solar.build_historical_profile(history_dir)
+
+    assert cached == [SMALL_EXPORTS[2]]
+    assert profile == _fresh_profile(history_dir, monkeypatch)
+
+
+def test_removed_export_is_retracted_from_the_aggregate(tmp_path, cached, monkeypatch):
+    history_dir = _copy_exports(tmp_path / "exports", SMALL_EXPORTS)
+    solar.build_historical_profile(history_dir)
+    os.remove(os.path.join(history_dir, SMALL_EXPORTS[1]))
+
+    cached.clear()
+    profile = solar.build_historical_profile(history_dir)
+
+    assert cached == []
+    assert profile == _fresh_profile(history_dir, monkeypatch)
+
+
+def test_parse_forks_workers_only_when_asked_and_single_threaded(tmp_path, monkeypatch):
+    history_dir = _copy_exports(tmp_path / "exports", SMALL_EXPORTS)
+    monkeypatch.setattr(solar, "HISTORY_PROFILE_CACHE", "off")
+    monkeypatch.setattr(solar, "HISTORY_WORKERS", 2)
+    expected = _fresh_profile(history_dir, monkeypatch)
+
+    def refuse(*args, **kwargs):
+        raise AssertionError("forked a parser pool")
+
+    monkeypatch.setattr(solar, "ProcessPoolExecutor", refuse)
+
+    # The watcher rebuilds from its own thread while the telegram/web/persister threads run.
+    results = []
+    watcher = threading.Thread(target=lambda: results.append(solar.build_historical_profile(history_dir, parallel=True)))
+    watcher.start()
+    watcher.join()
+
+    assert results == [expected]
+
+
+def _aggregate_from(names):
+    aggregate = solar.HistoryProfileAggregate()
+    parsed = [solar._parse_history_file(os.path.join(SOURCE_DIR, name)) for name in names]
+    aggregate.load_days([solar.HistoryProfileAggregate.parsed_range(rows) for rows in parsed])
+    for name, rows in zip(names, parsed):
+        aggregate.add_source(name, {"size": 0}, rows)
+    return aggregate
+
+
+def test_aggregate_file_round_trip_keeps_the_profile(tmp_path):
+    path = tmp_path / "profile.aggregate.bin"
+    aggregate = _aggregate_from(SMALL_EXPORTS)
+    aggregate.save(path)
+
+    restored = solar.HistoryProfileAggregate.load(path)
+    assert restored.profile(len(SMALL_EXPORTS)) == aggregate.profile(len(SMALL_EXPORTS))
+    assert restored.dups == aggregate.dups
+
+    # Retracting the last export only copies out the days it covers.
+    restored.load_days([restored.source_range(SMALL_EXPORTS[2])])
+    assert sum(len(span.columns[0]) for span in restored._spans) < restored.rows // 4
+    restored.remove_source(SMALL_EXPORTS[2])
+    restored.save(path)
+    restored.close()
+
+    reloaded = solar.HistoryProfileAggregate.load(path)
+    assert reloaded.profile(2) == _aggregate_from(SMALL_EXPORTS[:2]).profile(2)
+    reloaded.close()
+
+
+def _expected_records(payload):
+    return [
+        (row.get("Updated Time", ""), row.get("Production Power(W)"), row.get("SoC(%)")) if isinstance(row, dict) else None
+        for row in payload
+    ]
+
+
+@pytest.mark.parametrize("name", sorted(os.listdir(SOURCE_DIR)))
+def test_streaming_parser_matches_json_load(name):
+    fp = os.path.join(SOURCE_DIR, name)
+    with open(fp, encoding="utf-8") as fh:
+        expected = _expected_records(json.load(fh))
+    assert list(solar._iter_history_records(fp)) == expected
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 64, 4096])
+def test_streaming_parser_handles_any_chunk_boundary(chunk, monkeypatch, tmp_path):
+    fp = os.path.join(SOURCE_DIR, SMALL_EXPORTS[2])
+    with open(fp, encoding="utf-8") as fh:
+        expected = _expected_records(json.load(fh))[:400]
+    monkeypatch.setattr(solar, "HISTORY_READ_CHUNK", chunk)
+    text = json.dumps([{"Updated Time": r[0], "Production Power(W)": r[1], "SoC(%)": r[2]} for r in expected], indent=1)
+    sample = tmp_path / "export.json"
+    sample.write_text(text, encoding="utf-8")
+    assert list(solar._iter_history_records(str(sample))) == expected
+
+
+@pytest.mark.parametrize("text, records", [
+    ("[]", []),
+    (' [ {"Updated Time": "2026/04/01 10:00", "SoC(%)": -2500.5} , 3 , "x" ]\n',
+     [("2026/04/01 10:00", None, -2500.5), None, None]),
+])
+def test_streaming_parser_small_payloads(text, records, tmp_path):
+    fp = tmp_path / "export.json"
+    fp.write_text(text, encoding="utf-8")
+    assert list(solar._iter_history_records(str(fp))) == records
+
+
+@pytest.mark.parametrize("text, error", [
+    ('{"Updated Time": "2026/04/01 10:00"}', TypeError),
+    ("", ValueError),
+    ('[{"Updated Time": "2026/04/01 10:00"}', ValueError),
+    ('[{"Updated Time": "2026/04/01 10:00"} {}]', ValueError),
+    ("[1, 2] [3]", ValueError),
+])
+def test_streaming_parser_rejects_what_json_load_rejects(text, error, tmp_path):
+    fp = tmp_path / "export.json"
+    fp.write_text(text, encoding="utf-8")
+    with pytest.raises(error):
+        list(solar._iter_history_records(str(fp)))
@@ -0,0 +1,39 @@
+import random
+import statistics
+
+import pytest
+
+import solar
+
+
+def test_empty_sketch_has_no_value():
+    assert solar.P2Quantile(0.5).value() is None
+
+
+@pytest.mark.parametrize("values", [[3.0], [4.0, 1.0], [5.0, 1.0, 3.0], [2.0, 8.0, 4.0, 6.0], [9.0, 1.0, 5.0, 3.0, 7.0]])
+def test_exact_up_to_five_values(values):
+    sketch = solar.P2Quantile(0.5)
+    for v in values:
+        sketch.add(v)
+    assert sketch.value() == pytest.approx(statistics.median(values))
+
+
+@pytest.mark.parametrize("p", [0.1, 0.5, 0.9])
+def test_tracks_quantiles_of_a_large_stream(p):
+    rng = random.Random(1985)
+    values = [rng.gauss(500.0, 120.0) for _ in range(20000)]
+    sketch = solar.P2Quantile(p)
+    for v in values:
+        sketch.add(v)
+    exact = statistics.quantiles(values, n=10, method="inclusive")[round(p * 10) - 1]
+    assert sketch.value() == pytest.approx(exact, abs=10.0)
+
+
+def test_constant_and_sorted_streams_stay_in_range():
+    constant = solar.P2Quantile(0.5)
+    rising = solar.P2Quantile(0.9)
+    for i in range(1000):
+        constant.add(42.0)
+        rising.add(float(i))
+    assert constant.value() == 42.0
+    assert 850.0 <= rising.value() <= 950.0
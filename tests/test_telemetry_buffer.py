@@ -0,0 +1,126 @@
+import json
+
+import solar
+
+RECORDS = [
+    {"ts": "2026-04-11T10:00:00+02:00", "battery": 55.0, "power": 1200.5, "state": "production",
+     "condition": "clear sky", "should_preserve_battery": False, "headroom_good": True},
+    # None values, wrong types and unknown keys all land in the per-row extras.
+    {"ts": "2026-04-11T10:05:00+02:00", "battery": None, "power": "n/a", "state": None,
+     "should_preserve_battery": 1, "month_quality": 3, "note": {"nested": [1, 2]}},
+    # Naive timestamp, integer and NaN values, missing fields.
+    {"ts": "2026-04-11T10:10:00", "battery": 57, "clouds": 40, "garage_temp": float("nan")},
+    # Offset that is not a whole minute, and a timestamp that does not parse.
+    {"ts": "2026-04-11T10:15:00+02:00:30", "power": 0.0},
+    {"ts": "yesterday", "state": "stop"},
+    {"battery": 12.5},
+]
+
+
+def _buffer(records=RECORDS):
+    buf = solar.TelemetryBuffer()
+    buf.extend(records)
+    return buf
+
+
+def test_round_trip_is_exact():
+    buf = _buffer()
+    assert len(buf) == len(RECORDS)
+    for row, rec in zip(buf, RECORDS):
+        assert json.dumps(dict(row), sort_keys=True) == json.dumps(rec, sort_keys=True)
+        for key, value in rec.items():
+            assert type(row[key]) is type(value)
+
+
+def test_missing_keys_behave_like_a_dict():
+    row = _buffer()[2]
+    assert "power" not in row
+    assert row.get("power") is None
+    assert row.get("state", "unknown") == "unknown"
+
+
+def test_epoch_matches_timestamp():
+    buf = _buffer()
+    assert buf[0].epoch == solar.datetime.fromisoformat(RECORDS[0]["ts"]).timestamp()
+    naive = solar.datetime.fromisoformat(RECORDS[2]["ts"]).replace(tzinfo=solar.budapest_tz)
+    assert buf[2].epoch == naive.timestamp()
+    assert buf[4].epoch is None
+    assert buf[5].epoch is None
+
+
+def test_eviction_keeps_earlier_views_valid():
+    buf = _buffer(RECORDS[:3])
+    first = buf[0]
+    evicted = buf.popleft()
+
+    assert dict(evicted) == RECORDS[0]
+    assert dict(first) == RECORDS[0]
+    assert [dict(r) for r in buf] == RECORDS[1:3]
+
+    buf.drop_first(5)
+    assert len(buf) == 0
+    assert not buf
+
+
+def test_drop_before_evicts_leading_rows():
+    buf = _buffer(RECORDS[:3])
+    dropped = buf.drop_before(buf[1].epoch)
+
+    assert dropped == 1
+    assert [dict(r) for r in buf] == RECORDS[1:3]
+    buf.append(RECORDS[0])
+    assert dict(buf[-1]) == RECORDS[0]
+
+
+def _brute_force(records, start, end):
+    def key(rec):
+        dt = solar.datetime.fromisoformat(rec["ts"])
+        return dt if dt.tzinfo else dt.replace(tzinfo=solar.budapest_tz)
+    hits = [rec for rec in records if start <= key(rec) < end]
+    return sorted(hits, key=key)
+
+
+def _dst_records():
+    # Across the October 2025 fall-back: aware ISO stamps carry both offsets of the repeated hour.
+    start = solar.datetime(2025, 10, 25, 22, 0, tzinfo=solar.dt_timezone.utc)
+    out = []
+    for i in range(0, 8 * 60, 7):
+        dt = (start + solar.timedelta(minutes=i)).astimezone(solar.budapest_tz)
+        out.append({"ts": dt.isoformat(), "battery": float(i)})
+    return out
+
+
+def test_rows_between_matches_datetime_filter():
+    records = _dst_records()
+    buf = _buffer(records)
+    tz = solar.budapest_tz
+    windows = [
+        (solar.datetime(2025, 10, 26, 1, 30, tzinfo=tz), solar.datetime(2025, 10, 26, 3, 30, tzinfo=tz)),
+        (solar.datetime(2025, 10, 26, 2, 0, fold=1, tzinfo=tz), solar.datetime(2025, 10, 26, 2, 59, fold=1, tzinfo=tz)),
+        (solar.datetime(2020, 1, 1, tzinfo=tz), solar.datetime(2030, 1, 1, tzinfo=tz)),
+    ]
+    for start, end in windows:
+        got = [dict(r) for r in buf.rows_between(start.timestamp(), end.timestamp())]
+        assert got == _brute_force(records, start, end)
+
+
+def test_rows_between_sorts_out_of_order_rows():
+    records = _dst_records()
+    shuffled = records[1::2] + records[::2]
+    buf = _buffer(shuffled)
+    start = solar.datetime(2025, 10, 26, 1, 0, tzinfo=solar.budapest_tz)
+    end = solar.datetime(2025, 10, 26, 4, 0, tzinfo=solar.budapest_tz)
+
+    got = [dict(r) for r in buf.rows_between(start.timestamp(), end.timestamp())]
+
+    assert got == _brute_force(records, start, end)
+    everything = buf.rows_between(0, float("inf"))
+    assert buf.epoch_bounds() == (everything[0].epoch, everything[-1].epoch)
+
+
+def test_epoch_us_differences_match_timedelta():
+    records = _dst_records()
+    buf = _buffer(records)
+    for i in range(1, len(records)):
+        expected = solar.datetime.fromisoformat(records[i]["ts"]) - solar.datetime.fromisoformat(records[i - 1]["ts"])
+        assert buf[i].epoch_us - buf[i - 1].epoch_us == expected // solar.timedelta(microseconds=1)
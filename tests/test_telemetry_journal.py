@@ -0,0 +1,99 @@
+import json
+
+import solar
+
+
+def _write_lines(path, *chunks):
+    path.write_bytes(b"".join(chunks))
+
+
+def _rec(minute, **extra):
+    rec = {"ts": f"2026-04-11T10:{minute:02d}:00+02:00", "battery": 50.0 + minute, "state": "stop"}
+    rec.update(extra)
+    return rec
+
+
+def _line(rec):
+    return (json.dumps(rec) + "\n").encode()
+
+
+def test_torn_last_line_is_truncated(tmp_path):
+    journal = tmp_path / "telemetry_history.jsonl"
+    good = _line(_rec(0)) + _line(_rec(1))
+    _write_lines(journal, good, b'{"ts": "2026-04-11T10:02:00+02:00", "batt')
+
+    records, bad = solar._read_telemetry_journal(journal)
+
+    assert records == [_rec(0), _rec(1)]
+    assert bad == 0
+    assert journal.read_bytes() == good
+
+
+def test_append_after_torn_tail_recovery_starts_on_clean_line(tmp_path):
+    journal = tmp_path / "telemetry_history.jsonl"
+    _write_lines(journal, _line(_rec(0)), b'{"ts": "2026-04-11T10:01')
+    solar._read_telemetry_journal(journal)
+
+    solar._append_telemetry_journal_line(journal, _line(_rec(2)).decode())
+
+    records, bad = solar._read_telemetry_journal(journal)
+    assert records == [_rec(0), _rec(2)]
+    assert bad == 0
+
+
+def test_missing_final_newline_is_restored(tmp_path):
+    journal = tmp_path / "telemetry_history.jsonl"
+    _write_lines(journal, _line(_rec(0)), json.dumps(_rec(1)).encode())
+
+    records, _ = solar._read_telemetry_journal(journal)
+
+    assert records == [_rec(0), _rec(1)]
+    assert journal.read_bytes().endswith(b"}\n")
+
+
+def test_corrupt_middle_line_is_skipped_and_kept(tmp_path):
+    journal = tmp_path / "telemetry_history.jsonl"
+    content = _line(_rec(0)) + b"not json\n" + _line(_rec(2))
+    _write_lines(journal, content)
+
+    records, bad = solar._read_telemetry_journal(journal)
+
+    assert records == [_rec(0), _rec(2)]
+    assert bad == 1
+    assert journal.read_bytes() == content
+
+
+def test_compaction_rewrites_drifted_journals(tmp_path, monkeypatch):
+    journal = tmp_path / "telemetry_history.jsonl"
+    backup = tmp_path / "telemetry_history_backup.jsonl"
+    history = solar.TelemetryBuffer()
+    history.extend([_rec(0), _rec(1), _rec(2, extra_note="x")])
+    monkeypatch.setattr(solar, "TELEMETRY_JOURNAL_FILE", journal)
+    monkeypatch.setattr(solar, "TELEMETRY_BACKUP_JOURNAL_FILE", backup)
+    monkeypatch.setattr(solar, "telemetry_history", history)
+    monkeypatch.setattr(solar, "_telemetry_journal_lines", {backup: 3})
+    _write_lines(journal, _line(_rec(0)), _line(_rec(0)), _line(_rec(1)))
+    _write_lines(backup, b"untouched\n")
+
+    solar._compact_telemetry_journals()
+
+    records, bad = solar._read_telemetry_journal(journal)
+    assert records == [_rec(0), _rec(1), _rec(2, extra_note="x")]
+    assert bad == 0
+    assert backup.read_bytes() == b"untouched\n"
+    assert solar._telemetry_journal_lines[journal] == 3
+
+
+def test_compaction_leaves_out_records_not_yet_written(tmp_path, monkeypatch):
+    journal = tmp_path / "telemetry_history.jsonl"
+    history = solar.TelemetryBuffer()
+    history.extend([_rec(0), _rec(1), _rec(2)])
+    monkeypatch.setattr(solar, "TELEMETRY_JOURNAL_FILE", journal)
+    monkeypatch.setattr(solar, "TELEMETRY_BACKUP_JOURNAL_FILE", journal)
+    monkeypatch.setattr(solar, "telemetry_history", history)
+    monkeypatch.setattr(solar, "_telemetry_journal_lines", {})
+
+    solar._compact_telemetry_journals(written_until=history[1].epoch)
+
+    records, _ = solar._read_telemetry_journal(journal)
+    assert records == [_rec(0), _rec(1)]
@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import solar
+
+RAW_DAYS, HOURLY_DAYS = 2, 3
+
+
+def _local(rec):
+    return datetime.fromisoformat(rec["ts"]).astimezone(solar.budapest_tz)
+
+
+def _lines(path):
+    records, bad = solar._read_telemetry_journal(path)
+    assert bad == 0
+    return records
+
+
+@pytest.fixture
+def telemetry(tmp_path, monkeypatch):
+    """
+    Five whole days of 5-minute samples ending at today's midnight, in memory and in both journals,
+    with 2 raw days and 3 hourly days of retention; returns (now, today's midnight, records).
+    """
+    monkeypatch.setattr(solar, "TELEMETRY_RAW_DAYS", RAW_DAYS)
+    monkeypatch.setattr(solar, "TELEMETRY_HOURLY_DAYS", HOURLY_DAYS)
+    monkeypatch.setattr(solar, "telemetry_store", None)
+    monkeypatch.setattr(solar, "telemetry_history", solar.TelemetryBuffer())
+    monkeypatch.setattr(solar, "telemetry_rollups", {"1h": ([], []), "1d": ([], [])})
+    monkeypatch.setattr(solar, "_telemetry_retention_day", None)
+    monkeypatch.setattr(solar, "_telemetry_journal_lines", {})
+    monkeypatch.setattr(solar, "_persist_dirty", set())
+    monkeypatch.setattr(solar, "TELEMETRY_JOURNAL_FILE", tmp_path / "telemetry_history.jsonl")
+    monkeypatch.setattr(solar, "TELEMETRY_BACKUP_JOURNAL_FILE", tmp_path / "telemetry_history_backup.jsonl")
+    monkeypatch.setattr(solar, "TELEMETRY_ROLLUP_FILES", {res: tmp_path / f"rollup_{res}.jsonl" for res in ("1h", "1d")})
+
+    now = datetime.now(tz=solar.budapest_tz)
+    today = datetime(now.year, now.month, now.day, tzinfo=solar.budapest_tz)
+    records = []
+    epoch = (today - timedelta(days=5)).timestamp()
+    while epoch < today.timestamp():
+        dt = datetime.fromtimestamp(epoch, tz=solar.budapest_tz)
+        records.append({
+            "ts": dt.isoformat(),
+            "battery": float(dt.hour * 4),
+            "power": float(dt.minute * 10),
+            "state": "production" if 9 <= dt.hour < 15 else "stop",
+            "condition": "clear sky",
+        })
+        epoch += 300
+    for rec in records:
+        solar.telemetry_history.append(rec)
+    solar._write_full_telemetry_history(solar.telemetry_history)
+    return now, today, records
+
+
+def test_retention_rolls_up_raw_rows_and_compacts_the_journals(telemetry):
+    now, today, records = telemetry
+    raw_cutoff = today - timedelta(days=RAW_DAYS)
+    hourly_cutoff = today - timedelta(days=HOURLY_DAYS)
+
+    solar._apply_telemetry_retention(now)
+
+    kept = [rec for rec in records if _local(rec) >= raw_cutoff]
+    assert [dict(row) for row in solar.telemetry_history] == kept
+    assert _lines(solar.TELEMETRY_JOURNAL_FILE) == kept
+    assert _lines(solar.TELEMETRY_BACKUP_JOURNAL_FILE) == kept
+
+    hourly, hourly_epochs = solar.telemetry_rollups["1h"]
+    expected_hours = sorted({solar._rollup_bucket_start(_local(rec), "1h")
+                             for rec in records if hourly_cutoff <= _local(rec) < raw_cutoff})
+    assert [rec["ts"] for rec in hourly] == [h.isoformat() for h in expected_hours]
+    assert hourly_epochs == [h.timestamp() for h in expected_hours]
+    assert _lines(solar.TELEMETRY_ROLLUP_FILES["1h"]) == hourly
+    assert sum(rec["samples"] for rec in hourly) + len(kept) == len(
+        [rec for rec in records if _local(rec) >= hourly_cutoff]
+    )
+
+
+def test_retention_folds_old_hours_into_whole_days(telemetry):
+    now, today, records = telemetry
+    solar._apply_telemetry_retention(now)
+
+    daily = solar.telemetry_rollups["1d"][0]
+    days = [today - timedelta(days=back) for back in (5, 4)]
+    assert [rec["ts"] for rec in daily] == [d.isoformat() for d in days]
+    assert _lines(solar.TELEMETRY_ROLLUP_FILES["1d"]) == daily
+    for rec, day in zip(daily, days):
+        rows = [r for r in records if _local(r).date() == day.date()]
+        running = sum(1 for r in rows if r["state"] == "production")
+        assert rec["samples"] == len(rows)
+        assert rec["battery_min"] == 0.0
+        assert rec["battery_max"] == 92.0
+        assert rec["battery"] == pytest.approx(sum(r["battery"] for r in rows) / len(rows), abs=1e-3)
+        assert rec["state_share"] == {"production": round(running / len(rows), 4),
+                                      "stop": round(1 - running / len(rows), 4)}
+
+    # Once per local day: a second pass on the same day changes nothing.
+    before = [list(solar.telemetry_rollups[res][0]) for res in ("1h", "1d")]
+    solar._apply_telemetry_retention(now)
+    assert [solar.telemetry_rollups[res][0] for res in ("1h", "1d")] == before
+
+
+def test_daily_series_starts_with_the_whole_first_day(telemetry):
+    now, today, records = telemetry
+    solar._apply_telemetry_retention(now)
+
+    series, resolution = solar._telemetry_series_between(now - timedelta(days=5), now)
+
+    assert resolution == "1d"
+    assert [rec["ts"] for rec in series] == [(today - timedelta(days=back)).isoformat() for back in range(5, 0, -1)]
+    assert sum(rec["samples"] for rec in series) == len(records)
+
+
+def test_hourly_series_is_continuous_across_the_raw_boundary(telemetry):
+    now, today, records = telemetry
+    solar._apply_telemetry_retention(now)
+    start = now - timedelta(days=HOURLY_DAYS)
+
+    series, resolution = solar._telemetry_series_between(start, now)
+
+    first_hour = solar._rollup_bucket_start(start, "1h")
+    covered = [rec for rec in records if _local(rec) >= first_hour]
+    hours = sorted({solar._rollup_bucket_start(_local(rec), "1h") for rec in covered})
+    assert resolution == "1h"
+    assert [rec["ts"] for rec in series] == [h.isoformat() for h in hours]
+    assert sum(rec["samples"] for rec in series) == len(covered)